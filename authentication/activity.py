@@ -0,0 +1,46 @@
+# ================================
+# Última actividad de las sesiones (escritura diferida)
+# ARCHIVO: authentication/activity.py
+# ================================
+# Cada petición autenticada deja la hora en el caché de Django; la columna
+# Session.last_activity se actualiza como máximo una vez cada
+# SESSION_ACTIVITY_WRITE_INTERVAL segundos por sesión. El barrido de
+# inactividad consulta el caché antes de cerrar una sesión, así que el
+# retraso de la columna no cierra sesiones que siguen en uso (con un caché
+# compartido entre procesos; si no, el retraso máximo es ese intervalo).
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Session
+
+ACTIVITY_KEY = 'session_activity:{}'
+WRITTEN_KEY = 'session_activity_written:{}'
+
+# Las marcas del caché no necesitan sobrevivir a la sesión más larga (24 h)
+ACTIVITY_TIMEOUT = 24 * 60 * 60
+
+
+def get_write_interval():
+    return getattr(settings, 'SESSION_ACTIVITY_WRITE_INTERVAL', 300)
+
+
+def touch(session_id, now=None):
+    """Registra actividad en la sesión; escribe en la BD solo si toca"""
+    now = now or timezone.now()
+    cache.set(ACTIVITY_KEY.format(session_id), now.timestamp(), ACTIVITY_TIMEOUT)
+    # add() solo tiene éxito si la marca no existe o ya venció
+    if cache.add(WRITTEN_KEY.format(session_id), True, get_write_interval()):
+        Session.objects.filter(pk=session_id, is_active=True).update(last_activity=now)
+
+
+def cached_activity(session_ids):
+    """{id de sesión: última actividad} según el caché, para los ids que tengan"""
+    keys = {ACTIVITY_KEY.format(session_id): session_id for session_id in session_ids}
+    return {
+        keys[key]: datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        for key, value in cache.get_many(keys).items()
+    }
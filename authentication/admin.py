@@ -3,7 +3,7 @@
 # Register your models here.
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Session, Log
+from .models import User, Session, Log, OutboundEmail
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -56,4 +56,15 @@ class LogAdmin(admin.ModelAdmin):
         return False  # No permitir agregar logs manualmente
     
     def has_change_permission(self, request, obj=None):
-        return False  # No permitir editar logs
\ No newline at end of file
+        return False  # No permitir editar logs
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    """Admin para la bandeja de salida"""
+    
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'last_error')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'sent_at', 'locked_by', 'locked_until', 'last_error')
@@ -0,0 +1,328 @@
+# ================================
+# Escritura diferida de registros de auditoría (Log, DiagnosisLog)
+# ARCHIVO: authentication/audit.py
+# ================================
+# record(Modelo, **campos) arma el registro con su hora y lo encola; un hilo
+# del proceso lo guarda junto con los demás usando bulk_create, cuando se
+# juntan AUDIT_LOG_BATCH_SIZE registros o pasan AUDIT_LOG_FLUSH_INTERVAL
+# segundos. La petición ya no espera el INSERT.
+#
+# - El registro se encola al confirmar la transacción en curso, así las filas
+#   a las que apunta (usuario, diagnóstico) ya existen para el hilo.
+# - Si la base de datos falla, el lote se agrega como JSON por línea a
+#   AUDIT_LOG_FALLBACK_PATH; `python manage.py replay_audit_log` lo reinserta.
+# - Al terminar el proceso (atexit) se vacía la cola.
+# - Antes de encolarlo, cada registro se agrega al diario del proceso
+#   (<AUDIT_LOG_FALLBACK_PATH>.<pid>.pending), que se vacía cuando la cola
+#   queda sin pendientes. Si el proceso muere con registros en la cola
+#   (SIGTERM, SIGKILL, reciclaje del worker), `replay_audit_log` los recupera
+#   del diario sin duplicar los que alcanzaron a guardarse. El diario no hace
+#   fsync por registro: protege contra la muerte del proceso, no del equipo.
+#   Si el diario no se puede escribir, el registro igual se encola.
+# - Con AUDIT_LOG_ASYNC = False se guarda de inmediato, como antes.
+#
+# Solo para eventos que nadie lee en la misma petición. Los comentarios
+# clínicos y las validaciones/descartes se guardan con objects.create(): se
+# muestran en la respuesta siguiente y un error debe llegar al usuario.
+
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Marcador en la cola: escribir lo pendiente y avisar con el Event
+_FLUSH = object()
+
+
+def get_fallback_path():
+    return os.fspath(getattr(settings, 'AUDIT_LOG_FALLBACK_PATH', 'audit_fallback.jsonl'))
+
+
+def get_journal_path(pid=None):
+    return f'{get_fallback_path()}.{pid or os.getpid()}.pending'
+
+
+def _json_value(value):
+    # isoformat() conserva los microsegundos (DjangoJSONEncoder los recorta a
+    # milisegundos): la recuperación de diarios compara la hora exacta
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def serialize(instance):
+    """Registro como dict JSON: etiqueta del modelo y valores de sus campos"""
+    return {
+        'model': instance._meta.label_lower,
+        'fields': {
+            field.attname: _json_value(getattr(instance, field.attname))
+            for field in instance._meta.concrete_fields
+            if not field.primary_key
+        },
+    }
+
+
+def deserialize(data):
+    model = apps.get_model(data['model'])
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    return model(**{
+        name: fields[name].to_python(value)
+        for name, value in data['fields'].items()
+        if name in fields
+    })
+
+
+class AuditWriter:
+    """Cola de registros de auditoría con un hilo que los guarda por lotes"""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=getattr(settings, 'AUDIT_LOG_MAX_QUEUE', 10000))
+        self.batch_size = getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 100)
+        self.flush_interval = getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 1.0)
+        self._file_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # Diario de lo encolado en este proceso y cuántos registros siguen sin guardar
+        self._journal = None
+        self._journal_pid = None
+        self._pending = 0
+
+    # ---- Escritura ----
+
+    def write(self, instances):
+        """
+        Guarda los registros con un bulk_create por modelo; los que fallan van
+        al archivo de respaldo. Retorna cuántos no se pudieron guardar.
+        """
+        by_model = defaultdict(list)
+        for instance in instances:
+            by_model[type(instance)].append(instance)
+        failed = 0
+        for model, items in by_model.items():
+            try:
+                model.objects.bulk_create(items, batch_size=self.batch_size)
+            except Exception:
+                logger.exception('No se pudieron guardar %s registros de %s', len(items), model._meta.label)
+                try:
+                    self.write_fallback(items)
+                except OSError:
+                    logger.exception('Se perdieron %s registros de %s: falló el archivo de respaldo',
+                                     len(items), model._meta.label)
+                failed += len(items)
+        return failed
+
+    def write_fallback(self, instances):
+        path = get_fallback_path()
+        lines = ''.join(
+            json.dumps(serialize(instance), cls=DjangoJSONEncoder) + '\n'
+            for instance in instances
+        )
+        with self._file_lock:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    # ---- Diario ----
+
+    def _journal_append(self, instance):
+        """
+        Agrega el registro al diario. Un error de disco (lleno, sin permisos)
+        no llega a la petición: se registra y el registro sigue en la cola en
+        memoria, solo que sin la protección del diario.
+        """
+        line = json.dumps(serialize(instance), cls=DjangoJSONEncoder) + '\n'
+        with self._file_lock:
+            try:
+                if self._journal_pid != os.getpid():
+                    # Proceso nuevo (o hijo de un fork): diario propio
+                    path = get_journal_path()
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                    self._journal = open(path, 'a', encoding='utf-8')
+                    self._journal_pid = os.getpid()
+                    self._pending = 0
+                self._journal.write(line)
+                self._journal.flush()
+            except OSError:
+                logger.exception('No se pudo escribir el diario de auditoría %s', get_journal_path())
+            # Cuenta como pendiente aunque falte en el diario: así el diario no
+            # se vacía mientras queden registros anteriores sin guardar
+            self._pending += 1
+
+    def _journal_done(self, count):
+        """Descuenta registros ya guardados; sin pendientes, el diario se vacía"""
+        with self._file_lock:
+            if self._journal_pid != os.getpid():
+                return
+            self._pending = max(0, self._pending - count)
+            if not self._pending:
+                self._journal.truncate(0)
+
+    # ---- Hilo ----
+
+    def _ensure_started(self):
+        # Tras un fork (gunicorn --preload) el hilo del padre no existe en el hijo
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        """Espera el primer registro y junta más hasta llenar el lote o cumplir el plazo"""
+        batch, events = [], []
+        item = self.queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if isinstance(item, tuple) and item[0] is _FLUSH:
+                events.append(item[1])
+                break
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        return batch, events
+
+    def _run(self):
+        while True:
+            batch, events = self._next_batch()
+            try:
+                if batch and self.write(batch):
+                    # La conexión puede quedar en mal estado: se abre otra en el siguiente lote
+                    connection.close()
+                # Guardados o en el archivo de respaldo: ya no dependen del diario
+                self._journal_done(len(batch))
+            except Exception:
+                logger.exception('Error en el escritor de auditoría')
+            finally:
+                for event in events:
+                    event.set()
+
+    # ---- API ----
+
+    def enqueue(self, instance):
+        self._ensure_started()
+        self._journal_append(instance)
+        try:
+            self.queue.put_nowait(instance)
+        except queue.Full:
+            # Cola llena: se escribe en la petición antes que perder el registro
+            self.write([instance])
+            self._journal_done(1)
+
+    def flush(self, timeout=5.0):
+        """Espera a que se guarde todo lo encolado hasta ahora"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        event = threading.Event()
+        self.queue.put((_FLUSH, event))
+        event.wait(timeout)
+
+    def close(self):
+        """Al salir: guarda lo pendiente y borra el diario si ya no hace falta"""
+        self.flush()
+        with self._file_lock:
+            if self._journal_pid != os.getpid():
+                return
+            self._journal.close()
+            self._journal_pid = None
+            if not self._pending and os.path.exists(self._journal.name):
+                os.remove(self._journal.name)
+
+
+writer = AuditWriter()
+atexit.register(writer.close)
+
+
+# ================================
+# RECUPERACIÓN DE DIARIOS
+# ================================
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _already_saved(instance):
+    """El registro ya está en la base (se guardó antes de que el proceso muriera)"""
+    model = type(instance)
+    lookup = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.get_internal_type() != 'JSONField'
+    }
+    return model.objects.filter(**lookup).exists()
+
+
+def orphan_journals():
+    """Diarios de procesos que ya no existen"""
+    journals = []
+    for path in glob.glob(glob.escape(get_fallback_path()) + '.*.pending'):
+        try:
+            pid = int(path.rsplit('.', 2)[-2])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _process_alive(pid):
+            journals.append(path)
+    return journals
+
+
+def recover_journals():
+    """
+    Guarda los registros que quedaron en diarios de procesos terminados.
+    Retorna (recuperados, ya guardados, sin poder guardar).
+    """
+    recovered = skipped = failed = 0
+    for path in orphan_journals():
+        replaying = f'{path}.replaying'
+        os.replace(path, replaying)
+        with open(replaying, encoding='utf-8') as f:
+            instances = [deserialize(json.loads(line)) for line in f if line.strip()]
+        missing = [instance for instance in instances if not _already_saved(instance)]
+        errors = writer.write(missing)
+        recovered += len(missing) - errors
+        skipped += len(instances) - len(missing)
+        failed += errors
+        os.remove(replaying)
+    return recovered, skipped, failed
+
+
+def record(model, **fields):
+    """
+    Registra un evento de auditoría del modelo indicado (Log, DiagnosisLog).
+    Retorna la instancia con su hora ya asignada; el pk solo existe después
+    de escribirla.
+    """
+    fields.setdefault('timestamp', timezone.now())
+    instance = model(**fields)
+    if getattr(settings, 'AUDIT_LOG_ASYNC', True):
+        transaction.on_commit(lambda: writer.enqueue(instance))
+    else:
+        # Escritura inmediata dentro de la transacción en curso
+        instance.save()
+    return instance
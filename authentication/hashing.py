@@ -0,0 +1,109 @@
+# ================================
+# Hash y verificación de contraseñas en un pool acotado
+# ARCHIVO: authentication/hashing.py
+# ================================
+# Argon2 consume bastante CPU y memoria por intento. En vez de que cada
+# petición lo calcule por su cuenta, los cálculos pasan por un pool de
+# PASSWORD_HASHING_WORKERS hilos (argon2-cffi libera el GIL mientras calcula)
+# con a lo sumo PASSWORD_HASHING_MAX_PENDING cálculos esperando turno. Con el
+# pool lleno se rechaza de inmediato con HashingPoolBusy, que se responde
+# como 503 con Retry-After: en una ola de inicios de sesión los workers del
+# servidor no se quedan encolados esperando CPU.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+def get_hashing_setting(name, default):
+    return getattr(settings, f'PASSWORD_HASHING_{name}', default)
+
+
+class HashingPoolBusy(Exception):
+    """No hay cupo en el pool de hash; reintentar después de `retry_after` segundos"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Servicio ocupado, intente de nuevo en {retry_after} segundos')
+        self.retry_after = retry_after
+
+
+class HashingPool:
+    """ThreadPoolExecutor con un límite de cálculos en curso más en espera"""
+
+    def __init__(self, workers=None, max_pending=None, wait=None, retry_after=None):
+        self.workers = workers or get_hashing_setting('WORKERS', None) or os.cpu_count() or 2
+        if max_pending is None:
+            max_pending = get_hashing_setting('MAX_PENDING', None)
+        self.max_pending = self.workers * 4 if max_pending is None else max_pending
+        self.wait = get_hashing_setting('QUEUE_WAIT', 0.05) if wait is None else wait
+        self.retry_after = retry_after or get_hashing_setting('RETRY_AFTER', 2)
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+        self._lock = threading.Lock()
+        # Contadores del proceso
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def run(self, fn, *args):
+        """Ejecuta fn(*args) en el pool y espera el resultado"""
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self.rejected += 1
+            raise HashingPoolBusy(self.retry_after)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool()
+    return _pool
+
+
+def make_password(raw_password):
+    return get_pool().run(hashers.make_password, raw_password)
+
+
+def set_password(user, raw_password):
+    """Como user.set_password, con el hash calculado en el pool"""
+    user.password = make_password(raw_password)
+    user._password = raw_password
+
+
+def check_password(user, raw_password):
+    """
+    Como user.check_password. La verificación corre en el pool; si el hash
+    usa parámetros antiguos se recalcula (también en el pool) y se guarda.
+    """
+    needs_upgrade = []
+    valid = get_pool().run(hashers.check_password, raw_password, user.password, needs_upgrade.append)
+    if valid and needs_upgrade:
+        set_password(user, raw_password)
+        user._password = None
+        user.save(update_fields=['password'])
+    return valid
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+
+from authentication.hashing import HashingPool, HashingPoolBusy
+
+
+class Command(BaseCommand):
+    help = 'Mide verificaciones de contraseña por segundo según el tamaño del pool de hash'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', default='1,2,4,8',
+            help='Tamaños de pool a probar, separados por coma',
+        )
+        parser.add_argument('--logins', type=int, default=200, help='Verificaciones por tamaño de pool')
+        parser.add_argument('--clients', type=int, default=32, help='Peticiones concurrentes simuladas')
+        parser.add_argument(
+            '--max-pending', type=int, default=None,
+            help='Límite de espera del pool (por defecto 4 por hilo)',
+        )
+
+    def handle(self, *args, **options):
+        password = 'Contraseña-de-prueba-123'
+        encoded = hashers.make_password(password)
+        self.stdout.write(f'Hasher: {hashers.identify_hasher(encoded).algorithm}')
+        self.stdout.write(f'{"hilos":>6} {"logins/s":>10} {"p95 ms":>8} {"rechazos":>9}')
+
+        for workers in [int(value) for value in options['workers'].split(',')]:
+            pool = HashingPool(workers=workers, max_pending=options['max_pending'], wait=0.05)
+            remaining = [options['logins']]
+            lock = threading.Lock()
+            latencies = []
+
+            def client():
+                while True:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    started = time.perf_counter()
+                    try:
+                        pool.run(hashers.check_password, password, encoded)
+                    except HashingPoolBusy:
+                        # Un cliente real reintentaría tras Retry-After
+                        time.sleep(0.01)
+                        with lock:
+                            remaining[0] += 1
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=client) for _ in range(options['clients'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            pool.shutdown()
+
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0
+            self.stdout.write(
+                f'{workers:>6} {len(latencies) / elapsed:>10.1f} {p95:>8.0f} {pool.rejected:>9}'
+            )
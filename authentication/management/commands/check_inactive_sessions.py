@@ -4,8 +4,14 @@ from authentication.tasks import InactivityMonitor
 class Command(BaseCommand):
     help = 'Verifica y cierra sesiones inactivas'
     
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=InactivityMonitor.CHUNK_SIZE,
+            help='Sesiones por transacción'
+        )
+    
     def handle(self, *args, **options):
-        count = InactivityMonitor.check_inactive_sessions()
+        count = InactivityMonitor.check_inactive_sessions(options['chunk_size'])
         self.stdout.write(
             self.style.SUCCESS(
                 f'Se cerraron {count} sesiones inactivas'
@@ -0,0 +1,44 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from authentication.audit import deserialize, get_fallback_path, recover_journals, writer
+
+
+class Command(BaseCommand):
+    help = (
+        'Reinserta los registros de auditoría guardados en el archivo de respaldo '
+        'y los que quedaron en diarios de procesos terminados'
+    )
+
+    def handle(self, *args, **options):
+        recovered, skipped, failed = recover_journals()
+        if recovered or skipped or failed:
+            self.stdout.write(self.style.SUCCESS(
+                f'Diarios de procesos terminados: {recovered} registros recuperados, '
+                f'{skipped} ya estaban guardados'
+            ))
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'{failed} registros de los diarios siguen sin poder guardarse (quedaron en {get_fallback_path()})'
+            ))
+
+        path = get_fallback_path()
+        if not os.path.exists(path):
+            self.stdout.write('No hay registros pendientes')
+            return
+
+        # Se renombra primero: los fallos nuevos van a un archivo nuevo
+        replaying = f'{path}.replaying'
+        os.replace(path, replaying)
+        with open(replaying, encoding='utf-8') as f:
+            instances = [deserialize(json.loads(line)) for line in f if line.strip()]
+
+        failed = writer.write(instances)
+        os.remove(replaying)
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'{failed} registros siguen sin poder guardarse (quedaron en {path})'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Se reinsertaron {len(instances) - failed} registros'))
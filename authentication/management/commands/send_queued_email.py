@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from authentication.outbox import OutboxSender, get_outbox_setting
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos de la bandeja de salida por lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=get_outbox_setting('BATCH_SIZE', 50),
+            help='Correos por conexión',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Revisar la bandeja cada N segundos (0 = vaciarla una vez, para cron)',
+        )
+
+    def handle(self, *args, **options):
+        sender = OutboxSender(batch_size=options['batch_size'])
+        if options['interval']:
+            self.stdout.write(f'Enviando correos como {sender.sender_id} (Ctrl+C para detener)')
+            try:
+                sender.run(poll_interval=options['interval'])
+            except KeyboardInterrupt:
+                pass
+            return
+
+        processed = 0
+        while True:
+            count = sender.run_once()
+            if not count:
+                break
+            processed += count
+        self.stdout.write(self.style.SUCCESS(f'Se procesaron {processed} correos'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from authentication.tasks import InactivityMonitor
+
+
+class Command(BaseCommand):
+    help = 'Cierra sesiones inactivas y elimina tokens de restablecimiento vencidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=InactivityMonitor.CHUNK_SIZE,
+            help='Filas por transacción',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Repetir cada N segundos (0 = una sola pasada, para cron)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            result = InactivityMonitor.sweep(options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Se cerraron {result["sessions_closed"]} sesiones inactivas y se '
+                f'eliminaron {result["tokens_deleted"]} tokens vencidos'
+            ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -1,20 +1,70 @@
+from django.conf import settings
+from django.http import HttpResponse
 from django.utils.deprecation import MiddlewareMixin
+from django.utils import timezone
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth import logout
 from .models import Session, Log
+from . import activity, audit, network
+from .hashing import HashingPoolBusy
+
+# Clave en request.session con la sesión activa y su expiración:
+# {'id': id de Session o None, 'expires_at': timestamp, 'checked_at': timestamp}
+SESSION_EXPIRY_KEY = 'active_session_expiry'
+
+
+def remember_session_expiry(request, session):
+    """Guarda en la sesión de Django la expiración de `session` (o None)"""
+    request.session[SESSION_EXPIRY_KEY] = {
+        'id': session.pk if session else None,
+        'expires_at': session.expires_at.timestamp() if session else None,
+        'checked_at': timezone.now().timestamp(),
+    }
+
 
 class SessionExpirationMiddleware(MiddlewareMixin):
-    """Middleware para manejar expiración de sesiones - Flujo A2"""
+    """
+    Middleware para manejar expiración de sesiones - Flujo A2
+    
+    La expiración de la sesión activa se guarda en la sesión de Django y solo
+    se consulta la tabla Session si no está guardada, si pasaron
+    SESSION_EXPIRY_CHECK_TTL segundos desde la última consulta (para notar
+    sesiones cerradas desde otro lugar) o si falta menos de
+    SESSION_EXPIRY_NEAR_SECONDS para expirar. La decisión de expirar siempre
+    se toma con la fila recién leída.
+    """
+    
+    def get_active_session(self, request):
+        """Sesión activa del usuario, leyendo la BD solo cuando hace falta"""
+        cached = request.session.get(SESSION_EXPIRY_KEY)
+        now = timezone.now().timestamp()
+        if cached:
+            ttl = getattr(settings, 'SESSION_EXPIRY_CHECK_TTL', 60)
+            near = getattr(settings, 'SESSION_EXPIRY_NEAR_SECONDS', 60)
+            fresh = now - cached['checked_at'] < ttl
+            expires_at = cached['expires_at']
+            if fresh and (expires_at is None or now < expires_at - near):
+                # La sesión sigue vigente: no hace falta la fila
+                return None
+        
+        session = Session.objects.filter(
+            user=request.user,
+            is_active=True
+        ).first()
+        remember_session_expiry(request, session)
+        return session
     
     def process_request(self, request):
         if request.user.is_authenticated:
             # Verificar si existe una sesión activa
             try:
-                session = Session.objects.filter(
-                    user=request.user,
-                    is_active=True
-                ).first()
+                session = self.get_active_session(request)
+                
+                # Última actividad: caché en cada petición, BD cada tanto
+                cached = request.session.get(SESSION_EXPIRY_KEY) or {}
+                if cached.get('id') and (session is None or not session.is_expired()):
+                    activity.touch(cached['id'])
                 
                 if session:
                     # Verificar si la sesión ha expirado
@@ -24,7 +74,8 @@ class SessionExpirationMiddleware(MiddlewareMixin):
                         session.save()
                         
                         # Registrar expiración
-                        Log.objects.create(
+                        audit.record(
+                            Log,
                             user=request.user,
                             accion='LOGOUT',
                             nivel='INFO',
@@ -47,9 +98,15 @@ class SessionExpirationMiddleware(MiddlewareMixin):
     
     def get_client_ip(self, request):
         """Obtiene la IP del cliente"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return network.get_client_ip(request)
+
+
+class PasswordHashingBusyMiddleware(MiddlewareMixin):
+    """Responde 503 con Retry-After cuando el pool de hash de contraseñas está lleno"""
+    
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashingPoolBusy):
+            response = HttpResponse(str(exception), status=503, content_type='text/plain; charset=utf-8')
+            response['Retry-After'] = str(exception.retry_after)
+            return response
+        return None
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_log_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['is_active', 'login_time'], name='authenticat_is_acti_c28a50_idx'),
+        ),
+    ]
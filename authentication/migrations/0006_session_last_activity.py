@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_login_time(apps, schema_editor):
+    # Sin datos de actividad previos, la última conocida es el inicio de sesión
+    Session = apps.get_model('authentication', 'Session')
+    Session.objects.update(last_activity=models.F('login_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_session_sweep_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='session',
+            name='authenticat_is_acti_c28a50_idx',
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Última actividad'),
+        ),
+        migrations.RunPython(copy_login_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['is_active', 'last_activity'], name='authenticat_is_acti_6f5d6f_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_session_last_activity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='log',
+            name='accion',
+            field=models.CharField(choices=[('LOGIN_SUCCESS', 'Login exitoso'), ('LOGIN_FAILED', 'Login fallido'), ('LOGIN_THROTTLED', 'Login bloqueado por exceso de intentos'), ('LOGOUT', 'Cierre de sesión'), ('PASSWORD_CHANGE', 'Cambio de contraseña'), ('PASSWORD_RESET', 'Recuperación de contraseña'), ('USER_CREATED', 'Usuario creado'), ('USER_UPDATED', 'Usuario actualizado'), ('USER_DELETED', 'Usuario eliminado')], max_length=50, verbose_name='Acción'),
+        ),
+    ]
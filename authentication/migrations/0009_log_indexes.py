@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0008_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['-timestamp', '-id'], name='authenticat_timesta_a1ba04_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['accion', '-timestamp', '-id'], name='authenticat_accion_6712d1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='authenticat_user_id_6b202a_idx'),
+        ),
+    ]
@@ -81,11 +81,17 @@ class Session(models.Model):
     user_agent = models.TextField('User Agent', blank=True)
     is_active = models.BooleanField('Activa', default=True)
     expires_at = models.DateTimeField('Expira en')
+    # Se actualiza con retraso (authentication/activity.py)
+    last_activity = models.DateTimeField('Última actividad', default=timezone.now)
     
     class Meta:
         verbose_name = 'Sesión'
         verbose_name_plural = 'Sesiones'
         ordering = ['-login_time']
+        indexes = [
+            # Barrido de sesiones inactivas (authentication/tasks.py)
+            models.Index(fields=['is_active', 'last_activity']),
+        ]
     
     def __str__(self):
         return f"Sesión de {self.user.email} - {self.login_time}"
@@ -108,6 +114,7 @@ class Log(models.Model):
     ACCIONES = (
         ('LOGIN_SUCCESS', 'Login exitoso'),
         ('LOGIN_FAILED', 'Login fallido'),
+        ('LOGIN_THROTTLED', 'Login bloqueado por exceso de intentos'),
         ('LOGOUT', 'Cierre de sesión'),
         ('PASSWORD_CHANGE', 'Cambio de contraseña'),
         ('PASSWORD_RESET', 'Recuperación de contraseña'),
@@ -121,13 +128,20 @@ class Log(models.Model):
     nivel = models.CharField('Nivel', max_length=10, choices=NIVELES, default='INFO')
     descripcion = models.TextField('Descripción')
     ip_address = models.GenericIPAddressField('Dirección IP', null=True, blank=True)
-    timestamp = models.DateTimeField('Fecha y hora', auto_now_add=True)
+    # Hora del evento, asignada al registrarlo (la escritura puede ser posterior)
+    timestamp = models.DateTimeField('Fecha y hora', default=timezone.now)
     datos_adicionales = models.JSONField('Datos adicionales', blank=True, null=True)
     
     class Meta:
         verbose_name = 'Log'
         verbose_name_plural = 'Logs'
         ordering = ['-timestamp']
+        # El monitoreo pagina por (timestamp, id) sin filtro, por acción o por usuario
+        indexes = [
+            models.Index(fields=['-timestamp', '-id']),
+            models.Index(fields=['accion', '-timestamp', '-id']),
+            models.Index(fields=['user', '-timestamp', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.get_accion_display()} - {self.timestamp}"
@@ -217,6 +231,47 @@ class PasswordResetToken(models.Model):
         cls.objects.filter(created_at__lt=expired_time).delete()
 
 
+class OutboundEmail(models.Model):
+    """
+    Correo pendiente de envío (bandeja de salida).
+    La petición solo inserta la fila; `python manage.py send_queued_email`
+    los envía por lotes (authentication/outbox.py).
+    """
+    
+    STATUS_CHOICES = (
+        ('PENDING', 'Pendiente'),
+        ('SENDING', 'Enviando'),
+        ('SENT', 'Enviado'),
+        ('FAILED', 'Fallido'),
+    )
+    
+    subject = models.CharField('Asunto', max_length=255)
+    body = models.TextField('Texto', blank=True)
+    html_body = models.TextField('HTML', blank=True)
+    from_email = models.CharField('Remitente', max_length=255)
+    to = models.JSONField('Destinatarios', default=list)
+    status = models.CharField('Estado', max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField('Intentos', default=0)
+    next_attempt_at = models.DateTimeField('Próximo intento', default=timezone.now)
+    # Envío en curso: quién tomó el correo y hasta cuándo
+    locked_by = models.CharField('Tomado por', max_length=100, blank=True)
+    locked_until = models.DateTimeField('Bloqueado hasta', null=True, blank=True)
+    last_error = models.TextField('Último error', blank=True)
+    created_at = models.DateTimeField('Fecha de creación', auto_now_add=True)
+    sent_at = models.DateTimeField('Fecha de envío', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Correo saliente'
+        verbose_name_plural = 'Correos salientes'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)} ({self.get_status_display()})"
+
+
 # ================================
 # MIGRACIÓN: Ejecutar después de crear el modelo
 # ================================
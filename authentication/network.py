@@ -0,0 +1,32 @@
+# ================================
+# IP del cliente detrás de proxies de confianza
+# ARCHIVO: authentication/network.py
+# ================================
+# X-Forwarded-For lo puede enviar cualquier cliente: solo se lee cuando la
+# conexión viene de un proxy listado en TRUSTED_PROXIES. En ese caso se
+# recorre de derecha a izquierda (cada proxy agrega la IP de quien le habló)
+# y se toma la primera dirección que no es un proxy de confianza. Sin proxies
+# configurados se usa REMOTE_ADDR.
+
+from django.conf import settings
+
+
+def get_trusted_proxies():
+    return set(getattr(settings, 'TRUSTED_PROXIES', ()))
+
+
+def get_client_ip(request):
+    """IP del cliente, sin confiar en encabezados de conexiones directas"""
+    remote_addr = request.META.get('REMOTE_ADDR')
+    trusted = get_trusted_proxies()
+    if remote_addr not in trusted:
+        return remote_addr
+    forwarded = [
+        ip.strip()
+        for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+        if ip.strip()
+    ]
+    for ip in reversed(forwarded):
+        if ip not in trusted:
+            return ip
+    return forwarded[0] if forwarded else remote_addr
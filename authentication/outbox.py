@@ -0,0 +1,176 @@
+# ================================
+# Bandeja de salida de correos
+# ARCHIVO: authentication/outbox.py
+# ================================
+# queue_email() inserta un OutboundEmail y retorna; la petición no espera al
+# servidor SMTP. OutboxSender toma los correos pendientes por lotes, los
+# envía por una sola conexión del backend de correo y reprograma los que
+# fallan con espera exponencial.
+#
+# Varios enviadores pueden correr a la vez: cada uno toma sus correos con un
+# UPDATE condicional (locked_by/locked_until), como la cola de diagnósticos.
+
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def get_outbox_setting(name, default):
+    return getattr(settings, f'EMAIL_OUTBOX_{name}', default)
+
+
+def queue_email(subject, body, to, html_body='', from_email=None):
+    """Agrega un correo a la bandeja de salida"""
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+
+def backoff(attempts):
+    """Espera antes del siguiente intento: base * 2^(intentos-1), con tope"""
+    base = get_outbox_setting('RETRY_BASE_SECONDS', 30)
+    maximum = get_outbox_setting('RETRY_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(maximum, base * 2 ** max(0, attempts - 1)))
+
+
+class OutboxSender:
+    """Envía la bandeja de salida por lotes reutilizando la conexión"""
+
+    def __init__(self, sender_id=None, batch_size=None, max_attempts=None, lock_seconds=None):
+        self.sender_id = sender_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.batch_size = batch_size or get_outbox_setting('BATCH_SIZE', 50)
+        self.max_attempts = max_attempts or get_outbox_setting('MAX_ATTEMPTS', 5)
+        self.lock_seconds = lock_seconds or get_outbox_setting('LOCK_SECONDS', 300)
+
+    def claim(self):
+        """Toma hasta batch_size correos listos para enviar"""
+        now = timezone.now()
+        ready = (
+            Q(status='PENDING', next_attempt_at__lte=now)
+            # Tomados por un enviador que murió a mitad del lote
+            | Q(status='SENDING', locked_until__lt=now)
+        )
+        candidate_ids = list(
+            OutboundEmail.objects.filter(ready)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:self.batch_size]
+        )
+        if not candidate_ids:
+            return []
+        OutboundEmail.objects.filter(ready, id__in=candidate_ids).update(
+            status='SENDING',
+            locked_by=self.sender_id,
+            locked_until=now + timedelta(seconds=self.lock_seconds),
+        )
+        return list(
+            OutboundEmail.objects.filter(id__in=candidate_ids, status='SENDING', locked_by=self.sender_id)
+            .order_by('next_attempt_at', 'id')
+        )
+
+    def build_message(self, email, connection):
+        message = EmailMultiAlternatives(
+            subject=email.subject,
+            body=email.body,
+            from_email=email.from_email,
+            to=email.to,
+            connection=connection,
+        )
+        if email.html_body:
+            message.attach_alternative(email.html_body, 'text/html')
+        return message
+
+    def send_batch(self, emails):
+        """Envía los correos por una conexión. Retorna (enviados, fallidos)"""
+        sent, failed = [], []
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as error:
+            logger.warning('No se pudo abrir la conexión de correo: %s', error)
+            failed = [(email, error) for email in emails]
+        else:
+            try:
+                for email in emails:
+                    try:
+                        self.build_message(email, connection).send()
+                        sent.append(email)
+                    except Exception as error:
+                        failed.append((email, error))
+            finally:
+                connection.close()
+
+        self.mark_sent(sent)
+        self.mark_failed(failed)
+        return len(sent), len(failed)
+
+    def mark_sent(self, emails):
+        if not emails:
+            return
+        # El contenido se borra al enviarse: puede traer contraseñas temporales o enlaces
+        OutboundEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            status='SENT',
+            sent_at=timezone.now(),
+            attempts=F('attempts') + 1,
+            body='',
+            html_body='',
+            locked_by='',
+            locked_until=None,
+            last_error='',
+        )
+
+    def mark_failed(self, failures):
+        if not failures:
+            return
+        now = timezone.now()
+        for email, error in failures:
+            email.attempts += 1
+            email.last_error = str(error)[:1000]
+            email.locked_by = ''
+            email.locked_until = None
+            if email.attempts >= self.max_attempts:
+                email.status = 'FAILED'
+                logger.error('Correo %s descartado tras %s intentos: %s', email.id, email.attempts, error)
+            else:
+                email.status = 'PENDING'
+                email.next_attempt_at = now + backoff(email.attempts)
+        OutboundEmail.objects.bulk_update(
+            [email for email, _ in failures],
+            ['attempts', 'last_error', 'locked_by', 'locked_until', 'status', 'next_attempt_at'],
+        )
+
+    def run_once(self):
+        """Envía un lote. Retorna cuántos correos se procesaron."""
+        emails = self.claim()
+        if emails:
+            sent, failed = self.send_batch(emails)
+            logger.info('Bandeja de salida: %s enviados, %s con error', sent, failed)
+        return len(emails)
+
+    def run(self, stop_event=None, poll_interval=None):
+        """Bucle principal: envía mientras haya correos y espera si no hay"""
+        poll_interval = poll_interval or get_outbox_setting('POLL_INTERVAL', 5.0)
+        while stop_event is None or not stop_event.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                logger.exception('Error en el envío de la bandeja de salida')
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
@@ -3,45 +3,144 @@
 # ARCHIVO: authentication/tasks.py (NUEVO)
 # ================================
 
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
-from .models import Session, Log
+from . import activity
+from .models import Session, Log, PasswordResetToken
+
+class _ConcurrentSweep(Exception):
+    """Otro barrido cerró sesiones del bloque en curso"""
+
 
 class InactivityMonitor:
     """Monitor de inactividad - Flujo Alternativo A3"""
     
+    # Filas por transacción: acota los bloqueos y la memoria en cada pasada
+    CHUNK_SIZE = 1000
+    
     @staticmethod
-    def check_inactive_sessions():
+    def get_inactivity():
+        """Tiempo de inactividad permitido"""
+        return timedelta(seconds=getattr(settings, 'SESSION_INACTIVITY_TIMEOUT', 30 * 60))
+    
+    @staticmethod
+    def check_inactive_sessions(chunk_size=None, now=None):
         """
         Verifica y cierra sesiones inactivas
         Esta función debe ejecutarse periódicamente (cada 5-10 minutos)
         usando Celery, cron, o similar en producción
+        
+        La inactividad se mide con Session.last_activity (y el caché de
+        authentication/activity.py), no con la hora de inicio de sesión.
+        Por cada bloque de sesiones: un UPDATE para invalidarlas y un INSERT
+        masivo para sus logs, en la misma transacción. Barridos simultáneos no
+        cierran ni registran dos veces la misma sesión. Retorna cuántas
+        sesiones se cerraron.
         """
+        chunk_size = chunk_size or InactivityMonitor.CHUNK_SIZE
+        now = now or timezone.now()
+        inactivity = InactivityMonitor.get_inactivity()
+        inactivity_threshold = now - inactivity
+        descripcion = f'Sesión cerrada por inactividad ({int(inactivity.total_seconds() // 60)} minutos)'
         
-        # Tiempo de inactividad permitido (30 minutos)
-        inactivity_threshold = timezone.now() - timedelta(minutes=30)
+        closed = 0
+        last_id = 0
+        while True:
+            try:
+                with transaction.atomic():
+                    # Sesiones activas pero inactivas, recorridas por id
+                    candidates = list(
+                        Session.objects.select_for_update().filter(
+                            is_active=True,
+                            last_activity__lt=inactivity_threshold,
+                            id__gt=last_id,
+                        ).order_by('id').values_list('id', 'user_id', 'login_time')[:chunk_size]
+                    )
+                    if not candidates:
+                        break
+                    
+                    # last_activity puede ir atrasada: el caché tiene la actividad
+                    # más reciente. Esas sesiones siguen en uso y se pone al día la columna
+                    recent = {
+                        session_id: seen
+                        for session_id, seen in activity.cached_activity(
+                            [session_id for session_id, _, _ in candidates]
+                        ).items()
+                        if seen >= inactivity_threshold
+                    }
+                    if recent:
+                        Session.objects.bulk_update(
+                            [Session(id=session_id, last_activity=seen) for session_id, seen in recent.items()],
+                            ['last_activity'],
+                        )
+                    sessions = [session for session in candidates if session[0] not in recent]
+                    
+                    # Invalidar sesiones. Solo cambian las que siguen activas: si
+                    # otro barrido cerró alguna del bloque, el bloque se deshace y
+                    # se vuelve a leer, así cada cierre se registra una sola vez
+                    updated = Session.objects.filter(
+                        id__in=[session_id for session_id, _, _ in sessions],
+                        is_active=True,
+                    ).update(is_active=False)
+                    if updated != len(sessions):
+                        raise _ConcurrentSweep
+                    
+                    # Registrar cierre automático
+                    Log.objects.bulk_create([
+                        Log(
+                            user_id=user_id,
+                            accion='LOGOUT',
+                            nivel='INFO',
+                            descripcion=descripcion,
+                            timestamp=now,
+                            datos_adicionales={
+                                'login_time': str(login_time),
+                                'auto_closed': True
+                            }
+                        )
+                        for _, user_id, login_time in sessions
+                    ])
+            except _ConcurrentSweep:
+                continue
+            
+            closed += updated
+            last_id = candidates[-1][0]
+            if len(candidates) < chunk_size:
+                break
         
-        # Buscar sesiones activas pero inactivas
-        inactive_sessions = Session.objects.filter(
-            is_active=True,
-            login_time__lt=inactivity_threshold
-        )
+        return closed
+    
+    @staticmethod
+    def purge_expired_reset_tokens(chunk_size=None, now=None):
+        """
+        Elimina los tokens de restablecimiento vencidos, un DELETE por bloque.
+        Retorna cuántos se eliminaron.
+        """
+        chunk_size = chunk_size or InactivityMonitor.CHUNK_SIZE
+        now = now or timezone.now()
         
-        for session in inactive_sessions:
-            # Invalidar sesión
-            session.is_active = False
-            session.save()
-            
-            # Registrar cierre automático
-            Log.objects.create(
-                user=session.user,
-                accion='LOGOUT',
-                nivel='INFO',
-                descripcion='Sesión cerrada por inactividad (30 minutos)',
-                datos_adicionales={
-                    'login_time': str(session.login_time),
-                    'auto_closed': True
-                }
+        deleted = 0
+        while True:
+            token_ids = list(
+                PasswordResetToken.objects.filter(expires_at__lt=now)
+                .order_by('id').values_list('id', flat=True)[:chunk_size]
             )
+            if not token_ids:
+                break
+            count, _ = PasswordResetToken.objects.filter(id__in=token_ids).delete()
+            deleted += count
+            if len(token_ids) < chunk_size:
+                break
         
-        return inactive_sessions.count()
+        return deleted
+    
+    @classmethod
+    def sweep(cls, chunk_size=None):
+        """Barrido completo: sesiones inactivas y tokens vencidos"""
+        now = timezone.now()
+        return {
+            'sessions_closed': cls.check_inactive_sessions(chunk_size, now),
+            'tokens_deleted': cls.purge_expired_reset_tokens(chunk_size, now),
+        }
@@ -1,3 +1,377 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import activity, audit, hashing, outbox, throttle
+from .models import Log, OutboundEmail, PasswordResetToken, Session, User
+from .tasks import InactivityMonitor
+
+
+def create_doctor(**fields):
+    """Médico radiólogo de prueba; `fields` reemplaza los valores por defecto"""
+    return User.objects.create_user(**{
+        'email': 'doc@example.com',
+        'password': 'testpassword',
+        'first_name': 'Doctor',
+        'last_name': 'Tester',
+        'identificacion': 'DOC123',
+        'rol': 'MEDICO_RADIOLOGO',
+        **fields,
+    })
+
+
+class SessionExpirationMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = create_doctor()
+        self.client.force_login(self.user)
+        self.url = reverse('users:user_dashboard')
+        cache.clear()
+
+    def create_session(self, expires_in):
+        return Session.objects.create(
+            user=self.user,
+            token=f'token-{expires_in}',
+            expires_at=timezone.now() + expires_in,
+        )
+
+    def session_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        queries = [q['sql'] for q in context.captured_queries if 'authentication_session' in q['sql']]
+        return response, queries
+
+    def test_session_lookup_is_cached(self):
+        self.create_session(timedelta(hours=8))
+        _, first = self.session_queries()
+        response, second = self.session_queries()
+        # Lectura de la sesión y primera escritura de last_activity
+        self.assertEqual([sql.split()[0] for sql in first], ['SELECT', 'UPDATE'])
+        self.assertEqual(second, [])
+        self.assertEqual(response.status_code, 200)
+
+    def test_activity_is_cached_between_writes(self):
+        session = self.create_session(timedelta(hours=8))
+        Session.objects.filter(pk=session.pk).update(last_activity=timezone.now() - timedelta(hours=1))
+        self.session_queries()
+        self.session_queries()
+        session.refresh_from_db()
+        self.assertGreater(session.last_activity, timezone.now() - timedelta(minutes=1))
+        self.assertIn(session.pk, activity.cached_activity([session.pk]))
+
+    def test_near_expiry_reads_the_database(self):
+        self.create_session(timedelta(seconds=30))
+        self.session_queries()
+        _, queries = self.session_queries()
+        self.assertEqual(len(queries), 1)
+
+    def test_expired_session_logs_out_after_revalidation(self):
+        session = self.create_session(timedelta(hours=8))
+        self.session_queries()
+        Session.objects.filter(pk=session.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        with override_settings(SESSION_EXPIRY_CHECK_TTL=0):
+            response = self.client.get(self.url)
+        self.assertRedirects(response, reverse('authentication:login'), fetch_redirect_response=False)
+        session.refresh_from_db()
+        self.assertFalse(session.is_active)
+
+
+class SessionSweepTests(TestCase):
+    def setUp(self):
+        self.user = create_doctor()
+        cache.clear()
+
+    def test_closes_inactive_sessions_in_chunks(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(user=self.user, token=f'old-{i}', expires_at=now + timedelta(hours=8))
+        Session.objects.update(last_activity=now - timedelta(hours=1))
+        fresh = Session.objects.create(user=self.user, token='fresh', expires_at=now + timedelta(hours=8))
+
+        self.assertEqual(InactivityMonitor.check_inactive_sessions(chunk_size=2), 5)
+        self.assertEqual(list(Session.objects.filter(is_active=True)), [fresh])
+        self.assertEqual(Log.objects.filter(accion='LOGOUT', user=self.user).count(), 5)
+        self.assertEqual(InactivityMonitor.check_inactive_sessions(chunk_size=2), 0)
+
+    def test_chunk_is_reread_when_a_concurrent_sweep_closes_part_of_it(self):
+        now = timezone.now()
+        for i in range(3):
+            Session.objects.create(user=self.user, token=f'old-{i}', expires_at=now + timedelta(hours=8))
+        Session.objects.update(last_activity=now - timedelta(hours=1))
+        first = Session.objects.order_by('id').first()
+        cached_activity = activity.cached_activity
+        calls = []
+
+        def other_sweep(session_ids):
+            # Otro barrido cierra una sesión entre la lectura y el UPDATE
+            if not calls:
+                Session.objects.filter(id=first.id).update(is_active=False)
+            calls.append(session_ids)
+            return cached_activity(session_ids)
+
+        with mock.patch.object(activity, 'cached_activity', side_effect=other_sweep):
+            closed = InactivityMonitor.check_inactive_sessions()
+        # El bloque se deshizo (incluido el cierre simulado, que estaba en la
+        # misma transacción) y se volvió a leer: un Log por sesión cerrada
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(closed, 3)
+        self.assertEqual(Log.objects.filter(accion='LOGOUT').count(), 3)
+
+    def test_recent_activity_in_cache_keeps_session_open(self):
+        now = timezone.now()
+        session = Session.objects.create(user=self.user, token='busy', expires_at=now + timedelta(hours=8))
+        Session.objects.update(login_time=now - timedelta(hours=2), last_activity=now - timedelta(hours=1))
+        # La columna va atrasada, pero la sesión se usó hace un momento
+        activity.touch(session.pk, now - timedelta(minutes=1))
+        Session.objects.update(last_activity=now - timedelta(hours=1))
+
+        self.assertEqual(InactivityMonitor.check_inactive_sessions(), 0)
+        session.refresh_from_db()
+        self.assertTrue(session.is_active)
+        self.assertEqual(session.last_activity, now - timedelta(minutes=1))
+
+    def test_purges_expired_reset_tokens(self):
+        now = timezone.now()
+        for i in range(3):
+            PasswordResetToken.objects.create(user=self.user, token=f'expired-{i}', expires_at=now - timedelta(minutes=1))
+        valid = PasswordResetToken.objects.create(user=self.user, token='valid', expires_at=now + timedelta(minutes=15))
+
+        self.assertEqual(InactivityMonitor.purge_expired_reset_tokens(chunk_size=2), 3)
+        self.assertEqual(list(PasswordResetToken.objects.all()), [valid])
+
+
+class PasswordHashingPoolTests(TestCase):
+    def test_saturated_pool_rejects_immediately(self):
+        pool = hashing.HashingPool(workers=1, max_pending=0, wait=0, retry_after=3)
+        self.addCleanup(pool.shutdown)
+        release = threading.Event()
+        busy = threading.Thread(target=pool.run, args=(release.wait,))
+        busy.start()
+        while not pool.in_flight:
+            pass
+
+        with self.assertRaises(hashing.HashingPoolBusy) as context:
+            pool.run(lambda: True)
+        self.assertEqual(context.exception.retry_after, 3)
+
+        release.set()
+        busy.join()
+        self.assertTrue(pool.run(lambda: True))
+        self.assertEqual(pool.rejected, 1)
+
+    def test_login_returns_503_with_retry_after_when_busy(self):
+        create_doctor()
+        with mock.patch.object(hashing, 'check_password', side_effect=hashing.HashingPoolBusy(2)):
+            response = self.client.post(
+                reverse('authentication:login'),
+                {'email': 'doc@example.com', 'password': 'testpassword'},
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+
+    def test_login_verifies_password_in_pool(self):
+        user = create_doctor()
+        self.assertTrue(hashing.check_password(user, 'testpassword'))
+        self.assertFalse(hashing.check_password(user, 'incorrecta'))
+
+
+@override_settings(
+    LOGIN_THROTTLE_RATES={'ip': (100, 1.0), 'email': (2, 1 / 3600)},
+    AUDIT_LOG_ASYNC=False,
+)
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        throttle.get_cache().clear()
+        throttle.blocked_attempts.clear()
+
+    def attempt(self, email='nadie@example.com', **extra):
+        return self.client.post(
+            reverse('authentication:login'),
+            {'email': email, 'password': 'incorrecta'},
+            **extra,
+        )
+
+    def test_over_limit_attempts_are_rejected_and_logged_once(self):
+        self.assertEqual(self.attempt().status_code, 200)
+        self.assertEqual(self.attempt().status_code, 200)
+
+        for _ in range(3):
+            with CaptureQueriesContext(connection) as context:
+                response = self.attempt()
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response['Retry-After']), 0)
+            # Rechazado antes de buscar al usuario, y sin escribir un Log
+            self.assertFalse(any(
+                'authentication_user' in q['sql'] or 'authentication_log' in q['sql']
+                for q in context.captured_queries
+            ))
+
+        self.assertEqual(Log.objects.filter(accion='LOGIN_FAILED').count(), 2)
+        self.assertFalse(Log.objects.filter(accion='LOGIN_THROTTLED').exists())
+        # El Log agregado se escribe cuando se cierra la ventana
+        self.assertEqual(throttle.blocked_attempts.flush(time.time() + 3600), 1)
+        blocked = Log.objects.get(accion='LOGIN_THROTTLED')
+        self.assertEqual(blocked.datos_adicionales['tipo'], 'email')
+        self.assertEqual(blocked.datos_adicionales['bloqueados'], 3)
+
+    @override_settings(LOGIN_THROTTLE_RATES={'ip': (2, 1 / 3600), 'email': (100, 1.0)})
+    def test_forwarded_for_is_ignored_unless_sent_by_a_trusted_proxy(self):
+        for n in range(2):
+            self.attempt(f'otro{n}@example.com', HTTP_X_FORWARDED_FOR=f'10.0.0.{n}')
+        # Cambiar el encabezado no da un balde nuevo
+        response = self.attempt('otro9@example.com', HTTP_X_FORWARDED_FOR='10.0.0.9')
+        self.assertEqual(response.status_code, 429)
+        throttle.blocked_attempts.flush(force=True)
+        self.assertEqual(Log.objects.get(accion='LOGIN_THROTTLED').ip_address, '127.0.0.1')
+
+        with self.settings(TRUSTED_PROXIES=['127.0.0.1']):
+            response = self.attempt('otro9@example.com', HTTP_X_FORWARDED_FOR='203.0.113.5, 10.0.0.9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Log.objects.filter(accion='LOGIN_FAILED').latest('id').ip_address, '10.0.0.9')
+
+
+class CountingBackend(LocmemBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class FailingBackend(LocmemBackend):
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP no disponible')
+
+
+class OutboxTests(TestCase):
+    def queue(self, count):
+        for i in range(count):
+            outbox.queue_email(f'Asunto {i}', 'Texto', [f'dest{i}@example.com'], html_body='<p>Texto</p>')
+
+    @override_settings(EMAIL_BACKEND='authentication.tests.CountingBackend')
+    def test_batch_is_sent_over_one_connection(self):
+        CountingBackend.opened = 0
+        self.queue(3)
+
+        self.assertEqual(outbox.OutboxSender(batch_size=10).run_once(), 3)
+
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Texto</p>', 'text/html')])
+        self.assertEqual(OutboundEmail.objects.filter(status='SENT', body='', attempts=1).count(), 3)
+        self.assertEqual(outbox.OutboxSender().run_once(), 0)
+
+    @override_settings(EMAIL_BACKEND='authentication.tests.FailingBackend', EMAIL_OUTBOX_RETRY_BASE_SECONDS=30)
+    def test_failures_back_off_and_give_up(self):
+        self.queue(1)
+        sender = outbox.OutboxSender(max_attempts=2)
+
+        with self.assertLogs('authentication.outbox', 'INFO'):
+            sender.run_once()
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('PENDING', 1))
+        self.assertIn('SMTP no disponible', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        # Aún no toca reintentar
+        self.assertEqual(sender.run_once(), 0)
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('authentication.outbox', 'ERROR'):
+            sender.run_once()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('FAILED', 2))
+
+    def test_password_recovery_queues_instead_of_sending(self):
+        User.objects.create_user(email='medico@example.com', password='x', first_name='Ana', last_name='Ruiz')
+
+        self.client.post(reverse('authentication:password_recovery'), {'email': 'medico@example.com'})
+
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.to, ['medico@example.com'])
+        self.assertIn('/authentication/password-reset/', queued.body)
+
+
+class AuditWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.user = create_doctor()
+
+    def test_records_are_written_in_background(self):
+        entries = [
+            audit.record(Log, user=self.user, accion='LOGIN_SUCCESS', descripcion=f'Evento {i}')
+            for i in range(3)
+        ]
+        audit.writer.flush()
+        saved = Log.objects.filter(user=self.user).order_by('timestamp')
+        self.assertEqual([log.descripcion for log in saved], ['Evento 0', 'Evento 1', 'Evento 2'])
+        # La hora es la del evento, no la de la escritura
+        self.assertEqual(saved[0].timestamp, entries[0].timestamp)
+
+    def test_queued_records_survive_a_killed_process(self):
+        path = os.path.join(tempfile.mkdtemp(), 'audit.jsonl')
+        saved = Log.objects.create(user=self.user, accion='LOGIN_SUCCESS', descripcion='Guardado',
+                                   timestamp=timezone.now())
+        lost = Log(user=self.user, accion='LOGOUT', descripcion='En la cola', timestamp=timezone.now())
+        with override_settings(AUDIT_LOG_FALLBACK_PATH=path):
+            # Diario de un proceso que murió antes de vaciarlo
+            dead_pid = 2 ** 22 + 1
+            with open(audit.get_journal_path(dead_pid), 'w', encoding='utf-8') as f:
+                for entry in (saved, lost):
+                    f.write(json.dumps(audit.serialize(entry), cls=DjangoJSONEncoder) + '\n')
+
+            call_command('replay_audit_log', stdout=open(os.devnull, 'w'))
+            self.assertEqual(audit.orphan_journals(), [])
+        self.assertEqual(
+            sorted(Log.objects.values_list('descripcion', flat=True)), ['En la cola', 'Guardado'],
+        )
+
+    def test_journal_is_emptied_once_records_are_saved(self):
+        audit.record(Log, user=self.user, accion='LOGIN_SUCCESS', descripcion='Evento')
+        with open(audit.get_journal_path(), encoding='utf-8') as f:
+            self.assertIn('Evento', f.read())
+        audit.writer.flush()
+        self.assertEqual(os.path.getsize(audit.get_journal_path()), 0)
+
+    def test_journal_errors_do_not_fail_the_request(self):
+        # El directorio del diario es un archivo: open() falla con OSError
+        path = os.path.join(tempfile.NamedTemporaryFile(delete=False).name, 'audit.jsonl')
+        writer = audit.AuditWriter()
+        with override_settings(AUDIT_LOG_FALLBACK_PATH=path), \
+                mock.patch.object(audit, 'writer', writer), \
+                self.assertLogs('authentication.audit', 'ERROR'):
+            response = self.client.post(reverse('authentication:login'), {
+                'email': 'doc@example.com', 'password': 'testpassword',
+            })
+            writer.flush()
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Log.objects.filter(user=self.user, accion='LOGIN_SUCCESS').exists())
+
+    def test_failed_writes_go_to_fallback_file_and_replay(self):
+        path = os.path.join(tempfile.mkdtemp(), 'audit.jsonl')
+        entry = Log(user=self.user, accion='LOGOUT', descripcion='Sin base de datos', datos_adicionales={'a': 1})
+        with override_settings(AUDIT_LOG_FALLBACK_PATH=path):
+            with mock.patch.object(Log.objects, 'bulk_create', side_effect=DatabaseError), \
+                    self.assertLogs('authentication.audit', 'ERROR'):
+                self.assertEqual(audit.writer.write([entry]), 1)
+            self.assertTrue(os.path.exists(path))
+            self.assertFalse(Log.objects.exists())
+
+            call_command('replay_audit_log', stdout=open(os.devnull, 'w'))
+        log = Log.objects.get()
+        self.assertEqual((log.user, log.descripcion, log.datos_adicionales), (self.user, 'Sin base de datos', {'a': 1}))
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,211 @@
+# ================================
+# Límite de intentos de login por IP y por correo (token bucket)
+# ARCHIVO: authentication/throttle.py
+# ================================
+# Cada IP y cada correo tienen un balde de intentos en el caché
+# LOGIN_THROTTLE_CACHE: se recarga a ritmo constante y cada intento fallido
+# gasta una ficha. Sin fichas, el intento se rechaza antes de buscar al
+# usuario y de calcular Argon2. En vez de un Log por intento rechazado hay
+# uno por clave y ventana de LOGIN_THROTTLE_LOG_WINDOW segundos: los rechazos
+# se cuentan en la memoria del proceso (BlockedAttempts, sin consultas) y el
+# Log con el total se escribe cuando la ventana se cierra, en el siguiente
+# intento de login o al terminar el proceso. Con varios procesos cada uno
+# escribe su Log de la ventana; el total es la suma.
+#
+# Para que el límite valga entre procesos el caché debe ser compartido
+# (el alias 'shared' de CACHES, Redis o Memcached; la tabla de 'shared' la
+# crea `migrate`); la lectura y escritura del balde no es atómica, así que
+# con mucha concurrencia pueden pasar unos pocos intentos de más. La IP sale
+# de authentication/network.py, que solo acepta X-Forwarded-For de proxies
+# de confianza.
+
+import atexit
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Log
+
+# (capacidad, fichas por segundo)
+DEFAULT_RATES = {
+    'ip': (20, 10 / 60),
+    'email': (5, 1 / 60),
+}
+
+
+def get_cache():
+    return caches[getattr(settings, 'LOGIN_THROTTLE_CACHE', 'default')]
+
+
+def get_rates():
+    return {**DEFAULT_RATES, **getattr(settings, 'LOGIN_THROTTLE_RATES', {})}
+
+
+def get_log_window():
+    return getattr(settings, 'LOGIN_THROTTLE_LOG_WINDOW', 300)
+
+
+def is_enabled():
+    return getattr(settings, 'LOGIN_THROTTLE_ENABLED', True)
+
+
+class TokenBucket:
+    """Balde guardado en el caché como (fichas, hora de la última actualización)"""
+
+    def __init__(self, cache, key, capacity, refill_rate):
+        self.cache = cache
+        self.key = key
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+
+    def tokens(self, now):
+        state = self.cache.get(self.key)
+        if state is None:
+            return self.capacity
+        tokens, updated = state
+        return min(self.capacity, tokens + (now - updated) * self.refill_rate)
+
+    def consume(self, now, amount=1):
+        tokens = max(0.0, self.tokens(now) - amount)
+        # El balde expira cuando ya estaría lleno otra vez
+        timeout = math.ceil((self.capacity - tokens) / self.refill_rate) + 1
+        self.cache.set(self.key, (tokens, now), timeout)
+
+    def retry_after(self, now):
+        """Segundos hasta tener una ficha (0 si ya la hay)"""
+        missing = 1 - self.tokens(now)
+        return max(0, math.ceil(missing / self.refill_rate))
+
+    def reset(self):
+        self.cache.delete(self.key)
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+
+
+class LoginThrottle:
+    """Baldes de un intento de login: uno por IP y uno por correo"""
+
+    def __init__(self, ip_address, email):
+        self.cache = get_cache()
+        rates = get_rates()
+        self.keys = {}
+        self.buckets = {}
+        for kind, value in (('ip', ip_address), ('email', (email or '').strip().lower())):
+            if not value:
+                continue
+            capacity, refill_rate = rates[kind]
+            self.keys[kind] = value
+            self.buckets[kind] = TokenBucket(
+                self.cache, f'login_throttle:{kind}:{_digest(value)}', capacity, refill_rate,
+            )
+
+    def check(self):
+        """
+        Retorna 0 si el intento puede seguir, o los segundos a esperar.
+        Los rechazos se registran agregados por ventana.
+        """
+        if not is_enabled():
+            return 0
+        now = time.time()
+        blocked_attempts.flush(now)
+        retry_after = 0
+        for kind, bucket in self.buckets.items():
+            wait = bucket.retry_after(now)
+            if wait:
+                self.record_block(kind, now, wait)
+                retry_after = max(retry_after, wait)
+        return retry_after
+
+    def failure(self):
+        """Un intento fallido gasta una ficha de cada balde"""
+        if not is_enabled():
+            return
+        now = time.time()
+        for bucket in self.buckets.values():
+            bucket.consume(now)
+
+    def success(self):
+        """Un login correcto libera el balde del correo (no el de la IP)"""
+        if 'email' in self.buckets:
+            self.buckets['email'].reset()
+
+    def record_block(self, kind, now, retry_after):
+        blocked_attempts.add(kind, self.keys[kind], self.keys.get('ip'), now, retry_after)
+
+
+class BlockedAttempts:
+    """
+    Rechazos del proceso por (tipo, valor, ventana). Contar no consulta la
+    base de datos: cada ventana cerrada se escribe como un solo Log.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind, value, ip_address, now, retry_after):
+        window = get_log_window()
+        index = int(now // window)
+        with self._lock:
+            details = self._pending.get((kind, value, index))
+            if details is None:
+                details = self._pending[(kind, value, index)] = {
+                    'tipo': kind,
+                    'valor': value,
+                    'ip_address': ip_address,
+                    'ventana_segundos': window,
+                    'ventana_inicio': datetime.fromtimestamp(index * window, tz=dt_timezone.utc).isoformat(),
+                    'bloqueados': 0,
+                }
+            details['bloqueados'] += 1
+            details['reintentar_en'] = retry_after
+
+    def flush(self, now=None, force=False):
+        """Escribe un Log por cada ventana cerrada (todas si `force`)"""
+        if not self._pending:
+            return 0
+        now = time.time() if now is None else now
+        window = get_log_window()
+        with self._lock:
+            closed = [key for key in self._pending if force or key[2] < int(now // window)]
+            entries = [self._pending.pop(key) for key in closed]
+        for details in entries:
+            details = dict(details)
+            ip_address = details.pop('ip_address')
+            label = 'IP' if details['tipo'] == 'ip' else 'correo'
+            Log.objects.create(
+                accion='LOGIN_THROTTLED',
+                nivel='WARNING',
+                descripcion=(
+                    f"{details['bloqueados']} intentos de login bloqueados por límite "
+                    f"para {label} {details['valor']}"
+                ),
+                ip_address=ip_address,
+                datos_adicionales=details,
+            )
+        return len(entries)
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+
+blocked_attempts = BlockedAttempts()
+
+
+def _flush_at_exit():
+    try:
+        blocked_attempts.flush(force=True)
+    except Exception:
+        # Sin base de datos al salir: se pierde solo el conteo de la ventana abierta
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -6,22 +6,18 @@ from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.utils import timezone
 from datetime import timedelta
-from django.core.mail import send_mail
 from django.conf import settings
-from django.contrib.auth.hashers import make_password
 import secrets
 
 from .forms import LoginForm, PasswordRecoveryForm, PasswordResetForm
 from .models import User, Session, Log, PasswordResetToken
+from . import audit, hashing, network, outbox
+from .throttle import LoginThrottle
+from .middleware import remember_session_expiry
 
 def get_client_ip(request):
     """Obtiene la IP del cliente"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    return network.get_client_ip(request)
 
 
 class LoginView(View):
@@ -52,6 +48,17 @@ class LoginView(View):
         password = form.cleaned_data['password']
         remember_me = form.cleaned_data.get('remember_me', False)
 
+        # Límite de intentos por IP y por correo, antes de tocar la BD o Argon2
+        throttle = LoginThrottle(get_client_ip(request), email)
+        retry_after = throttle.check()
+        if retry_after:
+            messages.error(
+                request,
+                'Demasiados intentos de inicio de sesión. Inténtalo de nuevo más tarde.')
+            response = render(request, self.template_name, {'form': form}, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+
         # Paso 10: Buscar usuario por email
         try:
             user = User.objects.get(email=email)
@@ -63,8 +70,18 @@ class LoginView(View):
                 'Usuario o contraseña incorrectos. Inténtelo nuevamente.')
             return render(request, self.template_name, {'form': form})
 
-        # Paso 12: Verificar contraseña
-        if not user.check_password(password):
+        # Paso 12: Verificar contraseña (en el pool de hash; 503 si está saturado)
+        try:
+            password_ok = hashing.check_password(user, password)
+        except hashing.HashingPoolBusy as busy:
+            messages.warning(
+                request,
+                'Hay muchos inicios de sesión en este momento. Inténtalo de nuevo en unos segundos.')
+            response = render(request, self.template_name, {'form': form}, status=503)
+            response['Retry-After'] = str(busy.retry_after)
+            return response
+
+        if not password_ok:
             # Flujo Alternativo A1: Contraseña incorrecta
             self.log_failed_attempt(request, email, 'Contraseña incorrecta')
             messages.error(
@@ -79,6 +96,8 @@ class LoginView(View):
                 'Tu cuenta ha sido desactivada. Contacta al administrador.')
             return render(request, self.template_name, {'form': form})
 
+        throttle.success()
+
         # Paso 13-14: Crear sesión y generar token
         token = secrets.token_urlsafe(32)
         expires_at = timezone.now() + timedelta(hours=24 if remember_me else 8)
@@ -96,7 +115,8 @@ class LoginView(View):
         user.save(update_fields=['ultimo_acceso'])
 
         # Paso 18: Registrar login exitoso en logs
-        Log.objects.create(
+        audit.record(
+            Log,
             user=user,
             accion='LOGIN_SUCCESS',
             nivel='INFO',
@@ -105,6 +125,7 @@ class LoginView(View):
 
         # Autenticar usuario en Django
         django_login(request, user)
+        remember_session_expiry(request, session)
 
         # Configurar duración de sesión
         if not remember_me:
@@ -137,8 +158,10 @@ class LoginView(View):
         return reverse('users:dashboard')
 
     def log_failed_attempt(self, request, email, razon):
-        """Registra un intento fallido de login"""
-        Log.objects.create(
+        """Registra un intento fallido de login y gasta una ficha del límite"""
+        LoginThrottle(get_client_ip(request), email).failure()
+        audit.record(
+            Log,
             accion='LOGIN_FAILED',
             nivel='WARNING',
             descripcion=f'Intento fallido de login para {email}: {razon}',
@@ -177,7 +200,8 @@ class LogoutView(LoginRequiredMixin, View):
                 session.save()
             
             # Paso 11: Registrar cierre de sesión en logs
-            Log.objects.create(
+            audit.record(
+                Log,
                 user=user,
                 accion='LOGOUT',
                 nivel='INFO',
@@ -187,7 +211,8 @@ class LogoutView(LoginRequiredMixin, View):
             
         except Exception as e:
             # Si hay error, registrarlo pero continuar con el logout
-            Log.objects.create(
+            audit.record(
+                Log,
                 user=user,
                 accion='LOGOUT',
                 nivel='ERROR',
@@ -257,7 +282,7 @@ def password_recovery_view(request):
                     f'/authentication/password-reset/{token}/'
                 )
                 
-                # Enviar correo con el enlace
+                # Encolar correo con el enlace
                 try:
                     send_password_reset_email(user.email, user.get_full_name(), reset_link)
                     
@@ -333,7 +358,7 @@ def password_reset_view(request, token):
                 })
             
             # Actualizar la contraseña
-            user.password = make_password(new_password)
+            hashing.set_password(user, new_password)
             user.save()
             
             # Invalidar el token
@@ -363,7 +388,7 @@ def password_reset_view(request, token):
 
 def send_password_reset_email(recipient_email, recipient_name, reset_link):
     """
-    Función auxiliar para enviar el correo de recuperación de contraseña
+    Función auxiliar para encolar el correo de recuperación de contraseña
     """
     subject = 'Recuperación de Contraseña - Diagnóstico IA'
     
@@ -460,13 +485,13 @@ def send_password_reset_email(recipient_email, recipient_name, reset_link):
     </html>
     """
     
-    send_mail(
+    # Se encola: el envío SMTP lo hace send_queued_email fuera de la petición
+    outbox.queue_email(
         subject=subject,
-        message=message,
+        body=message,
+        to=[recipient_email],
+        html_body=html_message,
         from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[recipient_email],
-        html_message=html_message,
-        fail_silently=False,
     )
 
 
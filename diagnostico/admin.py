@@ -6,7 +6,7 @@ Configuración del panel de administración Django
 """
 
 from django.contrib import admin
-from .models import AIDiagnosis, DiagnosisLog
+from .models import AIDiagnosis, DiagnosisLog, InferenceResultCache
 
 
 @admin.register(AIDiagnosis)
@@ -43,7 +43,11 @@ class AIDiagnosisAdmin(admin.ModelAdmin):
         'updated_at',
         'completed_at',
         'processing_time',
-        'model_version'
+        'stage_timings',
+        'model_version',
+        'lease_owner',
+        'lease_expires_at',
+        'attempts'
     ]
     
     fieldsets = (
@@ -62,7 +66,8 @@ class AIDiagnosisAdmin(admin.ModelAdmin):
             'fields': (
                 'heatmap_data',
                 'model_version',
-                'processing_time'
+                'processing_time',
+                'stage_timings'
             ),
             'classes': ('collapse',)
         }),
@@ -79,7 +84,10 @@ class AIDiagnosisAdmin(admin.ModelAdmin):
                 'created_at',
                 'updated_at',
                 'completed_at',
-                'error_message'
+                'error_message',
+                'lease_owner',
+                'lease_expires_at',
+                'attempts'
             ),
             'classes': ('collapse',)
         }),
@@ -136,3 +144,39 @@ class DiagnosisLogAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         """Solo superusuarios pueden eliminar logs"""
         return request.user.is_superuser
+
+
+@admin.register(InferenceResultCache)
+class InferenceResultCacheAdmin(admin.ModelAdmin):
+    """Administración del caché de resultados de inferencia"""
+    
+    list_display = [
+        'file_hash',
+        'model_version',
+        'preprocessing_key',
+        'hit_count',
+        'last_hit_at'
+    ]
+    
+    list_filter = [
+        'model_version'
+    ]
+    
+    search_fields = [
+        'file_hash'
+    ]
+    
+    readonly_fields = [
+        'file_hash',
+        'model_version',
+        'preprocessing_key',
+        'probabilities',
+        'labels',
+        'hit_count',
+        'created_at',
+        'last_hit_at'
+    ]
+    
+    def has_add_permission(self, request):
+        """Las entradas se generan al procesar diagnósticos"""
+        return False
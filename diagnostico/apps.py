@@ -1,7 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class DiagnosticoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'diagnostico'
     verbose_name = 'Diagnósticos IA'
+
+    def ready(self):
+        from . import rollups
+        from .models import AIDiagnosis
+
+        pre_save.connect(rollups.diagnosis_pre_save, sender=AIDiagnosis)
+        post_save.connect(rollups.diagnosis_saved, sender=AIDiagnosis)
+        post_delete.connect(rollups.diagnosis_deleted, sender=AIDiagnosis)
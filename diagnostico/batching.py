@@ -0,0 +1,232 @@
+# ================================
+# Micro-batching de imágenes entre diagnósticos
+# ARCHIVO: diagnostico/batching.py
+# ================================
+# El worker reclama varios diagnósticos, junta sus imágenes en un tensor de
+# tamaño fijo (DIAGNOSIS_BATCH_SIZE), ejecuta una sola pasada del modelo y
+# reparte las probabilidades a cada diagnóstico.
+#
+# DIAGNOSIS_BATCH_MAX_WAIT controla cuánto espera el worker a que lleguen más
+# imágenes antes de ejecutar un lote incompleto: más espera = más imágenes por
+# segundo, menos espera = menor latencia por diagnóstico.
+#
+# Las imágenes que ya están en el caché de resultados (mismo file_hash,
+# modelo y preprocesamiento) no pasan por el modelo, y las que se repiten
+# dentro del lote se calculan una sola vez.
+
+import logging
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from medical_images.preprocessing import get_preprocessor
+from .inference import (
+    DEFAULT_INPUT_SIZE,
+    StageTimer,
+    build_result,
+    get_model_config,
+    load_image_array,
+    model_cache,
+)
+from .result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+class BatchItem:
+    """Un diagnóstico dentro del lote, con sus imágenes y tiempos"""
+
+    def __init__(self, diagnosis, images):
+        self.diagnosis = diagnosis
+        self.images = images
+        self.timer = StageTimer()
+        self.outputs = []
+        self.error = None
+        self.result = None
+
+
+class MicroBatcher:
+    """Agrupa diagnósticos reclamados y los procesa en lotes de tamaño fijo"""
+
+    def __init__(self, queue, worker_id, batch_size=None, max_wait=None,
+                 lease_seconds=None, cache=None, result_cache=None):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.batch_size = batch_size or getattr(settings, 'DIAGNOSIS_BATCH_SIZE', 8)
+        self.max_wait = getattr(settings, 'DIAGNOSIS_BATCH_MAX_WAIT', 0.5) if max_wait is None else max_wait
+        self.lease_seconds = lease_seconds
+        self.cache = cache or model_cache
+        self.result_cache = result_cache or ResultCache()
+
+    def collect(self):
+        """
+        Reclama diagnósticos hasta juntar `batch_size` imágenes o hasta que
+        venza el plazo de espera desde el primer trabajo reclamado.
+        """
+        diagnoses = []
+        image_count = 0
+        deadline = None
+
+        while image_count < self.batch_size:
+            claimed = self.queue.claim(
+                self.worker_id,
+                limit=max(1, self.batch_size - image_count),
+                lease_seconds=self.lease_seconds,
+            )
+            for diagnosis in claimed:
+                diagnoses.append(diagnosis)
+                image_count += sum(1 for image in diagnosis.images.all() if image.is_active)
+
+            if not diagnoses:
+                return []
+            if deadline is None:
+                deadline = time.monotonic() + self.max_wait
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not claimed:
+                time.sleep(min(remaining, 0.05))
+
+        return diagnoses
+
+    def run(self, diagnoses):
+        """Ejecuta la inferencia por lotes y guarda el resultado de cada diagnóstico"""
+        by_model = defaultdict(list)
+        for diagnosis in diagnoses:
+            model_version = diagnosis.model_version or settings.DIAGNOSIS_DEFAULT_MODEL_VERSION
+            by_model[model_version].append(diagnosis)
+
+        for model_version, group in by_model.items():
+            items = self.run_group(model_version, group)
+            for item in items:
+                if item.error is not None:
+                    self.queue.fail(item.diagnosis, self.worker_id, item.error)
+                else:
+                    self.queue.complete(item.diagnosis, self.worker_id, item.result)
+
+    def run_group(self, model_version, diagnoses):
+        """Procesa diagnósticos de una misma versión de modelo"""
+        items = [
+            BatchItem(diagnosis, [image for image in diagnosis.images.all() if image.is_active])
+            for diagnosis in diagnoses
+        ]
+        for item in items:
+            if not item.images:
+                item.error = ValueError('El diagnóstico no tiene imágenes asociadas.')
+
+        try:
+            config = get_model_config(model_version)
+        except Exception as e:
+            for item in items:
+                item.error = e
+            return items
+        input_size = tuple(config.get('INPUT_SIZE', DEFAULT_INPUT_SIZE))
+        threshold = config.get('THRESHOLD', 0.5)
+        simulated = config.get('BACKEND', 'stub') == 'stub'
+        preprocessing_key = get_preprocessor(input_size).config_key()
+
+        # Resultados ya calculados para el mismo archivo, modelo y preprocesamiento
+        started = time.perf_counter()
+        cached = self.result_cache.get_many(
+            [image.file_hash for item in items if item.error is None for image in item.images],
+            model_version,
+            preprocessing_key,
+        )
+        cache_time = time.perf_counter() - started
+        labels = next(iter(cached.values()))[1] if cached else None
+
+        # Imágenes por calcular agrupadas por file_hash: el mismo archivo en
+        # varios diagnósticos (o repetido en uno) pasa una sola vez por el modelo
+        pending = defaultdict(list)
+        for item in items:
+            item.timer.timings['cache'] = cache_time
+            if item.error is not None:
+                continue
+            for image in item.images:
+                if image.file_hash in cached:
+                    item.outputs.append(np.asarray(cached[image.file_hash][0], dtype=np.float32))
+                else:
+                    pending[image.file_hash].append((item, image))
+
+        if pending:
+            waiting = {id(item): item for group in pending.values() for item, _ in group}.values()
+            try:
+                started = time.perf_counter()
+                backend = self.cache.get(model_version)
+                model_time = time.perf_counter() - started
+            except Exception as e:
+                logger.exception('No se pudo cargar el modelo %s', model_version)
+                for item in waiting:
+                    item.error = e
+            else:
+                labels = backend.labels
+                for item in waiting:
+                    item.timer.timings['model'] = model_time
+                computed = self.predict(backend, list(pending.values()))
+                self.result_cache.set_many(computed, model_version, preprocessing_key, labels)
+
+        for item in items:
+            if item.error is not None:
+                continue
+            with item.timer.stage('postprocess'):
+                item.result = build_result(np.stack(item.outputs), labels, threshold, simulated)
+            item.result.update({
+                'model_version': model_version,
+                'processing_time': round(item.timer.total, 6),
+                'stage_timings': item.timer.as_dict(),
+            })
+        return items
+
+    def predict(self, backend, pending):
+        """
+        Ejecuta el modelo en lotes de tamaño fijo. `pending` es una lista de
+        grupos [(item, imagen), ...] con el mismo file_hash: cada grupo ocupa
+        un solo lugar del lote y sus probabilidades se agregan a todos sus
+        items. Retorna {file_hash: probabilidades}.
+        """
+        tensor = np.zeros((self.batch_size,) + backend.input_size, dtype=np.float32)
+        computed = {}
+
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            tensor[:] = 0.0
+            slots = []
+            for group in chunk:
+                group = [(item, image) for item, image in group if item.error is None]
+                if not group:
+                    continue
+                item, image = group[0]
+                try:
+                    with item.timer.stage('preprocess'):
+                        load_image_array(image, backend.input_size, out=tensor[len(slots)])
+                except Exception as e:
+                    for item, _ in group:
+                        item.error = e
+                    continue
+                slots.append(group)
+
+            if not slots:
+                continue
+
+            try:
+                started = time.perf_counter()
+                probabilities = backend.predict(tensor)
+                elapsed = time.perf_counter() - started
+            except Exception as e:
+                logger.exception('Error en la inferencia por lotes (%s)', backend.model_version)
+                for group in slots:
+                    for item, _ in group:
+                        item.error = e
+                continue
+
+            # Cada diagnóstico paga la parte de la pasada que usó
+            share = elapsed / len(slots)
+            for row, group in enumerate(slots):
+                for item, image in group:
+                    item.timer.timings['inference'] = item.timer.timings.get('inference', 0.0) + share / len(group)
+                    item.outputs.append(probabilities[row])
+                computed[image.file_hash] = probabilities[row]
+        return computed
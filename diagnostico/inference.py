@@ -0,0 +1,283 @@
+# ================================
+# Motor de inferencia IA (CPU)
+# ARCHIVO: diagnostico/inference.py
+# ================================
+# Cada versión de modelo (AIDiagnosis.model_version) se configura en
+# settings.DIAGNOSIS_MODELS con un backend. Los modelos se cargan una sola vez
+# por proceso worker y quedan residentes en un caché LRU.
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from medical_images.preprocessing import get_preprocessor
+
+
+DEFAULT_LABELS = [
+    'Normal',
+    'Opacidad pulmonar',
+    'Fractura',
+    'Cardiomegalia',
+    'Derrame pleural',
+]
+
+DEFAULT_INPUT_SIZE = (224, 224)
+
+
+class InferenceBackend:
+    """
+    Interfaz común de los backends de inferencia.
+
+    `predict` recibe un lote float32 de forma (N, H, W) con valores en [0, 1]
+    y retorna probabilidades de forma (N, len(labels)).
+    """
+
+    def __init__(self, model_version, config):
+        self.model_version = model_version
+        self.config = config
+        self.labels = list(config.get('LABELS', DEFAULT_LABELS))
+        self.input_size = tuple(config.get('INPUT_SIZE', DEFAULT_INPUT_SIZE))
+        self.threshold = config.get('THRESHOLD', 0.5)
+
+    def load(self):
+        """Carga los pesos del modelo en memoria"""
+        raise NotImplementedError
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+
+class StubBackend(InferenceBackend):
+    """
+    Backend determinista sin pesos, para desarrollo y pruebas.
+    La misma imagen produce siempre las mismas probabilidades.
+    """
+
+    def load(self):
+        n_labels = len(self.labels)
+        rng = np.random.default_rng(self.config.get('SEED', 0))
+        self._projection = rng.standard_normal((4, n_labels)).astype(np.float32)
+
+    def predict(self, batch):
+        # Estadísticos simples de cada imagen como "características"
+        features = np.stack([
+            batch.mean(axis=(1, 2)),
+            batch.std(axis=(1, 2)),
+            batch[:, : batch.shape[1] // 2].mean(axis=(1, 2)),
+            batch[:, :, : batch.shape[2] // 2].mean(axis=(1, 2)),
+        ], axis=1)
+        logits = features @ self._projection
+        return _sigmoid(logits)
+
+
+class NumpyBackend(InferenceBackend):
+    """
+    Clasificador lineal sobre la imagen reducida por average pooling.
+    Los pesos se leen de un archivo .npz con las claves W, b (y opcionalmente labels).
+    """
+
+    def load(self):
+        path = Path(self.config['PATH'])
+        if not path.exists():
+            raise ImproperlyConfigured(f'No se encontró el modelo {self.model_version} en {path}')
+        with np.load(path, allow_pickle=False) as weights:
+            self._weights = weights['W'].astype(np.float32)
+            self._bias = weights['b'].astype(np.float32)
+            if 'labels' in weights:
+                self.labels = [str(label) for label in weights['labels']]
+        self.pool = self.config.get('POOL', 16)
+
+    def predict(self, batch):
+        n, h, w = batch.shape
+        p = self.pool
+        pooled = batch[:, : h - h % p, : w - w % p].reshape(n, p, h // p, p, w // p).mean(axis=(2, 4))
+        logits = pooled.reshape(n, -1) @ self._weights + self._bias
+        return _sigmoid(logits)
+
+
+class OnnxBackend(InferenceBackend):
+    """Backend ONNX Runtime restringido a CPU (requiere `onnxruntime`)"""
+
+    def load(self):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImproperlyConfigured(
+                'El backend "onnx" requiere el paquete onnxruntime (pip install onnxruntime).'
+            )
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.config.get('THREADS', 0)
+        self._session = onnxruntime.InferenceSession(
+            str(self.config['PATH']), options, providers=['CPUExecutionProvider']
+        )
+        self._input_name = self._session.get_inputs()[0].name
+
+    def predict(self, batch):
+        # Los modelos ONNX esperan el canal explícito: (N, 1, H, W)
+        outputs = self._session.run(None, {self._input_name: batch[:, None, :, :]})
+        return np.asarray(outputs[0], dtype=np.float32)
+
+
+BACKENDS = {
+    'stub': StubBackend,
+    'numpy': NumpyBackend,
+    'onnx': OnnxBackend,
+}
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def get_model_config(model_version):
+    """Configuración de una versión de modelo desde settings.DIAGNOSIS_MODELS"""
+    models = getattr(settings, 'DIAGNOSIS_MODELS', {})
+    try:
+        return models[model_version]
+    except KeyError:
+        raise ImproperlyConfigured(f'Versión de modelo no configurada: {model_version}')
+
+
+def check_model_files():
+    """
+    Verifica que exista el archivo (PATH) de cada modelo configurado.
+    Se llama al iniciar los workers: un archivo faltante detiene el arranque
+    en vez de hacer fallar cada diagnóstico de esa versión.
+    """
+    missing = [
+        f'{model_version} ({config["PATH"]})'
+        for model_version, config in getattr(settings, 'DIAGNOSIS_MODELS', {}).items()
+        if config.get('PATH') and not Path(config['PATH']).exists()
+    ]
+    if missing:
+        raise ImproperlyConfigured(
+            'No se encontraron los archivos de modelo: ' + ', '.join(missing)
+            + '. Revise DIAGNOSIS_MODELS en settings.'
+        )
+
+
+def create_backend(model_version):
+    """Instancia (sin cargar) el backend configurado para `model_version`"""
+    config = get_model_config(model_version)
+    backend = config.get('BACKEND', 'stub')
+    backend_class = BACKENDS.get(backend) or import_string(backend)
+    return backend_class(model_version, config)
+
+
+class ModelCache:
+    """
+    Caché LRU de modelos cargados, residente en el proceso.
+    Mantiene como máximo `max_models` versiones en memoria.
+    """
+
+    def __init__(self, max_models=None):
+        self.max_models = max_models or getattr(settings, 'DIAGNOSIS_MODEL_CACHE_SIZE', 2)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, model_version):
+        with self._lock:
+            backend = self._models.get(model_version)
+            if backend is not None:
+                self._models.move_to_end(model_version)
+                return backend
+
+            backend = create_backend(model_version)
+            backend.load()
+            self.loads += 1
+            self._models[model_version] = backend
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return backend
+
+    def warm(self, model_versions=None):
+        """Precarga modelos para que ninguna solicitud pague el tiempo de carga"""
+        if model_versions is None:
+            model_versions = getattr(settings, 'DIAGNOSIS_PRELOAD_MODELS', [])
+        for model_version in list(model_versions)[: self.max_models]:
+            self.get(model_version)
+
+    def __contains__(self, model_version):
+        return model_version in self._models
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+# Caché compartido por todo el proceso
+model_cache = ModelCache()
+
+
+class StageTimer:
+    """Acumula el tiempo de cada etapa del procesamiento"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    @property
+    def total(self):
+        return sum(self.timings.values())
+
+    def as_dict(self):
+        return {name: round(seconds, 6) for name, seconds in self.timings.items()}
+
+
+def load_image_array(image, size, out=None):
+    """Preprocesa el archivo de un MedicalImage como arreglo float32 (H, W) en [0, 1]"""
+    return get_preprocessor(size).process_image(image, out=out)
+
+
+SIMULATED_MARKER = '[SIMULADO]'
+
+
+def build_result(probabilities, labels, threshold, simulated=False):
+    """
+    Convierte las probabilidades por imagen (N, labels) en los campos del
+    diagnóstico. Cada hallazgo toma la probabilidad máxima entre las imágenes.
+    Con simulated=True (backend stub) el texto y las observaciones llevan la
+    marca SIMULADO para que no se confundan con un resultado clínico.
+    """
+    scores = probabilities.max(axis=0)
+    findings = [
+        (labels[i], float(scores[i]))
+        for i in np.argsort(-scores)
+        if labels[i] != 'Normal' and scores[i] >= threshold
+    ]
+
+    if findings:
+        confidence = findings[0][1]
+        diagnosis_result = 'Hallazgos sugeridos por la IA: ' + ', '.join(
+            label for label, _ in findings
+        ) + '. Se recomienda revisión por el médico radiólogo.'
+    else:
+        abnormal = [float(scores[i]) for i, label in enumerate(labels) if label != 'Normal']
+        confidence = 1.0 - max(abnormal, default=0.0)
+        diagnosis_result = 'No se observan anomalías significativas. Se recomienda seguimiento rutinario.'
+
+    observations = [f'{label}: {score * 100:.1f}%' for label, score in findings]
+    if simulated:
+        diagnosis_result = f'{SIMULATED_MARKER} {diagnosis_result} Resultado generado sin modelo entrenado.'
+        observations.insert(0, f'{SIMULATED_MARKER} Resultado de prueba, no válido para uso clínico.')
+
+    return {
+        'confidence_level': round(confidence * 100, 1),
+        'diagnosis_result': diagnosis_result,
+        'ai_observations': observations,
+    }
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from diagnostico.models import InferenceResultCache
+from diagnostico.result_cache import ResultCache
+
+
+class Command(BaseCommand):
+    help = 'Muestra la tasa de aciertos del caché de resultados de inferencia'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Vacía el caché')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = InferenceResultCache.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Se eliminaron {deleted} entradas'))
+            return
+
+        stats = ResultCache.stats()
+        self.stdout.write(f'Entradas: {stats["entries"]} (máximo {ResultCache().max_entries})')
+        self.stdout.write(f'Aciertos: {stats["hits"]}')
+        self.stdout.write(self.style.SUCCESS(f'Tasa de aciertos: {stats["hit_rate"] * 100:.1f}%'))
@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from diagnostico.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los resúmenes diarios de diagnósticos desde AIDiagnosis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, default=None, help='Primer día (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=date.fromisoformat, default=None, help='Último día (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        rows = rebuild(options['desde'], options['hasta'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Resúmenes recalculados: {rows["statuses"]} por estado, '
+            f'{rows["model_stats"]} por modelo, {rows["time_buckets"]} intervalos de tiempo'
+        ))
@@ -0,0 +1,72 @@
+import signal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnostico.inference import check_model_files
+from diagnostico.tasks import DiagnosisWorker
+from diagnostico.workers import WorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los workers que procesan la cola de diagnósticos IA'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            default=getattr(settings, 'DIAGNOSIS_QUEUE_WORKERS', 2),
+            help='Número de procesos worker',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=None,
+            help='Segundos de espera cuando la cola está vacía',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Imágenes por pasada del modelo (DIAGNOSIS_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--max-wait', type=float, default=None,
+            help='Segundos máximos esperando completar un lote (DIAGNOSIS_BATCH_MAX_WAIT)',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Procesa los trabajos pendientes en este proceso y termina',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            check_model_files()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        worker_options = {
+            'poll_interval': options['poll_interval'],
+            'batch_size': options['batch_size'],
+            'max_wait': options['max_wait'],
+        }
+
+        if options['once']:
+            worker = DiagnosisWorker(**worker_options)
+            total = 0
+            while worker.run_once():
+                total += 1
+            self.stdout.write(self.style.SUCCESS(f'Se procesaron {total} diagnósticos'))
+            return
+
+        pool = WorkerPool(options['workers'], **worker_options)
+
+        def shutdown(signum, frame):
+            pool.stop_event.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(
+            f'Iniciados {options["workers"]} workers de diagnóstico'
+        ))
+        pool.supervise()
+        pool.stop()
+        self.stdout.write(self.style.SUCCESS('Workers detenidos'))
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostico', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aidiagnosis',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Intentos de Procesamiento'),
+        ),
+        migrations.AddField(
+            model_name='aidiagnosis',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Vencimiento del Lease'),
+        ),
+        migrations.AddField(
+            model_name='aidiagnosis',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Worker Asignado'),
+        ),
+        migrations.AddIndex(
+            model_name='aidiagnosis',
+            index=models.Index(fields=['status', 'lease_expires_at'], name='diagnostico_status_db76d9_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostico', '0003_diagnosis_queue_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aidiagnosis',
+            name='stage_timings',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Tiempos por Etapa (s)'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostico', '0004_aidiagnosis_stage_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InferenceResultCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=256, verbose_name='Hash del Archivo')),
+                ('model_version', models.CharField(max_length=50, verbose_name='Versión del Modelo')),
+                ('preprocessing_key', models.CharField(max_length=32, verbose_name='Configuración de Preprocesamiento')),
+                ('probabilities', models.JSONField(default=list, verbose_name='Probabilidades')),
+                ('labels', models.JSONField(default=list, verbose_name='Etiquetas')),
+                ('hit_count', models.PositiveIntegerField(default=0, verbose_name='Aciertos')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('last_hit_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Último Uso')),
+            ],
+            options={
+                'verbose_name': 'Resultado de Inferencia en Caché',
+                'verbose_name_plural': 'Resultados de Inferencia en Caché',
+                'indexes': [models.Index(fields=['last_hit_at'], name='diagnostico_last_hi_93798f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='inferenceresultcache',
+            constraint=models.UniqueConstraint(fields=('file_hash', 'model_version', 'preprocessing_key'), name='unique_inference_result'),
+        ),
+    ]
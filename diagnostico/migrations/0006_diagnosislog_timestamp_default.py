@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostico', '0005_inferenceresultcache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='diagnosislog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha y Hora'),
+        ),
+    ]
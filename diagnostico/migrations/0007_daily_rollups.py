@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    # Carga inicial de los resúmenes con los diagnósticos existentes
+    from diagnostico.rollups import rebuild
+
+    rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostico', '0006_diagnosislog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosisDailyModelStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('model_version', models.CharField(blank=True, max_length=50, verbose_name='Versión del Modelo')),
+                ('completed', models.IntegerField(default=0, verbose_name='Con resultado')),
+                ('confidence_sum', models.FloatField(default=0.0, verbose_name='Suma de confianza')),
+                ('processing_time_sum', models.FloatField(default=0.0, verbose_name='Suma de tiempos (s)')),
+                ('validated', models.IntegerField(default=0, verbose_name='Validados')),
+                ('discarded', models.IntegerField(default=0, verbose_name='Descartados')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario por Modelo',
+                'verbose_name_plural': 'Resúmenes Diarios por Modelo',
+            },
+        ),
+        migrations.CreateModel(
+            name='DiagnosisDailyStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('status', models.CharField(choices=[('PENDING', 'Pendiente'), ('PROCESSING', 'Procesando'), ('COMPLETED', 'Completado'), ('FAILED', 'Error'), ('VALIDATED', 'Validado'), ('DISCARDED', 'Descartado')], max_length=20, verbose_name='Estado')),
+                ('count', models.IntegerField(default=0, verbose_name='Cantidad')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario por Estado',
+                'verbose_name_plural': 'Resúmenes Diarios por Estado',
+            },
+        ),
+        migrations.CreateModel(
+            name='DiagnosisDailyTimeBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('model_version', models.CharField(blank=True, max_length=50, verbose_name='Versión del Modelo')),
+                ('bucket', models.PositiveSmallIntegerField(verbose_name='Intervalo')),
+                ('count', models.IntegerField(default=0, verbose_name='Cantidad')),
+            ],
+            options={
+                'verbose_name': 'Histograma Diario de Tiempos',
+                'verbose_name_plural': 'Histogramas Diarios de Tiempos',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='diagnosisdailytimebucket',
+            constraint=models.UniqueConstraint(fields=('date', 'model_version', 'bucket'), name='unique_daily_time_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='diagnosisdailystatus',
+            constraint=models.UniqueConstraint(fields=('date', 'status'), name='unique_daily_status'),
+        ),
+        migrations.AddConstraint(
+            model_name='diagnosisdailymodelstat',
+            constraint=models.UniqueConstraint(fields=('date', 'model_version'), name='unique_daily_model_stat'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
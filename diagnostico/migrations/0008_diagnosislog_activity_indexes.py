@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostico', '0007_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='diagnosislog',
+            name='diagnostico_action_e8e16b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='diagnosislog',
+            index=models.Index(fields=['action', '-timestamp', '-id'], name='diagnostico_action_10cbb8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosislog',
+            index=models.Index(fields=['-timestamp', '-id'], name='diagnostico_timesta_31a9e4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosislog',
+            index=models.Index(fields=['performed_by', '-timestamp', '-id'], name='diagnostico_perform_96449a_idx'),
+        ),
+    ]
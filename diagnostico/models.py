@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from users.models import Patient
 from authentication.models import User
 from medical_images.models import MedicalImage
@@ -33,6 +34,7 @@ class AIDiagnosis(models.Model):
     heatmap_data = models.JSONField('Datos del Mapa de Calor', default=dict, blank=True)
     model_version = models.CharField('Versión del Modelo', max_length=50, blank=True, null=True)
     processing_time = models.FloatField('Tiempo de Procesamiento (s)', default=0.0, blank=True)
+    stage_timings = models.JSONField('Tiempos por Etapa (s)', default=dict, blank=True)
     
     # Validación médica
     doctor_comments = models.TextField('Comentarios del Médico', blank=True, null=True)
@@ -41,6 +43,11 @@ class AIDiagnosis(models.Model):
     # Errores
     error_message = models.TextField('Mensaje de Error', blank=True, null=True)
     
+    # Cola de procesamiento (lease del worker que lo está procesando)
+    lease_owner = models.CharField('Worker Asignado', max_length=100, blank=True, null=True)
+    lease_expires_at = models.DateTimeField('Vencimiento del Lease', null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField('Intentos de Procesamiento', default=0)
+    
     # Timestamps
     created_at = models.DateTimeField('Fecha de Creación', auto_now_add=True)
     updated_at = models.DateTimeField('Fecha de Actualización', auto_now=True)
@@ -52,6 +59,7 @@ class AIDiagnosis(models.Model):
             models.Index(fields=['patient', '-created_at']),
             models.Index(fields=['status', '-created_at']),
             models.Index(fields=['requested_by', '-created_at']),
+            models.Index(fields=['status', 'lease_expires_at']),
         ]
         verbose_name = 'Diagnóstico IA'
         verbose_name_plural = 'Diagnósticos IA'
@@ -94,13 +102,17 @@ class DiagnosisLog(models.Model):
     details = models.JSONField('Detalles', default=dict, blank=True)
     ip_address = models.GenericIPAddressField('Dirección IP', null=True, blank=True)
     user_agent = models.TextField('User Agent', blank=True, null=True)
-    timestamp = models.DateTimeField('Fecha y Hora', auto_now_add=True)
+    # Hora del evento, asignada al registrarlo (la escritura puede ser posterior)
+    timestamp = models.DateTimeField('Fecha y Hora', default=timezone.now)
     
     class Meta:
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['diagnosis', '-timestamp']),
-            models.Index(fields=['action', '-timestamp']),
+            models.Index(fields=['action', '-timestamp', '-id']),
+            # Paginación por (timestamp, id) del monitoreo de actividad
+            models.Index(fields=['-timestamp', '-id']),
+            models.Index(fields=['performed_by', '-timestamp', '-id']),
         ]
         verbose_name = 'Log de Diagnóstico'
         verbose_name_plural = 'Logs de Diagnóstico'
@@ -111,3 +123,107 @@ class DiagnosisLog(models.Model):
     def get_action_display(self):
         """Devuelve el nombre legible de la acción"""
         return dict(self.ACTION_CHOICES).get(self.action, self.action)
+
+
+class InferenceResultCache(models.Model):
+    """
+    Resultado de inferencia por imagen, reutilizable entre diagnósticos.
+    La clave es el contenido del archivo (file_hash), la versión del modelo y
+    la configuración de preprocesamiento.
+    """
+    
+    file_hash = models.CharField('Hash del Archivo', max_length=256)
+    model_version = models.CharField('Versión del Modelo', max_length=50)
+    preprocessing_key = models.CharField('Configuración de Preprocesamiento', max_length=32)
+    probabilities = models.JSONField('Probabilidades', default=list)
+    labels = models.JSONField('Etiquetas', default=list)
+    hit_count = models.PositiveIntegerField('Aciertos', default=0)
+    created_at = models.DateTimeField('Fecha de Creación', auto_now_add=True)
+    last_hit_at = models.DateTimeField('Último Uso', default=timezone.now)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['file_hash', 'model_version', 'preprocessing_key'],
+                name='unique_inference_result',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['last_hit_at']),
+        ]
+        verbose_name = 'Resultado de Inferencia en Caché'
+        verbose_name_plural = 'Resultados de Inferencia en Caché'
+    
+    def __str__(self):
+        return f"{self.file_hash[:12]} - {self.model_version} ({self.hit_count} aciertos)"
+
+
+# ================================
+# TABLAS DE RESUMEN DIARIO (ROLLUPS)
+# ================================
+# Se mantienen de forma incremental desde diagnostico/rollups.py; los
+# reportes leen estas filas en vez de recorrer AIDiagnosis. El día es la
+# fecha local de creación del diagnóstico.
+
+
+class DiagnosisDailyStatus(models.Model):
+    """Diagnósticos creados en el día, por estado actual"""
+    
+    date = models.DateField('Fecha')
+    status = models.CharField('Estado', max_length=20, choices=AIDiagnosis.STATUS_CHOICES)
+    count = models.IntegerField('Cantidad', default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status'], name='unique_daily_status'),
+        ]
+        verbose_name = 'Resumen Diario por Estado'
+        verbose_name_plural = 'Resúmenes Diarios por Estado'
+    
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.count}"
+
+
+class DiagnosisDailyModelStat(models.Model):
+    """Diagnósticos con resultado del día, por versión del modelo"""
+    
+    date = models.DateField('Fecha')
+    model_version = models.CharField('Versión del Modelo', max_length=50, blank=True)
+    completed = models.IntegerField('Con resultado', default=0)
+    confidence_sum = models.FloatField('Suma de confianza', default=0.0)
+    processing_time_sum = models.FloatField('Suma de tiempos (s)', default=0.0)
+    validated = models.IntegerField('Validados', default=0)
+    discarded = models.IntegerField('Descartados', default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'model_version'], name='unique_daily_model_stat'),
+        ]
+        verbose_name = 'Resumen Diario por Modelo'
+        verbose_name_plural = 'Resúmenes Diarios por Modelo'
+    
+    def __str__(self):
+        return f"{self.date} {self.model_version or '-'}: {self.completed}"
+
+
+class DiagnosisDailyTimeBucket(models.Model):
+    """Histograma diario de tiempos de procesamiento, para estimar percentiles"""
+    
+    date = models.DateField('Fecha')
+    model_version = models.CharField('Versión del Modelo', max_length=50, blank=True)
+    # Índice en rollups.PROCESSING_TIME_BUCKETS
+    bucket = models.PositiveSmallIntegerField('Intervalo')
+    count = models.IntegerField('Cantidad', default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'model_version', 'bucket'],
+                name='unique_daily_time_bucket',
+            ),
+        ]
+        verbose_name = 'Histograma Diario de Tiempos'
+        verbose_name_plural = 'Histogramas Diarios de Tiempos'
+    
+    def __str__(self):
+        return f"{self.date} {self.model_version or '-'} [{self.bucket}]: {self.count}"
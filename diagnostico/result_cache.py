@@ -0,0 +1,138 @@
+# ================================
+# Caché persistente de resultados de inferencia
+# ARCHIVO: diagnostico/result_cache.py
+# ================================
+# Un mismo estudio (mismo file_hash) enviado en otro diagnóstico reutiliza las
+# probabilidades ya calculadas para esa versión de modelo y preprocesamiento,
+# sin pasar por el modelo.
+#
+# La expulsión no cuenta la tabla en cada escritura: cada proceso lleva una
+# estimación de las entradas (el último COUNT más lo que insertó desde
+# entonces) y solo expulsa cuando la estimación alcanza el límite o pasaron
+# DIAGNOSIS_RESULT_CACHE_EVICT_INTERVAL segundos (lo insertado por otros
+# workers). Al expulsar se baja hasta el 90% del límite, para que la
+# siguiente expulsión tarde en llegar.
+
+import time
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import InferenceResultCache
+
+
+class ResultCache:
+    """Acceso por lotes al caché de resultados con expulsión por tamaño"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or getattr(settings, 'DIAGNOSIS_RESULT_CACHE_MAX_ENTRIES', 100000)
+        self.enabled = getattr(settings, 'DIAGNOSIS_RESULT_CACHE_ENABLED', True)
+        self.evict_interval = getattr(settings, 'DIAGNOSIS_RESULT_CACHE_EVICT_INTERVAL', 60.0)
+        self.low_water = int(self.max_entries * 0.9)
+        # Entradas estimadas y momento del último COUNT (None: aún sin contar)
+        self._estimated = None
+        self._counted_at = 0.0
+        # Contadores del proceso
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_many(self, file_hashes, model_version, preprocessing_key):
+        """
+        Retorna {file_hash: (probabilidades, etiquetas)} para los hashes en caché.
+        Una consulta para leer y otra para registrar los aciertos.
+        """
+        file_hashes = set(file_hashes)
+        if not self.enabled or not file_hashes:
+            self.misses += len(file_hashes)
+            return {}
+
+        entries = list(
+            InferenceResultCache.objects.filter(
+                file_hash__in=file_hashes,
+                model_version=model_version,
+                preprocessing_key=preprocessing_key,
+            ).values_list('id', 'file_hash', 'probabilities', 'labels')
+        )
+        if entries:
+            InferenceResultCache.objects.filter(id__in=[entry[0] for entry in entries]).update(
+                hit_count=F('hit_count') + 1,
+                last_hit_at=timezone.now(),
+            )
+
+        found = {file_hash: (probabilities, labels) for _, file_hash, probabilities, labels in entries}
+        self.hits += len(found)
+        self.misses += len(file_hashes) - len(found)
+        return found
+
+    def set_many(self, results, model_version, preprocessing_key, labels):
+        """
+        Guarda {file_hash: probabilidades} y, si la tabla pudo llegar al
+        límite, expulsa las entradas menos usadas
+        """
+        if not self.enabled or not results:
+            return
+        InferenceResultCache.objects.bulk_create(
+            [
+                InferenceResultCache(
+                    file_hash=file_hash,
+                    model_version=model_version,
+                    preprocessing_key=preprocessing_key,
+                    probabilities=[float(p) for p in probabilities],
+                    labels=list(labels),
+                )
+                for file_hash, probabilities in results.items()
+            ],
+            ignore_conflicts=True,
+        )
+        # Cota superior: los conflictos ignorados no agregan filas
+        if self._estimated is not None:
+            self._estimated += len(results)
+        if self.needs_eviction():
+            self.evict()
+
+    def needs_eviction(self):
+        """La tabla pudo alcanzar el límite desde el último COUNT"""
+        return (
+            self._estimated is None
+            or self._estimated >= self.max_entries
+            or time.monotonic() - self._counted_at >= self.evict_interval
+        )
+
+    def evict(self):
+        """
+        Cuenta la tabla y, si alcanzó el límite, elimina las entradas usadas
+        hace más tiempo hasta dejarla en el 90% del límite
+        """
+        entries = InferenceResultCache.objects.count()
+        self._counted_at = time.monotonic()
+        self._estimated = entries
+        if entries < self.max_entries:
+            return 0
+        stale_ids = list(
+            InferenceResultCache.objects.order_by('last_hit_at', 'id')
+            .values_list('id', flat=True)[:entries - self.low_water]
+        )
+        deleted, _ = InferenceResultCache.objects.filter(id__in=stale_ids).delete()
+        self._estimated = entries - deleted
+        return deleted
+
+    @staticmethod
+    def stats():
+        """
+        Estadísticas globales. Cada entrada se creó por un fallo y cada uso
+        posterior es un acierto, así que la tasa se calcula con la tabla.
+        """
+        totals = InferenceResultCache.objects.aggregate(hits=Sum('hit_count'))
+        entries = InferenceResultCache.objects.count()
+        hits = totals['hits'] or 0
+        return {
+            'entries': entries,
+            'hits': hits,
+            'hit_rate': hits / (hits + entries) if entries else 0.0,
+        }
@@ -0,0 +1,312 @@
+# ================================
+# Resúmenes diarios de diagnósticos (rollups)
+# ARCHIVO: diagnostico/rollups.py
+# ================================
+# Cada diagnóstico aporta a las tablas de resumen según su estado actual:
+#   - DiagnosisDailyStatus: +1 en (día de creación, estado).
+#   - DiagnosisDailyModelStat y DiagnosisDailyTimeBucket: si ya tiene
+#     resultado (COMPLETED, VALIDATED o DISCARDED), su confianza, su tiempo de
+#     procesamiento y si fue validado o descartado, por (día, versión).
+# Cuando un diagnóstico cambia se resta su aporte anterior y se suma el nuevo
+# con UPDATE ... SET campo = campo + delta, en la misma transacción que el
+# cambio: los UPDATE condicionales de la cola (diagnostico/tasks.py) abren un
+# transaction.atomic() con el UPDATE y su llamada a record_changes(). Los
+# save() del ORM se capturan con señales, que solo comparten transacción con
+# el cambio si quien guarda usa atomic() (como validar y descartar en
+# diagnostico/views.py); si un proceso muere entre ambos, rebuild() corrige
+# el desvío.
+#
+# Los percentiles de tiempo se estiman con un histograma de intervalos fijos:
+# un reporte de años lee unos cientos de filas, no la tabla de diagnósticos.
+# `python manage.py rebuild_diagnosis_stats` recalcula las tablas desde
+# AIDiagnosis (carga inicial o corrección de desvíos).
+
+import bisect
+from collections import defaultdict
+
+from django.apps import apps as django_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import AIDiagnosis, DiagnosisDailyModelStat, DiagnosisDailyStatus, DiagnosisDailyTimeBucket
+
+# Límite superior (s) de cada intervalo del histograma; después del último
+# queda un intervalo abierto
+PROCESSING_TIME_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+# Estados con resultado de la IA
+FINISHED_STATUSES = ('COMPLETED', 'VALIDATED', 'DISCARDED')
+
+TRACKED_FIELDS = ('created_at', 'status', 'model_version', 'confidence_level', 'processing_time')
+
+
+def time_bucket(seconds):
+    """Índice del intervalo del histograma para un tiempo de procesamiento"""
+    return bisect.bisect_left(PROCESSING_TIME_BUCKETS, seconds or 0)
+
+
+def snapshot(diagnosis, **changes):
+    """Campos de un diagnóstico que afectan los resúmenes"""
+    state = {field: getattr(diagnosis, field) for field in TRACKED_FIELDS}
+    state.update((field, value) for field, value in changes.items() if field in TRACKED_FIELDS)
+    return state
+
+
+def contribution(state):
+    """Filas de resumen y valores que aporta un diagnóstico en `state`"""
+    if not state or not state.get('created_at'):
+        return {}
+    day = timezone.localdate(state['created_at'])
+    status = state['status']
+    rows = {(DiagnosisDailyStatus, (('date', day), ('status', status))): {'count': 1}}
+    if status in FINISHED_STATUSES:
+        key = (('date', day), ('model_version', state.get('model_version') or ''))
+        rows[(DiagnosisDailyModelStat, key)] = {
+            'completed': 1,
+            'confidence_sum': state.get('confidence_level') or 0.0,
+            'processing_time_sum': state.get('processing_time') or 0.0,
+            'validated': int(status == 'VALIDATED'),
+            'discarded': int(status == 'DISCARDED'),
+        }
+        bucket = (('bucket', time_bucket(state.get('processing_time'))),)
+        rows[(DiagnosisDailyTimeBucket, key + bucket)] = {'count': 1}
+    return rows
+
+
+def _increment(model, key, fields):
+    updates = {field: F(field) + value for field, value in fields.items()}
+    if model.objects.filter(**key).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **fields)
+    except IntegrityError:
+        # Otro proceso creó la fila entre el UPDATE y el INSERT
+        model.objects.filter(**key).update(**updates)
+
+
+def record_changes(changes):
+    """
+    Aplica a los resúmenes una lista de (estado anterior, estado nuevo).
+    None como estado anterior es una creación; como estado nuevo, un borrado.
+    Los aportes de todos los cambios se suman antes de escribir: un lote de
+    la cola actualiza cada fila de resumen una sola vez.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for old, new in changes:
+        for sign, state in ((-1, old), (1, new)):
+            for row, fields in contribution(state).items():
+                for field, value in fields.items():
+                    deltas[row][field] += sign * value
+
+    for (model, key), fields in deltas.items():
+        fields = {field: value for field, value in fields.items() if value}
+        if fields:
+            _increment(model, dict(key), fields)
+
+
+def record_change(old, new):
+    record_changes([(old, new)])
+
+
+def status_changes(rows, new_status):
+    """Cambios de solo estado, a partir de filas (created_at, estado anterior)"""
+    return [
+        ({'created_at': created_at, 'status': old_status}, {'created_at': created_at, 'status': new_status})
+        for created_at, old_status in rows
+    ]
+
+
+# ================================
+# SEÑALES
+# ================================
+
+def diagnosis_pre_save(sender, instance, raw=False, **kwargs):
+    """Lee el estado guardado para poder restar su aporte"""
+    instance._rollup_previous = None
+    if raw or instance.pk is None:
+        return
+    instance._rollup_previous = (
+        AIDiagnosis.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+    )
+
+
+def diagnosis_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_change(getattr(instance, '_rollup_previous', None), snapshot(instance))
+
+
+def diagnosis_deleted(sender, instance, **kwargs):
+    record_change(snapshot(instance), None)
+
+
+# ================================
+# LECTURA PARA REPORTES
+# ================================
+
+def percentile(histogram, fraction):
+    """Estima un percentil interpolando dentro del intervalo del histograma"""
+    total = sum(histogram)
+    if total <= 0:
+        return None
+    rank = fraction * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count <= 0:
+            continue
+        if seen + count >= rank:
+            lower = PROCESSING_TIME_BUCKETS[index - 1] if index else 0.0
+            # El intervalo abierto se informa con su límite inferior
+            upper = PROCESSING_TIME_BUCKETS[index] if index < len(PROCESSING_TIME_BUCKETS) else lower
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return PROCESSING_TIME_BUCKETS[-1]
+
+
+def daily_status(start, end):
+    """Diagnósticos creados por día y por estado"""
+    days = {}
+    rows = (
+        DiagnosisDailyStatus.objects.filter(date__range=(start, end), count__gt=0)
+        .order_by('date')
+        .values_list('date', 'status', 'count')
+    )
+    for day, status, count in rows:
+        entry = days.setdefault(day, {'fecha': day, 'cantidad': 0, 'estados': {}})
+        entry['cantidad'] += count
+        entry['estados'][status] = count
+    return list(days.values())
+
+
+def daily_precision(start, end):
+    """Por día: tasa de validación de lo revisado y confianza media"""
+    rows = (
+        DiagnosisDailyModelStat.objects.filter(date__range=(start, end))
+        .values('date')
+        .annotate(
+            completed=Sum('completed'),
+            confidence_sum=Sum('confidence_sum'),
+            validated=Sum('validated'),
+            discarded=Sum('discarded'),
+        )
+        .order_by('date')
+    )
+    report = []
+    for row in rows:
+        if not row['completed']:
+            continue
+        reviewed = row['validated'] + row['discarded']
+        report.append({
+            'fecha': row['date'],
+            'precision': round(row['validated'] * 100 / reviewed, 1) if reviewed else None,
+            'confianza': round(row['confidence_sum'] / row['completed'], 1),
+            'revisados': reviewed,
+        })
+    return report
+
+
+def model_summary(start, end):
+    """Por versión del modelo: volumen, confianza, percentiles de tiempo y revisión"""
+    histograms = defaultdict(lambda: [0] * (len(PROCESSING_TIME_BUCKETS) + 1))
+    buckets = (
+        DiagnosisDailyTimeBucket.objects.filter(date__range=(start, end))
+        .values_list('model_version', 'bucket')
+        .annotate(total=Sum('count'))
+        .order_by()
+    )
+    for version, bucket, total in buckets:
+        histograms[version][bucket] += total
+
+    rows = (
+        DiagnosisDailyModelStat.objects.filter(date__range=(start, end))
+        .values('model_version')
+        .annotate(
+            completed=Sum('completed'),
+            confidence_sum=Sum('confidence_sum'),
+            processing_time_sum=Sum('processing_time_sum'),
+            validated=Sum('validated'),
+            discarded=Sum('discarded'),
+        )
+        .order_by('model_version')
+    )
+    report = []
+    for row in rows:
+        completed = row['completed']
+        if not completed:
+            continue
+        histogram = histograms[row['model_version']]
+        report.append({
+            'modelo': row['model_version'] or 'Sin versión',
+            'cantidad': completed,
+            'confianza': round(row['confidence_sum'] / completed, 1),
+            'tiempo_medio': round(row['processing_time_sum'] / completed, 2),
+            'tiempo_p50': percentile(histogram, 0.5),
+            'tiempo_p95': percentile(histogram, 0.95),
+            'validados': round(row['validated'] * 100 / completed, 1),
+            'descartados': round(row['discarded'] * 100 / completed, 1),
+        })
+    return report
+
+
+# ================================
+# RECÁLCULO COMPLETO
+# ================================
+
+def rebuild(start=None, end=None, apps=django_apps):
+    """
+    Recalcula los resúmenes desde AIDiagnosis para los días entre `start` y
+    `end` (inclusive; None = sin límite). `apps` permite usarlo desde una
+    migración con los modelos históricos. Retorna las filas escritas por tabla.
+    """
+    diagnosis_model = apps.get_model('diagnostico', 'AIDiagnosis')
+    status_model = apps.get_model('diagnostico', 'DiagnosisDailyStatus')
+    model_stat_model = apps.get_model('diagnostico', 'DiagnosisDailyModelStat')
+    bucket_model = apps.get_model('diagnostico', 'DiagnosisDailyTimeBucket')
+
+    diagnoses = diagnosis_model.objects.annotate(day=TruncDate('created_at')).order_by()
+    rollup_filter = Q()
+    if start:
+        diagnoses = diagnoses.filter(day__gte=start)
+        rollup_filter &= Q(date__gte=start)
+    if end:
+        diagnoses = diagnoses.filter(day__lte=end)
+        rollup_filter &= Q(date__lte=end)
+    finished = diagnoses.filter(status__in=FINISHED_STATUSES).annotate(
+        version=Coalesce('model_version', Value('')),
+    )
+    bucket = Case(
+        *[When(processing_time__lte=edge, then=Value(index)) for index, edge in enumerate(PROCESSING_TIME_BUCKETS)],
+        default=Value(len(PROCESSING_TIME_BUCKETS)),
+    )
+
+    with transaction.atomic():
+        for model in (status_model, model_stat_model, bucket_model):
+            model.objects.filter(rollup_filter).delete()
+
+        statuses = status_model.objects.bulk_create([
+            status_model(date=row['day'], status=row['status'], count=row['count'])
+            for row in diagnoses.values('day', 'status').annotate(count=Count('id'))
+        ])
+        model_stats = model_stat_model.objects.bulk_create([
+            model_stat_model(date=row.pop('day'), model_version=row.pop('version'), **row)
+            for row in finished.values('day', 'version').annotate(
+                completed=Count('id'),
+                confidence_sum=Coalesce(Sum('confidence_level'), 0.0),
+                processing_time_sum=Coalesce(Sum('processing_time'), 0.0),
+                validated=Count('id', filter=Q(status='VALIDATED')),
+                discarded=Count('id', filter=Q(status='DISCARDED')),
+            )
+        ])
+        buckets = bucket_model.objects.bulk_create([
+            bucket_model(date=row['day'], model_version=row['version'], bucket=row['bucket'], count=row['count'])
+            for row in finished.annotate(bucket=bucket).values('day', 'version', 'bucket').annotate(count=Count('id'))
+        ])
+
+    return {
+        'statuses': len(statuses),
+        'model_stats': len(model_stats),
+        'time_buckets': len(buckets),
+    }
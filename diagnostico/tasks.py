@@ -0,0 +1,281 @@
+# ================================
+# Cola de diagnósticos IA en base de datos
+# ARCHIVO: diagnostico/tasks.py
+# ================================
+
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
+
+from authentication import audit
+from medical_images.models import MedicalImage
+from users import dashboard_stats
+from . import rollups
+from .batching import MicroBatcher
+from .inference import check_model_files, model_cache
+from .models import AIDiagnosis, DiagnosisLog
+
+logger = logging.getLogger(__name__)
+
+
+def get_queue_setting(name, default):
+    """Lee un parámetro de la cola desde settings (DIAGNOSIS_QUEUE_*)"""
+    return getattr(settings, f'DIAGNOSIS_QUEUE_{name}', default)
+
+
+def default_worker_id():
+    """Identificador único del worker: host + PID"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class DiagnosisQueue:
+    """
+    Cola de trabajos respaldada por la tabla AIDiagnosis.
+
+    Un diagnóstico PENDING es un trabajo en cola. Un worker lo reclama con un
+    UPDATE condicional (PENDING -> PROCESSING) que solo afecta la fila si nadie
+    más la tomó, y queda como dueño durante el tiempo del lease. Si el worker
+    muere, el lease vence y otro worker puede reclamar el trabajo.
+
+    Los UPDATE no emiten señales: cada transición actualiza los resúmenes
+    (rollups) e invalida los contadores del dashboard en su transacción.
+    """
+
+    @staticmethod
+    def enqueue(patient, requested_by, images, model_version=None):
+        """
+        Crea el diagnóstico y sus imágenes en una sola transacción para que
+        ningún worker lo reclame antes de tener las imágenes asociadas.
+        """
+        with transaction.atomic():
+            diagnosis = AIDiagnosis.objects.create(
+                patient=patient,
+                requested_by=requested_by,
+                status='PENDING',
+                model_version=model_version,
+            )
+            diagnosis.images.set(images)
+        return diagnosis
+
+    @staticmethod
+    def _claimable(now):
+        """Trabajos pendientes o con lease vencido"""
+        return Q(status='PENDING') | Q(status='PROCESSING', lease_expires_at__lt=now)
+
+    @classmethod
+    def claim(cls, worker_id, limit=1, lease_seconds=None):
+        """
+        Reclama hasta `limit` diagnósticos para `worker_id`.
+        Retorna la lista de diagnósticos reclamados (puede estar vacía).
+        """
+        if lease_seconds is None:
+            lease_seconds = get_queue_setting('LEASE_SECONDS', 300)
+        max_attempts = get_queue_setting('MAX_ATTEMPTS', 3)
+
+        now = timezone.now()
+        cls.fail_exhausted(now, max_attempts)
+
+        # Candidatos en orden de llegada; se piden algunos de más porque otros
+        # workers pueden ganar la carrera por las mismas filas
+        candidates = {
+            diagnosis_id: (created_at, status)
+            for diagnosis_id, created_at, status in (
+                AIDiagnosis.objects.filter(cls._claimable(now))
+                .order_by('created_at')
+                .values_list('id', 'created_at', 'status')[:limit * 4]
+            )
+        }
+
+        # Los UPDATE de estado y sus resúmenes se confirman juntos
+        with transaction.atomic():
+            claimed_ids = []
+            for diagnosis_id in candidates:
+                updated = AIDiagnosis.objects.filter(
+                    cls._claimable(now),
+                    id=diagnosis_id,
+                    attempts__lt=max_attempts,
+                ).update(
+                    status='PROCESSING',
+                    lease_owner=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    attempts=F('attempts') + 1,
+                    updated_at=now,
+                )
+                if updated:
+                    claimed_ids.append(diagnosis_id)
+                    if len(claimed_ids) >= limit:
+                        break
+
+            if not claimed_ids:
+                return []
+
+            rollups.record_changes(rollups.status_changes(
+                [candidates[diagnosis_id] for diagnosis_id in claimed_ids], 'PROCESSING',
+            ))
+            dashboard_stats.invalidate()
+            DiagnosisLog.objects.bulk_create([
+                DiagnosisLog(
+                    diagnosis_id=diagnosis_id,
+                    action='PROCESSING',
+                    details={'worker': worker_id},
+                )
+                for diagnosis_id in claimed_ids
+            ])
+
+        return list(
+            AIDiagnosis.objects.filter(id__in=claimed_ids)
+            .select_related('patient')
+            # Con los metadatos DICOM cargados, los píxeles se mapean sin re-leer el encabezado
+            .prefetch_related(Prefetch('images', queryset=MedicalImage.objects.select_related('dicom')))
+            .order_by('created_at')
+        )
+
+    @staticmethod
+    def fail_exhausted(now, max_attempts):
+        """Marca como FAILED los trabajos cuyo lease venció sin más reintentos"""
+        exhausted = AIDiagnosis.objects.filter(
+            status='PROCESSING',
+            lease_expires_at__lt=now,
+            attempts__gte=max_attempts,
+        )
+        exhausted_rows = list(exhausted.values_list('id', 'created_at'))
+        if not exhausted_rows:
+            return 0
+
+        # Un UPDATE condicional por fila (son pocas): solo se cuentan en los
+        # resúmenes las que este proceso cambió, en la misma transacción
+        with transaction.atomic():
+            failed = [
+                (diagnosis_id, created_at)
+                for diagnosis_id, created_at in exhausted_rows
+                if AIDiagnosis.objects.filter(
+                    id=diagnosis_id, status='PROCESSING', lease_expires_at__lt=now
+                ).update(
+                    status='FAILED',
+                    error_message='Se agotaron los intentos de procesamiento.',
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    updated_at=now,
+                )
+            ]
+            rollups.record_changes(rollups.status_changes(
+                [(created_at, 'PROCESSING') for _, created_at in failed], 'FAILED',
+            ))
+            if failed:
+                dashboard_stats.invalidate()
+            DiagnosisLog.objects.bulk_create([
+                DiagnosisLog(diagnosis_id=diagnosis_id, action='FAILED',
+                             details={'reason': 'max_attempts'})
+                for diagnosis_id, _ in failed
+            ])
+        return len(failed)
+
+    @staticmethod
+    def complete(diagnosis, worker_id, result):
+        """
+        Guarda el resultado si el worker todavía es dueño del lease.
+        Retorna False si el lease se perdió (otro worker tomó el trabajo).
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            updated = AIDiagnosis.objects.filter(
+                id=diagnosis.id, status='PROCESSING', lease_owner=worker_id
+            ).update(
+                status='COMPLETED',
+                completed_at=now,
+                lease_owner=None,
+                lease_expires_at=None,
+                error_message=None,
+                updated_at=now,
+                **result,
+            )
+            if updated:
+                rollups.record_change(
+                    rollups.snapshot(diagnosis, status='PROCESSING'),
+                    rollups.snapshot(diagnosis, status='COMPLETED', **result),
+                )
+                dashboard_stats.invalidate()
+                audit.record(
+                    DiagnosisLog,
+                    diagnosis_id=diagnosis.id,
+                    action='COMPLETED',
+                    details={'worker': worker_id},
+                )
+        return bool(updated)
+
+    @staticmethod
+    def fail(diagnosis, worker_id, error):
+        """Marca el diagnóstico como FAILED si el worker todavía es dueño"""
+        now = timezone.now()
+        with transaction.atomic():
+            updated = AIDiagnosis.objects.filter(
+                id=diagnosis.id, status='PROCESSING', lease_owner=worker_id
+            ).update(
+                status='FAILED',
+                error_message=str(error),
+                lease_owner=None,
+                lease_expires_at=None,
+                updated_at=now,
+            )
+            if updated:
+                rollups.record_changes(rollups.status_changes([(diagnosis.created_at, 'PROCESSING')], 'FAILED'))
+                dashboard_stats.invalidate()
+                audit.record(
+                    DiagnosisLog,
+                    diagnosis_id=diagnosis.id,
+                    action='FAILED',
+                    details={'worker': worker_id, 'error': str(error)},
+                )
+        return bool(updated)
+
+
+class DiagnosisWorker:
+    """Worker que reclama diagnósticos de la cola y ejecuta la inferencia por lotes"""
+
+    def __init__(self, worker_id=None, poll_interval=None, lease_seconds=None,
+                 batch_size=None, max_wait=None):
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval or get_queue_setting('POLL_INTERVAL', 2.0)
+        self.lease_seconds = lease_seconds or get_queue_setting('LEASE_SECONDS', 300)
+        self.batcher = MicroBatcher(
+            DiagnosisQueue,
+            self.worker_id,
+            batch_size=batch_size,
+            max_wait=max_wait,
+            lease_seconds=self.lease_seconds,
+        )
+
+    def run_once(self):
+        """Reclama y procesa un lote. Retorna cuántos diagnósticos se procesaron."""
+        diagnoses = self.batcher.collect()
+        if diagnoses:
+            self.batcher.run(diagnoses)
+        return len(diagnoses)
+
+    def run(self, stop_event=None):
+        """Bucle principal: procesa mientras haya trabajos y espera si no hay"""
+        logger.info('Worker %s iniciado', self.worker_id)
+        # Los modelos quedan cargados antes de reclamar el primer trabajo
+        check_model_files()
+        model_cache.warm()
+        while stop_event is None or not stop_event.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                # Los trabajos reclamados se reintentan cuando venza su lease
+                logger.exception('Error en el worker %s', self.worker_id)
+            if stop_event is not None:
+                stop_event.wait(self.poll_interval)
+            else:
+                time.sleep(self.poll_interval)
+        # Los procesos hijos terminan sin atexit: se vacía aquí la auditoría pendiente
+        audit.writer.close()
+        logger.info('Worker %s detenido', self.worker_id)
@@ -1,3 +1,367 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from medical_images.models import MedicalImage
+from users.models import Patient
+from . import rollups
+from .batching import MicroBatcher
+from .inference import ModelCache, StubBackend, load_image_array
+from .models import (
+    AIDiagnosis, DiagnosisDailyModelStat, DiagnosisDailyStatus, DiagnosisDailyTimeBucket,
+    InferenceResultCache,
+)
+from .result_cache import ResultCache
+from .tasks import DiagnosisQueue, DiagnosisWorker
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_technician(**fields):
+    """Técnico de salud de prueba; `fields` reemplaza los datos por defecto"""
+    data = {
+        'email': 'tech@example.com',
+        'first_name': 'Tech',
+        'last_name': 'User',
+        'identificacion': 'TECH1',
+        'rol': 'TECNICO_SALUD',
+    }
+    data.update(fields)
+    return User.objects.create_user(password='testpassword', **data)
+
+
+def make_png(seed=0, size=(64, 64)):
+    pixels = np.random.default_rng(seed).integers(0, 256, size, dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def create_image(patient, user, seed=0):
+    content = make_png(seed)
+    return MedicalImage.objects.create(
+        patient=patient,
+        uploaded_by=user,
+        study_type='RX',
+        study_date=date(2025, 1, 1),
+        file_path=SimpleUploadedFile(f'rx_{seed}.png', content),
+        file_hash=f'hash-{seed}',
+        file_size=len(content),
+    )
+
+
+class CountingBackend(StubBackend):
+    batch_shapes = []
+
+    def predict(self, batch):
+        CountingBackend.batch_shapes.append(batch.shape)
+        return super().predict(batch)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DiagnosisQueueTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = create_technician()
+        self.patient = Patient.objects.create(
+            identification='P2001',
+            first_name='Paciente',
+            last_name='Cola',
+            date_of_birth=date(1980, 1, 1),
+            gender='F',
+            created_by=self.user,
+        )
+
+    def enqueue(self):
+        images = [create_image(self.patient, self.user, seed=AIDiagnosis.objects.count())]
+        return DiagnosisQueue.enqueue(self.patient, self.user, images=images, model_version='SIMULADO')
+
+    def test_claim_is_exclusive(self):
+        diagnosis = self.enqueue()
+        first = DiagnosisQueue.claim('worker-a')
+        second = DiagnosisQueue.claim('worker-b')
+        self.assertEqual([d.id for d in first], [diagnosis.id])
+        self.assertEqual(second, [])
+        diagnosis.refresh_from_db()
+        self.assertEqual(diagnosis.status, 'PROCESSING')
+        self.assertEqual(diagnosis.lease_owner, 'worker-a')
+
+    def test_expired_lease_is_reclaimed_and_old_owner_cannot_complete(self):
+        diagnosis = self.enqueue()
+        DiagnosisQueue.claim('worker-a')
+        AIDiagnosis.objects.filter(id=diagnosis.id).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        reclaimed = DiagnosisQueue.claim('worker-b')
+        self.assertEqual([d.id for d in reclaimed], [diagnosis.id])
+        self.assertFalse(DiagnosisQueue.complete(diagnosis, 'worker-a', {}))
+
+    def test_worker_completes_and_detail_view_is_read_only(self):
+        diagnosis = self.enqueue()
+        self.client.force_login(self.user)
+        self.client.get(reverse('diagnostico:diagnosis_detail', args=[diagnosis.id]))
+        diagnosis.refresh_from_db()
+        self.assertEqual(diagnosis.status, 'PENDING')
+
+        self.assertEqual(DiagnosisWorker(worker_id='worker-a').run_once(), 1)
+        diagnosis.refresh_from_db()
+        self.assertEqual(diagnosis.status, 'COMPLETED')
+        self.assertIsNone(diagnosis.lease_owner)
+
+        self.assertEqual(diagnosis.model_version, 'SIMULADO')
+        self.assertIn('inference', diagnosis.stage_timings)
+        self.assertTrue(diagnosis.diagnosis_result.startswith('[SIMULADO]'))
+        self.assertIn('[SIMULADO]', diagnosis.ai_observations[0])
+
+    def test_unconfigured_model_version_fails_instead_of_using_the_stub(self):
+        images = [create_image(self.patient, self.user)]
+        diagnosis = DiagnosisQueue.enqueue(self.patient, self.user, images=images, model_version='1.0.0')
+        DiagnosisWorker(worker_id='worker-a').run_once()
+        diagnosis.refresh_from_db()
+        self.assertEqual(diagnosis.status, 'FAILED')
+        self.assertIn('1.0.0', diagnosis.error_message)
+
+    @override_settings(DIAGNOSIS_MODELS={'COUNTING': {
+        'BACKEND': 'diagnostico.tests.CountingBackend', 'INPUT_SIZE': (32, 32)}})
+    def test_images_from_several_diagnoses_share_fixed_size_batches(self):
+        diagnoses = [
+            DiagnosisQueue.enqueue(self.patient, self.user, model_version='COUNTING', images=[
+                create_image(self.patient, self.user, seed=10 * i + j) for j in range(2)
+            ])
+            for i in range(3)
+        ]
+        CountingBackend.batch_shapes = []
+        batcher = MicroBatcher(DiagnosisQueue, 'worker-a', batch_size=4, max_wait=0,
+                               cache=ModelCache(max_models=1))
+        claimed = batcher.collect()
+        self.assertEqual(len(claimed), 3)
+        batcher.run(claimed)
+
+        self.assertEqual(CountingBackend.batch_shapes, [(4, 32, 32), (4, 32, 32)])
+        for diagnosis in diagnoses:
+            diagnosis.refresh_from_db()
+            self.assertEqual(diagnosis.status, 'COMPLETED')
+
+    @override_settings(DIAGNOSIS_MODELS={'COUNTING': {
+        'BACKEND': 'diagnostico.tests.CountingBackend', 'INPUT_SIZE': (32, 32)}})
+    def test_same_file_in_one_batch_is_inferred_once(self):
+        image = create_image(self.patient, self.user, seed=7)
+        diagnoses = [
+            DiagnosisQueue.enqueue(self.patient, self.user, images=[image], model_version='COUNTING')
+            for _ in range(2)
+        ]
+        CountingBackend.batch_shapes = []
+        with mock.patch('diagnostico.batching.load_image_array', wraps=load_image_array) as load:
+            DiagnosisWorker(worker_id='worker-a', batch_size=4, max_wait=0).run_once()
+
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(CountingBackend.batch_shapes, [(4, 32, 32)])
+        first, second = AIDiagnosis.objects.filter(id__in=[d.id for d in diagnoses]).order_by('id')
+        self.assertEqual((first.status, second.status), ('COMPLETED', 'COMPLETED'))
+        self.assertEqual(first.confidence_level, second.confidence_level)
+
+    @override_settings(DIAGNOSIS_MODELS={'COUNTING': {
+        'BACKEND': 'diagnostico.tests.CountingBackend', 'INPUT_SIZE': (32, 32)}})
+    def test_resubmitted_study_is_served_from_result_cache(self):
+        image = create_image(self.patient, self.user, seed=42)
+        first = DiagnosisQueue.enqueue(self.patient, self.user, images=[image], model_version='COUNTING')
+        worker = DiagnosisWorker(worker_id='worker-a', batch_size=4, max_wait=0)
+        worker.run_once()
+
+        CountingBackend.batch_shapes = []
+        second = DiagnosisQueue.enqueue(self.patient, self.user, images=[image], model_version='COUNTING')
+        worker.run_once()
+
+        self.assertEqual(CountingBackend.batch_shapes, [])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'COMPLETED')
+        self.assertEqual(second.confidence_level, first.confidence_level)
+        self.assertEqual(worker.batcher.result_cache.hits, 1)
+        self.assertEqual(InferenceResultCache.objects.get().hit_count, 1)
+
+    def test_result_cache_counts_the_table_only_near_the_limit(self):
+        result_cache = ResultCache(max_entries=10)
+
+        def store(start, count):
+            results = {f'hash-{i}': [0.5] for i in range(start, start + count)}
+            with CaptureQueriesContext(connection) as context:
+                result_cache.set_many(results, 'SIMULADO', 'prep', ['Normal'])
+            return sum('COUNT(' in query['sql'] for query in context.captured_queries)
+
+        self.assertEqual(store(0, 4), 1)  # Primer conteo del proceso
+        self.assertEqual(store(4, 4), 0)
+        self.assertEqual(store(8, 4), 1)  # Puede haber llegado al límite
+        self.assertEqual(InferenceResultCache.objects.count(), 9)
+        self.assertFalse(InferenceResultCache.objects.filter(file_hash__in=['hash-0', 'hash-1', 'hash-2']).exists())
+
+    def rollup_rows(self):
+        return (
+            sorted(DiagnosisDailyStatus.objects.filter(count__gt=0).values_list('date', 'status', 'count')),
+            sorted(
+                (row[0], row[1], row[2], round(row[3], 3), round(row[4], 6), row[5], row[6])
+                for row in DiagnosisDailyModelStat.objects.filter(completed__gt=0).values_list(
+                    'date', 'model_version', 'completed', 'confidence_sum',
+                    'processing_time_sum', 'validated', 'discarded',
+                )
+            ),
+            sorted(DiagnosisDailyTimeBucket.objects.filter(count__gt=0).values_list(
+                'date', 'model_version', 'bucket', 'count')),
+        )
+
+    def test_rollups_follow_queue_and_reviews(self):
+        diagnoses = [self.enqueue() for _ in range(4)]
+        DiagnosisWorker(worker_id='worker-a', batch_size=4, max_wait=0).run_once()
+        for diagnosis in diagnoses:
+            diagnosis.refresh_from_db()
+        diagnoses[0].status = 'VALIDATED'
+        diagnoses[0].save()
+        diagnoses[1].status = 'DISCARDED'
+        diagnoses[1].save()
+        self.enqueue()
+        diagnoses[3].delete()
+
+        today = timezone.localdate()
+        self.assertEqual(
+            dict(DiagnosisDailyStatus.objects.filter(date=today, count__gt=0).values_list('status', 'count')),
+            {'VALIDATED': 1, 'DISCARDED': 1, 'COMPLETED': 1, 'PENDING': 1},
+        )
+        [summary] = rollups.model_summary(today, today)
+        self.assertEqual(summary['cantidad'], 3)
+        self.assertEqual(summary['validados'], 33.3)
+        self.assertIsNotNone(summary['tiempo_p95'])
+
+        incremental = self.rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_queue_update_is_rolled_back_if_rollups_fail(self):
+        diagnosis = self.enqueue()
+        [claimed] = DiagnosisQueue.claim('worker-a')
+        with mock.patch.object(rollups, '_increment', side_effect=DatabaseError('sin espacio')):
+            with self.assertRaises(DatabaseError):
+                DiagnosisQueue.complete(claimed, 'worker-a', {'confidence_level': 90.0})
+        diagnosis.refresh_from_db()
+        self.assertEqual(diagnosis.status, 'PROCESSING')
+        self.assertEqual(
+            dict(DiagnosisDailyStatus.objects.filter(count__gt=0).values_list('status', 'count')),
+            {'PROCESSING': 1},
+        )
+
+    def test_review_logs_are_written_before_the_response(self):
+        diagnosis = self.enqueue()
+        DiagnosisWorker(worker_id='worker-a').run_once()
+        User.objects.filter(id=self.user.id).update(rol='MEDICO_RADIOLOGO')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('diagnostico:validate_diagnosis', args=[diagnosis.id]))
+        self.assertTrue(response.json()['success'])
+        self.assertTrue(diagnosis.logs.filter(action='VALIDATED').exists())
+
+    def test_reports_view_reads_rollups_only(self):
+        self.enqueue()
+        DiagnosisWorker(worker_id='worker-a').run_once()
+        admin = User.objects.create_superuser(
+            email='admin@example.com', password='testpassword', first_name='Admin', last_name='User',
+        )
+        self.client.force_login(admin)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('users:reports'), {'report_type': 'uso'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report_data'][0]['modelo'], 'SIMULADO')
+        self.assertFalse(any('diagnostico_aidiagnosis' in q['sql'] for q in context.captured_queries))
+
+
+@override_settings(DIAGNOSIS_MODELS={'A': {'BACKEND': 'stub'}, 'B': {'BACKEND': 'stub'},
+                                     'C': {'BACKEND': 'stub'}})
+class ModelCacheTests(TestCase):
+    def test_models_are_loaded_once_and_evicted_lru(self):
+        cache = ModelCache(max_models=2)
+        first = cache.get('A')
+        cache.get('B')
+        self.assertIs(cache.get('A'), first)
+        cache.get('C')
+        self.assertEqual(cache.loads, 3)
+        self.assertIn('A', cache)
+        self.assertNotIn('B', cache)
+
+    def test_stub_backend_is_deterministic(self):
+        batch = np.random.default_rng(1).random((3, 32, 32), dtype=np.float32)
+        first = ModelCache(max_models=1).get('A').predict(batch)
+        second = ModelCache(max_models=1).get('A').predict(batch)
+        np.testing.assert_array_equal(first, second)
+
+    def test_workers_refuse_to_start_without_model_files(self):
+        models = {'A': {'BACKEND': 'numpy', 'PATH': Path(MEDIA_ROOT) / 'no_existe.npz'}}
+        with self.settings(DIAGNOSIS_MODELS=models):
+            with self.assertRaisesMessage(CommandError, 'no_existe.npz'):
+                call_command('run_diagnosis_workers', '--once')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class PatientAutocompleteTests(TestCase):
+    def setUp(self):
+        self.user = create_technician()
+        self.client.force_login(self.user)
+
+    def create_patients(self, count):
+        for i in range(count):
+            patient = Patient.objects.create(
+                identification=f'AC{Patient.objects.count():04d}',
+                first_name='Ana',
+                last_name=f'Gomez {i}',
+                date_of_birth=date(1990, 1, 1),
+                gender='F',
+                created_by=self.user,
+            )
+            image = create_image(patient, self.user, seed=MedicalImage.objects.count())
+            if i % 2:
+                MedicalImage.objects.filter(pk=image.pk).update(study_type='TAC')
+
+    def patient_queries(self, url, params=None):
+        """Respuesta y consultas a pacientes/imágenes (sin contar las del middleware)"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params or {})
+        queries = [q['sql'] for q in context.captured_queries if 'medical_images_medicalimage' in q['sql']]
+        return response.json(), queries
+
+    def test_query_count_does_not_depend_on_number_of_results(self):
+        url = reverse('diagnostico:autocomplete_patients')
+        self.create_patients(2)
+        data, queries = self.patient_queries(url, {'q': 'ana'})
+        self.assertEqual(len(data['patients']), 2)
+        self.assertEqual(len(queries), 1)
+
+        self.create_patients(8)
+        data, queries = self.patient_queries(url, {'q': 'ana'})
+        patients = data['patients']
+        self.assertEqual(len(patients), 10)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual({p['image_count'] for p in patients}, {1})
+        self.assertEqual({p['image_types'] for p in patients}, {'🩻 RX', '🔬 TAC'})
+
+    def test_get_patient_by_id_uses_one_query(self):
+        self.create_patients(1)
+        patient = Patient.objects.get()
+        data, queries = self.patient_queries(reverse('diagnostico:get_patient_by_id', args=[patient.id]))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data['patient']['image_types'], '🩻 RX')
@@ -85,12 +85,17 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
+from django.conf import settings
 from datetime import timedelta
 import json
 
+from authentication import audit, network
 from .models import AIDiagnosis, DiagnosisLog
+from .tasks import DiagnosisQueue
 from users.models import Patient
+from users.prefix_index import get_index as get_patient_index
+from users.search import search_patients
 from medical_images.models import MedicalImage
 
 
@@ -111,12 +116,7 @@ def request_diagnosis_select(request):
     # Búsqueda
     search = request.GET.get('search', '')
     if search:
-        patients = patients.filter(
-            models.Q(identification__icontains=search) |
-            models.Q(first_name__icontains=search) |
-            models.Q(last_name__icontains=search) |
-            models.Q(email__icontains=search)
-        )
+        patients = search_patients(patients, search)
     
     context = {
         'title': 'Seleccionar Paciente - Solicitar Diagnóstico',
@@ -140,17 +140,17 @@ def request_diagnosis(request, patient_id):
         messages.error(request, 'No tienes permiso para solicitar diagnósticos.')
     if request.method == "POST":
         selected_images = request.POST.getlist('selected_images')
-        diagnosis = AIDiagnosis.objects.create(
+        images = MedicalImage.objects.filter(id__in=selected_images, patient=patient)
+        # Encolar: los workers (run_diagnosis_workers) procesan el diagnóstico
+        diagnosis = DiagnosisQueue.enqueue(
             patient=patient,
             requested_by=request.user,
-            status='PENDING',
-            model_version='1.0.0'  # Versión de ejemplo
+            images=images,
+            model_version=settings.DIAGNOSIS_DEFAULT_MODEL_VERSION
         )
-        # Agregar imágenes
-        images = MedicalImage.objects.filter(id__in=selected_images, patient=patient)
-        diagnosis.images.set(images)
         # Crear log de auditoría
-        DiagnosisLog.objects.create(
+        audit.record(
+            DiagnosisLog,
             diagnosis=diagnosis,
             action='CREATED',
             performed_by=request.user,
@@ -190,33 +190,6 @@ def diagnosis_detail(request, diagnosis_id):
     images = diagnosis.images.all()
     logs = diagnosis.logs.all()
     
-    # Simular procesamiento para diagnósticos en cola
-    if diagnosis.status == 'PENDING':
-        # En producción, aquí iría la lógica de procesamiento real con Celery/background tasks
-        # Por ahora, simulamos que después de cierto tiempo se completa
-        time_elapsed = (timezone.now() - diagnosis.created_at).total_seconds()
-        if time_elapsed > 10:  # Después de 10 segundos, marca como completado
-            diagnosis.status = 'COMPLETED'
-            diagnosis.completed_at = timezone.now()
-            diagnosis.processing_time = time_elapsed
-            diagnosis.confidence_level = 85.5
-            diagnosis.diagnosis_result = "Se detectan cambios mínimos en la estructura ósea. No se observan anomalías significativas. Se recomienda seguimiento rutinario."
-            diagnosis.ai_observations = [
-                "Alineación vertebral normal",
-                "Espacios intervertebrales preservados",
-                "No se identifican lesiones óseas agudas",
-                "Estructuras de partes blandas dentro de los límites normales"
-            ]
-            diagnosis.save()
-            
-            DiagnosisLog.objects.create(
-                diagnosis=diagnosis,
-                action='COMPLETED',
-                performed_by=request.user,
-                ip_address=get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', '')
-            )
-    
     context = {
         'title': f'Diagnóstico #{diagnosis.id}',
         'diagnosis': diagnosis,
@@ -252,17 +225,19 @@ def validate_diagnosis(request, diagnosis_id):
     if doctor_comments:
         diagnosis.doctor_comments = doctor_comments
     
-    diagnosis.save()
-    
-    # Crear log
-    DiagnosisLog.objects.create(
-        diagnosis=diagnosis,
-        action='VALIDATED',
-        performed_by=request.user,
-        details={'comments': doctor_comments},
-        ip_address=get_client_ip(request),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+    # El cambio de estado, sus resúmenes diarios (señales) y el log se confirman juntos
+    with transaction.atomic():
+        diagnosis.save()
+        
+        # Crear log (síncrono: diagnosis_detail lo muestra tras la redirección)
+        DiagnosisLog.objects.create(
+            diagnosis=diagnosis,
+            action='VALIDATED',
+            performed_by=request.user,
+            details={'comments': doctor_comments},
+            ip_address=get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        )
     
     messages.success(request, 'Diagnóstico validado exitosamente.')
     return JsonResponse({'success': True})
@@ -280,17 +255,18 @@ def discard_diagnosis(request, diagnosis_id):
         return JsonResponse({'success': False, 'error': 'Permiso denegado.'}, status=403)
     
     diagnosis.status = 'DISCARDED'
-    diagnosis.save()
-    
-    # Crear log
-    DiagnosisLog.objects.create(
-        diagnosis=diagnosis,
-        action='DISCARDED',
-        performed_by=request.user,
-        details={'reason': request.POST.get('reason', 'Sin especificar')},
-        ip_address=get_client_ip(request),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+    with transaction.atomic():
+        diagnosis.save()
+        
+        # Crear log (síncrono: diagnosis_detail lo muestra tras la redirección)
+        DiagnosisLog.objects.create(
+            diagnosis=diagnosis,
+            action='DISCARDED',
+            performed_by=request.user,
+            details={'reason': request.POST.get('reason', 'Sin especificar')},
+            ip_address=get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        )
     
     messages.warning(request, 'Diagnóstico descartado.')
     return JsonResponse({'success': True})
@@ -337,6 +313,59 @@ def diagnosis_list(request):
     return render(request, 'diagnostico/diagnosis_list.html', context)
 
 
+# ================================
+# RESUMEN DE IMÁGENES POR PACIENTE
+# ================================
+
+# Etiqueta de cada tipo de estudio en el autocompletado
+STUDY_TYPE_LABELS = {
+    'RX': '🩻 RX',
+    'TAC': '🔬 TAC',
+    'RMN': '🧲 RMN',
+    'ECO': '📡 ECO',
+    'MAM': '🎗️ MAM',
+}
+
+
+def with_image_summary(patients):
+    """
+    Anota cada paciente con la cantidad de imágenes activas y un booleano
+    `has_<tipo>` por tipo de estudio, todo en la misma consulta.
+    """
+    active_images = MedicalImage.objects.filter(patient=models.OuterRef('pk'), is_active=True)
+    return patients.annotate(
+        image_count=models.Count('medical_images', filter=models.Q(medical_images__is_active=True)),
+        **{
+            f'has_{code.lower()}': models.Exists(active_images.filter(study_type=code))
+            for code, _ in MedicalImage.STUDY_TYPES
+        },
+    )
+
+
+def image_types_display(patient):
+    image_types = {
+        STUDY_TYPE_LABELS.get(code, f'📋 {code}')
+        for code, _ in MedicalImage.STUDY_TYPES
+        if getattr(patient, f'has_{code.lower()}')
+    }
+    return ', '.join(sorted(image_types)[:3]) if image_types else 'Sin imágenes'
+
+
+def patient_summary(patient):
+    """Datos de un paciente anotado con with_image_summary"""
+    return {
+        'id': patient.id,
+        'name': patient.get_full_name(),
+        'identification': patient.identification,
+        'age': patient.get_age(),
+        'gender': patient.get_gender_display_spanish(),
+        'email': patient.email,
+        'phone': patient.phone,
+        'image_count': patient.image_count,
+        'image_types': image_types_display(patient),
+    }
+
+
 @login_required
 @require_http_methods(["GET"])
 def autocomplete_patients(request):
@@ -353,47 +382,27 @@ def autocomplete_patients(request):
         return JsonResponse({'patients': []})
     
     # Buscar pacientes activos (no filtramos por imágenes para permitir upload inicial)
-    patients = Patient.objects.filter(
-        is_active=True
-    ).filter(
-        models.Q(identification__icontains=query) |
-        models.Q(first_name__icontains=query) |
-        models.Q(last_name__icontains=query) |
-        models.Q(email__icontains=query)
-    ).order_by('last_name', 'first_name')[:10]
-    
-    # Construir respuesta
-    results = []
-    for patient in patients:
-        # Obtener tipos de imágenes
-        image_types = set()
-        image_count = patient.medical_images.filter(is_active=True).count()
-        for img in patient.medical_images.filter(is_active=True)[:5]:
-            if img.study_type == 'RX':
-                image_types.add('🩻 RX')
-            elif img.study_type == 'TAC':
-                image_types.add('🔬 TAC')
-            elif img.study_type == 'RMN':
-                image_types.add('🧲 RMN')
-            elif img.study_type == 'ECO':
-                image_types.add('📡 ECO')
-            elif img.study_type == 'MAM':
-                image_types.add('🎗️ MAM')
-            else:
-                image_types.add(f'📋 {img.study_type}')
-        
-        results.append({
-            'id': patient.id,
-            'name': patient.get_full_name(),
-            'identification': patient.identification,
-            'age': patient.get_age(),
-            'gender': patient.get_gender_display_spanish(),
-            'email': patient.email,
-            'phone': patient.phone,
-            'image_count': image_count,
-            'image_types': ', '.join(sorted(list(image_types))[:3]) if image_types else 'Sin imágenes',
-            'url': f'/diagnostico/request/{patient.id}/'
-        })
+    index = get_patient_index()
+    if index is not None:
+        # Candidatos desde el índice en memoria; la BD solo trae las filas a mostrar
+        ids = index.search(query, limit=10)
+        if not ids:
+            return JsonResponse({'patients': []})
+        position = {patient_id: i for i, patient_id in enumerate(ids)}
+        patients = sorted(
+            with_image_summary(Patient.objects.filter(id__in=ids, is_active=True)),
+            key=lambda patient: position[patient.id],
+        )
+    else:
+        patients = with_image_summary(
+            search_patients(Patient.objects.filter(is_active=True), query)
+        )[:10]
+    
+    # Una sola consulta, sin importar cuántos pacientes coincidan
+    results = [
+        {**patient_summary(patient), 'url': f'/diagnostico/request/{patient.id}/'}
+        for patient in patients
+    ]
     
     return JsonResponse({'patients': results})
 
@@ -409,52 +418,20 @@ def get_patient_by_id(request, patient_id):
     if request.user.rol not in ['MEDICO_RADIOLOGO', 'TECNICO_SALUD']:
         return JsonResponse({'error': 'No autorizado'}, status=403)
     
-    try:
-        # Buscar por ID (que puede ser patient.id o patient.identification)
-        try:
-            patient = Patient.objects.get(id=patient_id, is_active=True)
-        except Patient.DoesNotExist:
-            patient = Patient.objects.get(identification=patient_id, is_active=True)
-        
-        # Obtener tipos de imágenes
-        image_types = set()
-        image_count = patient.medical_images.filter(is_active=True).count()
-        for img in patient.medical_images.filter(is_active=True)[:5]:
-            if img.study_type == 'RX':
-                image_types.add('🩻 RX')
-            elif img.study_type == 'TAC':
-                image_types.add('🔬 TAC')
-            elif img.study_type == 'RMN':
-                image_types.add('🧲 RMN')
-            elif img.study_type == 'ECO':
-                image_types.add('📡 ECO')
-            elif img.study_type == 'MAM':
-                image_types.add('🎗️ MAM')
-            else:
-                image_types.add(f'📋 {img.study_type}')
-        
-        return JsonResponse({
-            'patient': {
-                'id': patient.id,
-                'name': patient.get_full_name(),
-                'identification': patient.identification,
-                'age': patient.get_age(),
-                'gender': patient.get_gender_display_spanish(),
-                'email': patient.email,
-                'phone': patient.phone,
-                'image_count': image_count,
-                'image_types': ', '.join(sorted(list(image_types))[:3]) if image_types else 'Sin imágenes',
-            }
-        })
-    except Patient.DoesNotExist:
+    # Buscar por ID (que puede ser patient.id o patient.identification)
+    patient = with_image_summary(Patient.objects.filter(
+        models.Q(id=patient_id) | models.Q(identification=str(patient_id)),
+        is_active=True,
+    )).order_by(
+        # Si ambos coinciden, tiene prioridad el id
+        models.Case(models.When(id=patient_id, then=0), default=1)
+    ).first()
+    if patient is None:
         return JsonResponse({'error': 'Paciente no encontrado'}, status=404)
+    
+    return JsonResponse({'patient': patient_summary(patient)})
 
 
 def get_client_ip(request):
     """Obtiene la dirección IP del cliente"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    return network.get_client_ip(request)
@@ -0,0 +1,75 @@
+# ================================
+# Pool de procesos para la cola de diagnósticos
+# ARCHIVO: diagnostico/workers.py
+# ================================
+# Este módulo no importa modelos al cargarse: los procesos hijos (spawn en
+# Windows) deben configurar Django antes de usarlos.
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(worker_id, stop_event, options):
+    """Punto de entrada de cada proceso worker"""
+    import django
+    django.setup()
+
+    from django.db import connections
+    from .tasks import DiagnosisWorker
+
+    # El proceso padre maneja las señales y avisa mediante stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    try:
+        DiagnosisWorker(worker_id=worker_id, **options).run(stop_event)
+    finally:
+        connections.close_all()
+
+
+class WorkerPool:
+    """Lanza y supervisa N procesos worker locales"""
+
+    def __init__(self, size, **worker_options):
+        self.size = size
+        self.worker_options = worker_options
+        self.context = multiprocessing.get_context()
+        self.stop_event = self.context.Event()
+        self.processes = []
+
+    def _spawn(self, index):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+        process = self.context.Process(
+            target=_worker_main,
+            args=(worker_id, self.stop_event, self.worker_options),
+            name=f'diagnosis-worker-{index}',
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def start(self):
+        # Las conexiones abiertas no deben heredarse al hacer fork
+        from django.db import connections
+        connections.close_all()
+        self.processes = [self._spawn(i) for i in range(self.size)]
+
+    def supervise(self, check_interval=5.0):
+        """Reinicia workers caídos hasta que se solicite detener el pool"""
+        while not self.stop_event.wait(check_interval):
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.warning('Worker %s terminó (código %s), reiniciando',
+                                   process.name, process.exitcode)
+                    self.processes[index] = self._spawn(index)
+
+    def stop(self, timeout=30):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
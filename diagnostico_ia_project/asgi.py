@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'diagnostico_ia_project.settings')
 
 application = get_asgi_application()
+
+# Índice de prefijos de pacientes en memoria (si está activado)
+from users.prefix_index import warm_up  # noqa: E402
+
+warm_up()
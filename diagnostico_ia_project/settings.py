@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     #NUEVOS
     'authentication.middleware.SessionExpirationMiddleware',
+    'authentication.middleware.PasswordHashingBusyMiddleware',
 ]
 
 ROOT_URLCONF = 'diagnostico_ia_project.urls'
@@ -99,6 +100,18 @@ SESSION_COOKIE_SECURE = False  # True en producción con HTTPS
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 SESSION_SAVE_EVERY_REQUEST = False
+# Expiración de la sesión activa guardada en la sesión de Django (authentication/middleware.py)
+SESSION_EXPIRY_CHECK_TTL = 60  # Segundos antes de volver a leer la tabla Session
+SESSION_EXPIRY_NEAR_SECONDS = 60  # Cerca de expirar se lee la tabla en cada petición
+SESSION_INACTIVITY_TIMEOUT = 30 * 60  # Segundos sin actividad antes de cerrar la sesión
+SESSION_ACTIVITY_WRITE_INTERVAL = 300  # Como máximo una escritura de last_activity por sesión en este lapso
+
+# Registros de auditoría Log/DiagnosisLog (authentication/audit.py)
+AUDIT_LOG_ASYNC = True  # Guardar por lotes desde un hilo en segundo plano
+AUDIT_LOG_BATCH_SIZE = 100
+AUDIT_LOG_FLUSH_INTERVAL = 1.0  # Segundos máximos de espera para completar un lote
+AUDIT_LOG_MAX_QUEUE = 10000
+AUDIT_LOG_FALLBACK_PATH = BASE_DIR / 'logs' / 'audit_fallback.jsonl'  # Si falla la BD
 
 # Configuración de contraseñas
 PASSWORD_HASHERS = [
@@ -108,6 +121,39 @@ PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
 ]
 
+# Pool de hash de contraseñas (authentication/hashing.py).
+# Con el pool lleno el login responde 503 con Retry-After en vez de encolarse.
+PASSWORD_HASHING_WORKERS = None  # None = número de CPUs
+PASSWORD_HASHING_MAX_PENDING = None  # None = 4 por hilo
+PASSWORD_HASHING_QUEUE_WAIT = 0.05  # Segundos de espera por un cupo antes de rechazar
+PASSWORD_HASHING_RETRY_AFTER = 2  # Segundos sugeridos al cliente
+
+# Cachés: 'default' es local a cada proceso; 'shared' lo ven todos los procesos
+# (tabla en la base de datos, creada por `migrate`; equivale a `createcachetable`).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'shared_cache',
+    },
+}
+
+# Proxies inversos cuyo X-Forwarded-For se acepta (authentication/network.py).
+# Vacío = la IP del cliente es REMOTE_ADDR.
+TRUSTED_PROXIES = []
+
+# Límite de intentos de login (authentication/throttle.py): (capacidad, fichas por segundo).
+# El caché debe ser compartido para que el límite valga entre procesos.
+LOGIN_THROTTLE_ENABLED = True
+LOGIN_THROTTLE_CACHE = 'shared'
+LOGIN_THROTTLE_RATES = {
+    'ip': (20, 10 / 60),  # 20 seguidos, luego 10 por minuto
+    'email': (5, 1 / 60),  # 5 seguidos, luego 1 por minuto
+}
+LOGIN_THROTTLE_LOG_WINDOW = 300  # Rechazos contados en memoria; un Log por IP/correo y proceso cada 5 minutos
+
 
 
 
@@ -154,11 +200,75 @@ STATICFILES_DIRS = [BASE_DIR / 'static', BASE_DIR / 'core']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Carga por partes de imágenes médicas (medical_images/uploads.py)
+MEDICAL_IMAGE_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # Tamaño sugerido al cliente
+MEDICAL_IMAGE_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB
+MEDICAL_IMAGE_UPLOAD_TEMP_DIR = MEDIA_ROOT / 'uploads_tmp'
+
+# Miniaturas y vistas previas (medical_images/derivatives.py)
+MEDICAL_IMAGE_DERIVATIVE_SIZES = {
+    'thumb': (256, 256),
+    'preview': (1024, 1024),
+}
+MEDICAL_IMAGE_DERIVATIVE_FORMAT = 'WEBP'  # WEBP o JPEG
+MEDICAL_IMAGE_DERIVATIVES_ASYNC = True  # Generar en segundo plano tras la carga
+MEDICAL_IMAGE_DERIVATIVE_WORKERS = 2  # Hilos de generación por proceso
+
+# Pirámide Deep Zoom para el visor (medical_images/tiles.py)
+MEDICAL_IMAGE_TILE_SIZE = 256
+MEDICAL_IMAGE_TILE_OVERLAP = 1
+MEDICAL_IMAGE_TILES_ASYNC = True  # Generar en segundo plano (tras la carga o al primer pedido)
+MEDICAL_IMAGE_TILE_WORKERS = 1  # Hilos de generación por proceso
+MEDICAL_IMAGE_TILES_RETRY_AFTER = 2  # Segundos sugeridos al visor mientras se genera
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cola de diagnósticos IA (python manage.py run_diagnosis_workers)
+DIAGNOSIS_QUEUE_WORKERS = 2  # Procesos worker locales
+DIAGNOSIS_QUEUE_POLL_INTERVAL = 2.0  # Segundos de espera con la cola vacía
+DIAGNOSIS_QUEUE_LEASE_SECONDS = 300  # Tiempo máximo antes de reintentar un trabajo
+DIAGNOSIS_QUEUE_MAX_ATTEMPTS = 3
+
+# Modelos de IA por versión (diagnostico/inference.py). Backends: stub, numpy, onnx.
+# Los workers no arrancan si falta el PATH de algún modelo configurado.
+DIAGNOSIS_MODELS = {
+    'SIMULADO': {
+        'BACKEND': 'stub',
+    },
+    # '1.0.0' queda sin configurar hasta que se publiquen sus pesos: los
+    # diagnósticos de esa versión fallan en vez de recibir resultados del stub.
+    # '1.0.0': {'BACKEND': 'numpy', 'PATH': BASE_DIR / 'ml_models' / 'rx_classifier_1.0.0.npz', 'INPUT_SIZE': (224, 224)},
+}
+DIAGNOSIS_DEFAULT_MODEL_VERSION = 'SIMULADO'
+DIAGNOSIS_MODEL_CACHE_SIZE = 2  # Versiones residentes por proceso (LRU)
+DIAGNOSIS_PRELOAD_MODELS = [DIAGNOSIS_DEFAULT_MODEL_VERSION]  # Se cargan al iniciar cada worker
+
+# Micro-batching: imágenes por pasada del modelo y espera máxima para llenar el lote.
+# Más espera = más imágenes por segundo; menos espera = menor latencia.
+DIAGNOSIS_BATCH_SIZE = 8
+DIAGNOSIS_BATCH_MAX_WAIT = 0.5  # Segundos
+
+# Caché de resultados por imagen (file_hash + modelo + preprocesamiento)
+DIAGNOSIS_RESULT_CACHE_ENABLED = True
+DIAGNOSIS_RESULT_CACHE_MAX_ENTRIES = 100000
+DIAGNOSIS_RESULT_CACHE_EVICT_INTERVAL = 60.0  # Segundos entre conteos de la tabla (expulsión)
+
+# Índice de prefijos en memoria para el autocompletado de pacientes (users/prefix_index.py).
+# La versión que avisa de cambios hechos en otros procesos se guarda en un caché compartido.
+PATIENT_PREFIX_INDEX_ENABLED = False
+PATIENT_PREFIX_INDEX_CACHE = 'shared'
+PATIENT_PREFIX_INDEX_CHECK_INTERVAL = 5.0  # Segundos entre verificaciones de versión
+
+# Exportaciones CSV/XLSX en streaming (users/exports.py)
+EXPORT_CHUNK_SIZE = 2000  # Filas leídas por viaje al cursor de la base de datos
+
+# Contadores del dashboard de administrador (users/dashboard_stats.py)
+DASHBOARD_STATS_CACHE = 'shared'  # Compartido: la invalidación debe llegar a todos los procesos
+DASHBOARD_STATS_TTL = 60  # Segundos; guardar usuarios, diagnósticos o imágenes los invalida antes
+
 
 
 
@@ -185,3 +295,12 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # EMAIL_HOST_USER = 'tu-email@gmail.com'
 # EMAIL_HOST_PASSWORD = 'tu-contraseña-de-app'
 # DEFAULT_FROM_EMAIL = 'Sistema Diagnóstico IA <noreply@diagnostico-ia.com>'
+
+# Bandeja de salida: las vistas encolan los correos y
+# `python manage.py send_queued_email --interval 5` los envía por lotes,
+# una conexión SMTP por lote.
+EMAIL_OUTBOX_BATCH_SIZE = 50  # Correos por conexión
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5  # Intentos antes de marcar el correo como fallido
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = 30  # Espera tras el primer fallo; se duplica en cada intento
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = 3600  # Tope de la espera entre intentos
+EMAIL_OUTBOX_LOCK_SECONDS = 300  # Tras este tiempo otro enviador puede retomar un lote abandonado
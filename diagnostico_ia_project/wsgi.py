@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'diagnostico_ia_project.settings')
 
 application = get_wsgi_application()
+
+# Índice de prefijos de pacientes en memoria (si está activado)
+from users.prefix_index import warm_up  # noqa: E402
+
+warm_up()
@@ -1,3 +1,12 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import DicomMetadata
+
+
+@admin.register(DicomMetadata)
+class DicomMetadataAdmin(admin.ModelAdmin):
+    list_display = ('image', 'modality', 'body_part', 'study_instance_uid', 'rows', 'columns', 'parsed_at')
+    list_filter = ('modality', 'body_part')
+    search_fields = ('study_instance_uid', 'series_instance_uid', 'sop_instance_uid', 'accession_number')
+    readonly_fields = ('parsed_at',)
+    list_select_related = ('image',)
@@ -0,0 +1,167 @@
+# ================================
+# Derivados de imágenes médicas (miniaturas y vistas previas)
+# ARCHIVO: medical_images/derivatives.py
+# ================================
+# Las vistas de listado no deben descargar la radiografía original. Tras la
+# carga se generan versiones reducidas (WebP o JPEG) que se guardan junto al
+# original como "<archivo>.<tipo>.<ext>". Como el original está direccionado
+# por contenido, un derivado nunca cambia y puede cachearse indefinidamente.
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, features
+
+from .preprocessing import WINDOW_PERCENTILES, apply_window, block_reduce, read_image_pixels
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo (ancho, alto) de cada derivado, conservando la proporción
+DEFAULT_SIZES = {
+    'thumb': (256, 256),
+    'preview': (1024, 1024),
+}
+
+CONTENT_TYPES = {
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+
+
+def get_sizes():
+    return getattr(settings, 'MEDICAL_IMAGE_DERIVATIVE_SIZES', DEFAULT_SIZES)
+
+
+def get_format():
+    """Formato de salida; si Pillow no tiene soporte WebP se usa JPEG"""
+    fmt = getattr(settings, 'MEDICAL_IMAGE_DERIVATIVE_FORMAT', 'WEBP').upper()
+    if fmt == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return fmt
+
+
+def get_extension():
+    return 'webp' if get_format() == 'WEBP' else 'jpg'
+
+
+def save_options(fmt):
+    return {'quality': 80, 'method': 4} if fmt == 'WEBP' else {'quality': 85, 'optimize': True}
+
+
+def derivative_name(image, kind):
+    """Ruta relativa a MEDIA_ROOT del derivado `kind` de un MedicalImage"""
+    return f'{image.file_path.name}.{kind}.{get_extension()}'
+
+
+def derivative_path(image, kind):
+    return Path(default_storage.path(derivative_name(image, kind)))
+
+
+def has_derivatives(image):
+    return all(derivative_path(image, kind).exists() for kind in get_sizes())
+
+
+def render(pixels, max_size, modality=None, invert=False):
+    """
+    Convierte un arreglo (H, W) o (H, W, muestras) a imagen PIL de 8 bits en
+    escala de grises que cabe en `max_size`
+    """
+    max_w, max_h = max_size
+    # Reducción entera previa: el redimensionado final trabaja sobre pocos píxeles
+    factor = max(1, min(pixels.shape[0] // max_h, pixels.shape[1] // max_w))
+    reduced = block_reduce(pixels, factor).astype(np.float32, copy=True)
+    low_pct, high_pct = WINDOW_PERCENTILES.get(modality or 'OTHER', WINDOW_PERCENTILES['OTHER'])
+    apply_window(reduced, low_pct, high_pct)
+    if invert:
+        np.subtract(1.0, reduced, out=reduced)
+    reduced *= 255.0
+    img = Image.fromarray(reduced.astype(np.uint8), mode='L')
+    img.thumbnail(max_size, Image.LANCZOS)
+    return img
+
+
+def _save(img, path, fmt):
+    """Escritura atómica: nunca se sirve un derivado a medio escribir"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+    img.save(tmp, format=fmt, **save_options(fmt))
+    os.replace(tmp, path)
+
+
+def generate_derivatives(image, force=False):
+    """
+    Genera todos los derivados de un MedicalImage decodificando el original
+    una sola vez (a la resolución del derivado más grande).
+    Retorna la lista de tipos generados.
+    """
+    sizes = get_sizes()
+    missing = [kind for kind in sizes if force or not derivative_path(image, kind).exists()]
+    if not missing:
+        return []
+
+    fmt = get_format()
+    largest = max((sizes[kind] for kind in missing), key=lambda size: size[0] * size[1])
+    pixels, invert = read_image_pixels(image, target_size=(largest[1], largest[0]))
+    base = render(pixels, largest, image.modality, invert)
+
+    # Del más grande al más pequeño, cada uno a partir del anterior
+    for kind in sorted(missing, key=lambda k: sizes[k][0] * sizes[k][1], reverse=True):
+        img = base.copy()
+        img.thumbnail(sizes[kind], Image.LANCZOS)
+        _save(img, derivative_path(image, kind), fmt)
+        base = img
+    return missing
+
+
+def delete_derivatives(image):
+    for kind in get_sizes():
+        derivative_path(image, kind).unlink(missing_ok=True)
+
+
+# ================================
+# GENERACIÓN ASÍNCRONA
+# ================================
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'MEDICAL_IMAGE_DERIVATIVE_WORKERS', 2),
+            thread_name_prefix='derivatives',
+        )
+    return _executor
+
+
+def _generate_by_id(image_id):
+    from .models import MedicalImage
+
+    close_old_connections()
+    try:
+        image = MedicalImage.objects.filter(pk=image_id).first()
+        if image is not None:
+            generate_derivatives(image)
+    except Exception:
+        logger.exception('No se pudieron generar los derivados de la imagen %s', image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(image):
+    """
+    Programa la generación de derivados cuando la transacción actual confirme.
+    Con MEDICAL_IMAGE_DERIVATIVES_ASYNC = False se generan en el mismo hilo.
+    """
+    if getattr(settings, 'MEDICAL_IMAGE_DERIVATIVES_ASYNC', True):
+        transaction.on_commit(lambda: _get_executor().submit(_generate_by_id, image.pk))
+    else:
+        transaction.on_commit(lambda: _generate_by_id(image.pk))
@@ -0,0 +1,274 @@
+# ================================
+# Lectura del encabezado DICOM (sin datos de píxeles)
+# ARCHIVO: medical_images/dicom.py
+# ================================
+# Parser mínimo en Python puro: recorre los elementos del archivo leyendo
+# solo los valores de los tags que interesan y saltando (seek) el resto.
+# Se detiene al llegar a Pixel Data (7FE0,0010), cuya posición y longitud
+# se registran para poder mapear los píxeles más adelante sin re-parsear.
+
+import struct
+from datetime import date
+
+PIXEL_DATA = (0x7FE0, 0x0010)
+ITEM = (0xFFFE, 0xE000)
+ITEM_DELIMITATION = (0xFFFE, 0xE00D)
+SEQUENCE_DELIMITATION = (0xFFFE, 0xE0DD)
+UNDEFINED_LENGTH = 0xFFFFFFFF
+
+IMPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2'
+EXPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2.1'
+DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2.1.99'
+EXPLICIT_VR_BIG_ENDIAN = '1.2.840.10008.1.2.2'
+
+# Sintaxis cuyos píxeles están sin comprimir (se pueden mapear directamente)
+UNCOMPRESSED_SYNTAXES = {
+    IMPLICIT_VR_LITTLE_ENDIAN,
+    EXPLICIT_VR_LITTLE_ENDIAN,
+    EXPLICIT_VR_BIG_ENDIAN,
+}
+
+# VRs explícitos con 2 bytes reservados y longitud de 4 bytes
+LONG_VRS = {b'OB', b'OD', b'OF', b'OL', b'OV', b'OW', b'SQ', b'UC', b'UN', b'UR', b'UT'}
+
+# Tags que se leen: (grupo, elemento) -> (nombre, VR)
+TAGS = {
+    (0x0002, 0x0010): ('TransferSyntaxUID', 'UI'),
+    (0x0008, 0x0016): ('SOPClassUID', 'UI'),
+    (0x0008, 0x0018): ('SOPInstanceUID', 'UI'),
+    (0x0008, 0x0020): ('StudyDate', 'DA'),
+    (0x0008, 0x0050): ('AccessionNumber', 'SH'),
+    (0x0008, 0x0060): ('Modality', 'CS'),
+    (0x0008, 0x0080): ('InstitutionName', 'LO'),
+    (0x0008, 0x1030): ('StudyDescription', 'LO'),
+    (0x0008, 0x103E): ('SeriesDescription', 'LO'),
+    (0x0018, 0x0015): ('BodyPartExamined', 'CS'),
+    (0x0018, 0x1164): ('ImagerPixelSpacing', 'DS'),
+    (0x0020, 0x000D): ('StudyInstanceUID', 'UI'),
+    (0x0020, 0x000E): ('SeriesInstanceUID', 'UI'),
+    (0x0020, 0x0013): ('InstanceNumber', 'IS'),
+    (0x0028, 0x0002): ('SamplesPerPixel', 'US'),
+    (0x0028, 0x0004): ('PhotometricInterpretation', 'CS'),
+    (0x0028, 0x0008): ('NumberOfFrames', 'IS'),
+    (0x0028, 0x0010): ('Rows', 'US'),
+    (0x0028, 0x0011): ('Columns', 'US'),
+    (0x0028, 0x0030): ('PixelSpacing', 'DS'),
+    (0x0028, 0x0100): ('BitsAllocated', 'US'),
+    (0x0028, 0x0101): ('BitsStored', 'US'),
+    (0x0028, 0x0103): ('PixelRepresentation', 'US'),
+    (0x0028, 0x1050): ('WindowCenter', 'DS'),
+    (0x0028, 0x1051): ('WindowWidth', 'DS'),
+    (0x0028, 0x1052): ('RescaleIntercept', 'DS'),
+    (0x0028, 0x1053): ('RescaleSlope', 'DS'),
+}
+
+# Valores más largos que esto no son de los tags que interesan
+MAX_VALUE_LENGTH = 4096
+
+NUMERIC_FORMATS = {'US': 'H', 'SS': 'h', 'UL': 'I', 'SL': 'i', 'FL': 'f', 'FD': 'd'}
+
+
+class DicomError(Exception):
+    """El archivo no es DICOM o su encabezado no se puede leer"""
+
+
+class DicomHeader:
+    """Elementos leídos del encabezado y ubicación de los datos de píxeles"""
+
+    def __init__(self):
+        self.elements = {}
+        self.transfer_syntax_uid = IMPLICIT_VR_LITTLE_ENDIAN
+        self.pixel_data_offset = None
+        self.pixel_data_length = None
+
+    def get(self, name, default=None):
+        return self.elements.get(name, default)
+
+    def first(self, name, default=None):
+        """Primer valor de un elemento multivalor (por ejemplo WindowCenter)"""
+        value = self.elements.get(name, default)
+        if isinstance(value, list):
+            return value[0] if value else default
+        return value
+
+    @property
+    def little_endian(self):
+        return self.transfer_syntax_uid != EXPLICIT_VR_BIG_ENDIAN
+
+    @property
+    def is_uncompressed(self):
+        return self.transfer_syntax_uid in UNCOMPRESSED_SYNTAXES
+
+    @property
+    def study_date(self):
+        value = self.elements.get('StudyDate')
+        if not value or len(value) < 8 or not value[:8].isdigit():
+            return None
+        try:
+            return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+        except ValueError:
+            return None
+
+    @property
+    def pixel_spacing(self):
+        """(fila, columna) en mm, de PixelSpacing o ImagerPixelSpacing"""
+        spacing = self.elements.get('PixelSpacing') or self.elements.get('ImagerPixelSpacing')
+        if isinstance(spacing, list) and len(spacing) >= 2:
+            return spacing[0], spacing[1]
+        return None, None
+
+
+def _decode_value(raw, vr, endian):
+    if vr in NUMERIC_FORMATS:
+        fmt = NUMERIC_FORMATS[vr]
+        count = len(raw) // struct.calcsize(fmt)
+        values = list(struct.unpack(f'{endian}{count}{fmt}', raw[: count * struct.calcsize(fmt)]))
+        return values[0] if len(values) == 1 else values
+
+    text = raw.decode('latin-1').strip('\x00 ')
+    if vr in ('DS', 'IS'):
+        numbers = []
+        for part in text.split('\\'):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                numbers.append(int(part) if vr == 'IS' else float(part))
+            except ValueError:
+                continue
+        if '\\' in text:
+            return numbers
+        return numbers[0] if numbers else None
+    return text
+
+
+class _Reader:
+    """Recorre los elementos de un archivo abierto en modo binario"""
+
+    def __init__(self, f, header):
+        self.f = f
+        self.header = header
+        self.explicit = True
+        self.endian = '<'
+
+    def read(self, size):
+        data = self.f.read(size)
+        if len(data) < size:
+            raise EOFError
+        return data
+
+    def read_tag(self):
+        group, element = struct.unpack(f'{self.endian}HH', self.read(4))
+        return group, element
+
+    def read_element_header(self):
+        """Retorna (tag, vr, longitud). Los ítems y delimitadores no tienen VR"""
+        tag = self.read_tag()
+        if tag[0] == 0xFFFE:
+            return tag, None, struct.unpack(f'{self.endian}I', self.read(4))[0]
+        if self.explicit:
+            vr = self.read(2)
+            if vr in LONG_VRS:
+                self.read(2)
+                length = struct.unpack(f'{self.endian}I', self.read(4))[0]
+            else:
+                length = struct.unpack(f'{self.endian}H', self.read(2))[0]
+            return tag, vr.decode('latin-1'), length
+        length = struct.unpack(f'{self.endian}I', self.read(4))[0]
+        known = TAGS.get(tag)
+        return tag, known[1] if known else None, length
+
+    def skip_undefined(self):
+        """Salta una secuencia (o valor) de longitud indefinida"""
+        while True:
+            tag, _, length = self.read_element_header()
+            if tag == SEQUENCE_DELIMITATION:
+                return
+            if tag == ITEM:
+                if length == UNDEFINED_LENGTH:
+                    self.skip_item()
+                else:
+                    self.f.seek(length, 1)
+
+    def skip_item(self):
+        while True:
+            tag, _, length = self.read_element_header()
+            if tag == ITEM_DELIMITATION:
+                return
+            if length == UNDEFINED_LENGTH:
+                self.skip_undefined()
+            else:
+                self.f.seek(length, 1)
+
+    def read_elements(self, stop_group=None):
+        """
+        Lee elementos de nivel superior hasta Pixel Data, el fin del archivo
+        o (si se indica) el primer tag de otro grupo.
+        """
+        while True:
+            position = self.f.tell()
+            try:
+                tag, vr, length = self.read_element_header()
+            except EOFError:
+                return
+            if stop_group is not None and tag[0] != stop_group:
+                self.f.seek(position)
+                return
+            if tag == PIXEL_DATA:
+                self.header.pixel_data_offset = self.f.tell()
+                self.header.pixel_data_length = None if length == UNDEFINED_LENGTH else length
+                return
+            if length == UNDEFINED_LENGTH:
+                self.skip_undefined()
+                continue
+
+            known = TAGS.get(tag)
+            if known is None or length > MAX_VALUE_LENGTH:
+                self.f.seek(length, 1)
+                continue
+            name, default_vr = known
+            raw = self.read(length)
+            self.header.elements[name] = _decode_value(raw, vr or default_vr, self.endian)
+
+
+def read_header(f):
+    """
+    Lee el encabezado DICOM de un archivo abierto en modo binario.
+    Solo se leen el preámbulo, los metadatos y los valores de TAGS; los
+    datos de píxeles nunca se cargan.
+    """
+    header = DicomHeader()
+    preamble = f.read(132)
+    if len(preamble) < 132 or preamble[128:132] != b'DICM':
+        raise DicomError('El archivo no tiene el prefijo DICM')
+
+    reader = _Reader(f, header)
+    try:
+        # Metadatos del archivo (grupo 0002): siempre Explicit VR Little Endian
+        reader.read_elements(stop_group=0x0002)
+        header.transfer_syntax_uid = header.elements.pop('TransferSyntaxUID', None) or IMPLICIT_VR_LITTLE_ENDIAN
+
+        if header.transfer_syntax_uid == DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN:
+            raise DicomError('La sintaxis Deflated Explicit VR no está soportada')
+        reader.explicit = header.transfer_syntax_uid != IMPLICIT_VR_LITTLE_ENDIAN
+        reader.endian = '>' if header.transfer_syntax_uid == EXPLICIT_VR_BIG_ENDIAN else '<'
+
+        reader.read_elements()
+    except (EOFError, struct.error):
+        raise DicomError('El encabezado DICOM está truncado o dañado')
+    return header
+
+
+def read_header_from_path(path):
+    with open(path, 'rb') as f:
+        return read_header(f)
+
+
+def is_dicom(f):
+    """Revisa el prefijo DICM sin mover la posición del archivo"""
+    position = f.tell()
+    try:
+        f.seek(128)
+        return f.read(4) == b'DICM'
+    finally:
+        f.seek(position)
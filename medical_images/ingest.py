@@ -0,0 +1,126 @@
+# ================================
+# Ingesta de metadatos DICOM
+# ARCHIVO: medical_images/ingest.py
+# ================================
+# Lee el encabezado de un MedicalImage (sin píxeles), completa modalidad,
+# institución y fecha del estudio, y guarda el resto de los tags en
+# DicomMetadata.
+
+import logging
+
+from django.db import transaction
+
+from .dicom import DicomError, read_header
+from .models import DicomMetadata, MedicalImage
+
+logger = logging.getLogger(__name__)
+
+# Modalidades DICOM que tienen equivalente en MedicalImage.MODALITY_CHOICES
+KNOWN_MODALITIES = {code for code, _ in MedicalImage.MODALITY_CHOICES}
+
+
+def _text(header, name, max_length):
+    value = header.first(name, '')
+    return str(value)[:max_length] if value is not None else ''
+
+
+def _int(header, name, default=None):
+    value = header.first(name)
+    try:
+        return int(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _float(header, name, default=None):
+    value = header.first(name)
+    try:
+        return float(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def read_image_header(image):
+    """Encabezado DICOM de un MedicalImage, o None si el archivo no es DICOM"""
+    try:
+        with image.file_path.open('rb') as f:
+            return read_header(f)
+    except DicomError:
+        return None
+
+
+def metadata_fields(header):
+    """Campos de DicomMetadata a partir de un encabezado"""
+    spacing_row, spacing_column = header.pixel_spacing
+    return {
+        'study_instance_uid': _text(header, 'StudyInstanceUID', 64),
+        'series_instance_uid': _text(header, 'SeriesInstanceUID', 64),
+        'sop_instance_uid': _text(header, 'SOPInstanceUID', 64),
+        'sop_class_uid': _text(header, 'SOPClassUID', 64),
+        'accession_number': _text(header, 'AccessionNumber', 16),
+        'instance_number': _int(header, 'InstanceNumber'),
+        'modality': _text(header, 'Modality', 16),
+        'body_part': _text(header, 'BodyPartExamined', 64),
+        'series_description': _text(header, 'SeriesDescription', 255),
+        'rows': _int(header, 'Rows'),
+        'columns': _int(header, 'Columns'),
+        'number_of_frames': _int(header, 'NumberOfFrames', 1),
+        'samples_per_pixel': _int(header, 'SamplesPerPixel', 1),
+        'bits_allocated': _int(header, 'BitsAllocated'),
+        'bits_stored': _int(header, 'BitsStored'),
+        'pixel_representation': _int(header, 'PixelRepresentation', 0),
+        'photometric_interpretation': _text(header, 'PhotometricInterpretation', 16),
+        'pixel_spacing_row': spacing_row,
+        'pixel_spacing_column': spacing_column,
+        'window_center': _float(header, 'WindowCenter'),
+        'window_width': _float(header, 'WindowWidth'),
+        'rescale_slope': _float(header, 'RescaleSlope', 1.0),
+        'rescale_intercept': _float(header, 'RescaleIntercept', 0.0),
+        'transfer_syntax_uid': header.transfer_syntax_uid,
+        'pixel_data_offset': header.pixel_data_offset,
+        'pixel_data_length': header.pixel_data_length,
+        'tags': header.elements,
+    }
+
+
+def ingest_dicom(image):
+    """
+    Lee el encabezado del archivo y actualiza el MedicalImage y su
+    DicomMetadata. El encabezado DICOM es la fuente de verdad para la
+    modalidad, la institución y la fecha del estudio cuando los trae.
+    Retorna el DicomMetadata, o None si el archivo no es DICOM.
+    """
+    header = read_image_header(image)
+    if header is None:
+        return None
+
+    update_fields = []
+    modality = _text(header, 'Modality', 16).upper()
+    if modality:
+        image.modality = modality if modality in KNOWN_MODALITIES else 'OTHER'
+        update_fields.append('modality')
+    institution = _text(header, 'InstitutionName', 255)
+    if institution:
+        image.institution = institution
+        update_fields.append('institution')
+    if header.study_date is not None:
+        image.study_date = header.study_date
+        update_fields.append('study_date')
+    if not image.study_description and header.first('StudyDescription'):
+        image.study_description = _text(header, 'StudyDescription', 1000)
+        update_fields.append('study_description')
+    if update_fields:
+        image.save(update_fields=update_fields)
+
+    metadata, _ = DicomMetadata.objects.update_or_create(image=image, defaults=metadata_fields(header))
+    return metadata
+
+
+def safe_ingest_dicom(image):
+    """Como ingest_dicom, pero un encabezado dañado no interrumpe la carga"""
+    try:
+        with transaction.atomic():
+            return ingest_dicom(image)
+    except Exception:
+        logger.exception('No se pudo leer el encabezado DICOM de la imagen %s', image.pk)
+        return None
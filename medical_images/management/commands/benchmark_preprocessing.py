@@ -0,0 +1,74 @@
+import io
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+from django.core.management.base import BaseCommand
+
+from medical_images.preprocessing import Preprocessor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark del preprocesamiento: imágenes por segundo y memoria pico'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=32, help='Imágenes sintéticas a procesar')
+        parser.add_argument('--source-size', type=int, default=2048, help='Lado de la imagen original (px)')
+        parser.add_argument('--input-size', type=int, default=224, help='Lado de la entrada del modelo (px)')
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--format', choices=['PNG', 'JPEG'], default='PNG')
+        parser.add_argument('--bits', type=int, choices=[8, 16], default=8)
+
+    def make_images(self, options):
+        """Radiografías sintéticas codificadas en memoria"""
+        rng = np.random.default_rng(0)
+        size = options['source_size']
+        max_value = 255 if options['bits'] == 8 else 65535
+        dtype = np.uint8 if options['bits'] == 8 else np.uint16
+        encoded = []
+        for _ in range(options['images']):
+            # Gradiente + ruido para que la ventana de percentiles trabaje
+            gradient = np.linspace(0, max_value * 0.8, size, dtype=np.float32)
+            pixels = gradient[None, :] + rng.normal(0, max_value * 0.05, (size, size))
+            pixels = np.clip(pixels, 0, max_value).astype(dtype)
+            buffer = io.BytesIO()
+            fmt = options['format'] if options['bits'] == 8 else 'PNG'
+            Image.fromarray(pixels).save(buffer, format=fmt)
+            encoded.append(buffer.getvalue())
+        return encoded
+
+    def handle(self, *args, **options):
+        encoded = self.make_images(options)
+        input_size = (options['input_size'], options['input_size'])
+        preprocessor = Preprocessor(input_size, batch_size=options['batch_size'])
+        batch = np.zeros((options['batch_size'],) + input_size, dtype=np.float32)
+
+        # Calentamiento (planes de interpolación, importaciones)
+        preprocessor.process_into(batch[0], io.BytesIO(encoded[0]), modality='CR')
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        for index, data in enumerate(encoded):
+            row = index % options['batch_size']
+            preprocessor.process_into(batch[row], io.BytesIO(data), modality='CR')
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        total = len(encoded)
+        self.stdout.write(
+            f'{total} imágenes {options["source_size"]}x{options["source_size"]} '
+            f'({options["format"]}, {options["bits"]} bits) -> {input_size[0]}x{input_size[1]}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Imágenes por segundo: {total / elapsed:.1f}'))
+        self.stdout.write(f'Tiempo medio por imagen: {elapsed / total * 1000:.2f} ms')
+        self.stdout.write(f'Memoria pico (tracemalloc): {peak / 1024 / 1024:.1f} MB')
+        if resource is not None:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(f'RSS máximo del proceso: {max_rss:.1f} MB')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from medical_images.derivatives import generate_derivatives
+from medical_images.models import MedicalImage
+
+
+class Command(BaseCommand):
+    help = 'Genera miniaturas y vistas previas de las imágenes existentes que no las tengan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerar aunque ya existan')
+        parser.add_argument('--patient', type=int, help='Solo las imágenes de este paciente')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Filas leídas por consulta')
+
+    def handle(self, *args, **options):
+        images = MedicalImage.objects.filter(is_active=True).only('id', 'file_path', 'file_hash', 'modality')
+        if options['patient']:
+            images = images.filter(patient_id=options['patient'])
+
+        generated = skipped = failed = 0
+        for image in images.order_by('id').iterator(chunk_size=options['chunk_size']):
+            try:
+                kinds = generate_derivatives(image, force=options['force'])
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Imagen {image.id}: {e}')
+                continue
+            if kinds:
+                generated += 1
+            else:
+                skipped += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Derivados generados: {generated} | ya existentes: {skipped} | errores: {failed}'
+        ))
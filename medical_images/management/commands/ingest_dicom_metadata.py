@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from medical_images.ingest import safe_ingest_dicom
+from medical_images.models import MedicalImage
+
+
+class Command(BaseCommand):
+    help = 'Lee el encabezado DICOM de las imágenes existentes y llena DicomMetadata'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Volver a leer imágenes que ya tienen metadatos')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Filas leídas por consulta')
+
+    def handle(self, *args, **options):
+        images = MedicalImage.objects.filter(is_active=True)
+        if not options['force']:
+            images = images.filter(dicom__isnull=True)
+
+        ingested = skipped = 0
+        for image in images.order_by('id').iterator(chunk_size=options['chunk_size']):
+            if safe_ingest_dicom(image) is None:
+                skipped += 1
+            else:
+                ingested += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Encabezados leídos: {ingested} | sin DICOM o con errores: {skipped}'
+        ))
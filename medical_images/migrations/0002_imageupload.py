@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0003_rolepermission'),
+        ('medical_images', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('study_type', models.CharField(choices=[('RX', 'Radiografía'), ('TAC', 'Tomografía (TAC)'), ('RMN', 'Resonancia Magnética'), ('ECO', 'Ecografía'), ('MAM', 'Mamografía'), ('OTHER', 'Otro')], default='OTHER', max_length=10, verbose_name='Tipo de Estudio')),
+                ('study_date', models.DateField(verbose_name='Fecha del Estudio')),
+                ('study_description', models.TextField(blank=True, null=True, verbose_name='Descripción del Estudio')),
+                ('modality', models.CharField(blank=True, choices=[('CR', 'Radiografía Digital (CR)'), ('DR', 'Radiografía Directa (DR)'), ('CT', 'Tomografía Computarizada (CT)'), ('MR', 'Resonancia Magnética (MR)'), ('US', 'Ultrasonido (US)'), ('XC', 'Radiografía Externa (XC)'), ('OTHER', 'Otra')], max_length=10, null=True, verbose_name='Modalidad')),
+                ('institution', models.CharField(blank=True, max_length=255, null=True, verbose_name='Institución')),
+                ('filename', models.CharField(max_length=255, verbose_name='Nombre del Archivo')),
+                ('total_size', models.BigIntegerField(verbose_name='Tamaño Total (bytes)')),
+                ('received_bytes', models.BigIntegerField(default=0, verbose_name='Bytes Recibidos')),
+                ('status', models.CharField(choices=[('UPLOADING', 'Cargando'), ('COMPLETED', 'Completada'), ('FAILED', 'Error')], default='UPLOADING', max_length=20, verbose_name='Estado')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+                ('medical_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='medical_images.medicalimage')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to='users.patient')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Carga de Imagen',
+                'verbose_name_plural': 'Cargas de Imágenes',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['uploaded_by', 'status'], name='medical_ima_uploade_b5d5a2_idx'), models.Index(fields=['status', 'updated_at'], name='medical_ima_status_0c4d93_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_images', '0002_imageupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='medicalimage',
+            name='file_hash',
+            field=models.CharField(db_index=True, max_length=256, verbose_name='Hash del Archivo'),
+        ),
+        migrations.AddConstraint(
+            model_name='medicalimage',
+            constraint=models.UniqueConstraint(fields=('patient', 'file_hash'), name='unique_patient_image'),
+        ),
+    ]
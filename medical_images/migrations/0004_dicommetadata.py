@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_images', '0003_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DicomMetadata',
+            fields=[
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dicom', serialize=False, to='medical_images.medicalimage')),
+                ('study_instance_uid', models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Study Instance UID')),
+                ('series_instance_uid', models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Series Instance UID')),
+                ('sop_instance_uid', models.CharField(blank=True, db_index=True, max_length=64, verbose_name='SOP Instance UID')),
+                ('sop_class_uid', models.CharField(blank=True, max_length=64, verbose_name='SOP Class UID')),
+                ('accession_number', models.CharField(blank=True, db_index=True, max_length=16, verbose_name='Número de Acceso')),
+                ('instance_number', models.IntegerField(blank=True, null=True, verbose_name='Número de Instancia')),
+                ('modality', models.CharField(blank=True, max_length=16, verbose_name='Modalidad DICOM')),
+                ('body_part', models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Parte del Cuerpo')),
+                ('series_description', models.CharField(blank=True, max_length=255, verbose_name='Descripción de la Serie')),
+                ('rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='Filas')),
+                ('columns', models.PositiveIntegerField(blank=True, null=True, verbose_name='Columnas')),
+                ('number_of_frames', models.PositiveIntegerField(default=1, verbose_name='Número de Cuadros')),
+                ('samples_per_pixel', models.PositiveSmallIntegerField(default=1, verbose_name='Muestras por Píxel')),
+                ('bits_allocated', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Bits Asignados')),
+                ('bits_stored', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Bits Almacenados')),
+                ('pixel_representation', models.PositiveSmallIntegerField(default=0, verbose_name='Representación de Píxel')),
+                ('photometric_interpretation', models.CharField(blank=True, max_length=16, verbose_name='Interpretación Fotométrica')),
+                ('pixel_spacing_row', models.FloatField(blank=True, null=True, verbose_name='Espaciado de Píxel - Fila (mm)')),
+                ('pixel_spacing_column', models.FloatField(blank=True, null=True, verbose_name='Espaciado de Píxel - Columna (mm)')),
+                ('window_center', models.FloatField(blank=True, null=True, verbose_name='Centro de Ventana')),
+                ('window_width', models.FloatField(blank=True, null=True, verbose_name='Ancho de Ventana')),
+                ('rescale_slope', models.FloatField(default=1.0, verbose_name='Pendiente de Reescalado')),
+                ('rescale_intercept', models.FloatField(default=0.0, verbose_name='Intercepto de Reescalado')),
+                ('transfer_syntax_uid', models.CharField(blank=True, max_length=64, verbose_name='Transfer Syntax UID')),
+                ('pixel_data_offset', models.BigIntegerField(blank=True, null=True, verbose_name='Offset de Pixel Data')),
+                ('pixel_data_length', models.BigIntegerField(blank=True, null=True, verbose_name='Longitud de Pixel Data')),
+                ('tags', models.JSONField(blank=True, default=dict, verbose_name='Tags')),
+                ('parsed_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de Lectura')),
+            ],
+            options={
+                'verbose_name': 'Metadatos DICOM',
+                'verbose_name_plural': 'Metadatos DICOM',
+                'indexes': [models.Index(fields=['modality', 'body_part'], name='medical_ima_modalit_76c6aa_idx')],
+            },
+        ),
+    ]
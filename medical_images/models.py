@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from users.models import Patient
 from authentication.models import User
@@ -36,7 +38,9 @@ class MedicalImage(models.Model):
     
     # Archivo
     file_path = models.FileField('Archivo', upload_to='medical_images/%Y/%m/%d/')
-    file_hash = models.CharField('Hash del Archivo', max_length=256, unique=True, db_index=True)
+    # SHA-256 del contenido; el archivo se guarda una sola vez en storage.py
+    # aunque varios pacientes referencien los mismos bytes
+    file_hash = models.CharField('Hash del Archivo', max_length=256, db_index=True)
     file_size = models.BigIntegerField('Tamaño del Archivo (bytes)', default=0)
     
     # Metadatos DICOM
@@ -54,6 +58,9 @@ class MedicalImage(models.Model):
             models.Index(fields=['study_type']),
             models.Index(fields=['uploaded_at']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'file_hash'], name='unique_patient_image'),
+        ]
         verbose_name = 'Imagen Médica'
         verbose_name_plural = 'Imágenes Médicas'
     
@@ -63,3 +70,111 @@ class MedicalImage(models.Model):
     def get_study_type_display(self):
         """Devuelve el nombre legible del tipo de estudio"""
         return dict(self.STUDY_TYPES).get(self.study_type, self.study_type)
+
+
+class ImageUpload(models.Model):
+    """
+    Carga por partes (chunked) y reanudable de una imagen médica.
+    El MedicalImage se crea solo al finalizar la carga.
+    """
+    
+    STATUS_CHOICES = (
+        ('UPLOADING', 'Cargando'),
+        ('COMPLETED', 'Completada'),
+        ('FAILED', 'Error'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='image_uploads')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='image_uploads')
+    
+    # Datos del estudio que se copiarán al MedicalImage
+    study_type = models.CharField('Tipo de Estudio', max_length=10, choices=MedicalImage.STUDY_TYPES, default='OTHER')
+    study_date = models.DateField('Fecha del Estudio')
+    study_description = models.TextField('Descripción del Estudio', blank=True, null=True)
+    modality = models.CharField('Modalidad', max_length=10, choices=MedicalImage.MODALITY_CHOICES, blank=True, null=True)
+    institution = models.CharField('Institución', max_length=255, blank=True, null=True)
+    
+    # Progreso de la carga
+    filename = models.CharField('Nombre del Archivo', max_length=255)
+    total_size = models.BigIntegerField('Tamaño Total (bytes)')
+    received_bytes = models.BigIntegerField('Bytes Recibidos', default=0)
+    status = models.CharField('Estado', max_length=20, choices=STATUS_CHOICES, default='UPLOADING')
+    medical_image = models.ForeignKey(MedicalImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    
+    created_at = models.DateTimeField('Fecha de Creación', auto_now_add=True)
+    updated_at = models.DateTimeField('Fecha de Actualización', auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['uploaded_by', 'status']),
+            models.Index(fields=['status', 'updated_at']),
+        ]
+        verbose_name = 'Carga de Imagen'
+        verbose_name_plural = 'Cargas de Imágenes'
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size} bytes)"
+    
+    @property
+    def is_complete(self):
+        return self.received_bytes >= self.total_size
+
+
+class DicomMetadata(models.Model):
+    """
+    Tags del encabezado DICOM de una imagen, en columnas indexadas.
+    Se llenan al finalizar la carga leyendo solo el encabezado, de modo que
+    listar y filtrar estudios nunca necesita abrir los archivos de píxeles.
+    """
+    
+    image = models.OneToOneField(MedicalImage, on_delete=models.CASCADE, primary_key=True, related_name='dicom')
+    
+    # Identificadores
+    study_instance_uid = models.CharField('Study Instance UID', max_length=64, blank=True, db_index=True)
+    series_instance_uid = models.CharField('Series Instance UID', max_length=64, blank=True, db_index=True)
+    sop_instance_uid = models.CharField('SOP Instance UID', max_length=64, blank=True, db_index=True)
+    sop_class_uid = models.CharField('SOP Class UID', max_length=64, blank=True)
+    accession_number = models.CharField('Número de Acceso', max_length=16, blank=True, db_index=True)
+    instance_number = models.IntegerField('Número de Instancia', null=True, blank=True)
+    
+    # Estudio
+    modality = models.CharField('Modalidad DICOM', max_length=16, blank=True)
+    body_part = models.CharField('Parte del Cuerpo', max_length=64, blank=True, db_index=True)
+    series_description = models.CharField('Descripción de la Serie', max_length=255, blank=True)
+    
+    # Geometría y codificación de los píxeles
+    rows = models.PositiveIntegerField('Filas', null=True, blank=True)
+    columns = models.PositiveIntegerField('Columnas', null=True, blank=True)
+    number_of_frames = models.PositiveIntegerField('Número de Cuadros', default=1)
+    samples_per_pixel = models.PositiveSmallIntegerField('Muestras por Píxel', default=1)
+    bits_allocated = models.PositiveSmallIntegerField('Bits Asignados', null=True, blank=True)
+    bits_stored = models.PositiveSmallIntegerField('Bits Almacenados', null=True, blank=True)
+    pixel_representation = models.PositiveSmallIntegerField('Representación de Píxel', default=0)
+    photometric_interpretation = models.CharField('Interpretación Fotométrica', max_length=16, blank=True)
+    pixel_spacing_row = models.FloatField('Espaciado de Píxel - Fila (mm)', null=True, blank=True)
+    pixel_spacing_column = models.FloatField('Espaciado de Píxel - Columna (mm)', null=True, blank=True)
+    window_center = models.FloatField('Centro de Ventana', null=True, blank=True)
+    window_width = models.FloatField('Ancho de Ventana', null=True, blank=True)
+    rescale_slope = models.FloatField('Pendiente de Reescalado', default=1.0)
+    rescale_intercept = models.FloatField('Intercepto de Reescalado', default=0.0)
+    
+    # Ubicación de los datos de píxeles dentro del archivo
+    transfer_syntax_uid = models.CharField('Transfer Syntax UID', max_length=64, blank=True)
+    pixel_data_offset = models.BigIntegerField('Offset de Pixel Data', null=True, blank=True)
+    pixel_data_length = models.BigIntegerField('Longitud de Pixel Data', null=True, blank=True)
+    
+    # Todos los tags leídos, para consultas poco frecuentes
+    tags = models.JSONField('Tags', default=dict, blank=True)
+    parsed_at = models.DateTimeField('Fecha de Lectura', auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['modality', 'body_part']),
+        ]
+        verbose_name = 'Metadatos DICOM'
+        verbose_name_plural = 'Metadatos DICOM'
+    
+    def __str__(self):
+        return f"DICOM {self.sop_instance_uid or self.image_id}"
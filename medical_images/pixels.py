@@ -0,0 +1,147 @@
+# ================================
+# Acceso a píxeles mapeados en memoria (sin copia)
+# ARCHIVO: medical_images/pixels.py
+# ================================
+# Para DICOM sin comprimir y archivos .npy los píxeles ya están en el archivo
+# en el formato que usa NumPy: en vez de leerlos a memoria se mapea la región
+# de Pixel Data con np.memmap. Recortar, reducir o generar teselas solo toca
+# las páginas del archivo que realmente se usan, y el sistema operativo puede
+# liberarlas cuando haga falta.
+#
+# Los formatos comprimidos (PNG, JPEG, DICOM comprimido) no se pueden mapear;
+# en ese caso open_pixel_source retorna None y se decodifican con Pillow.
+
+import os
+
+import numpy as np
+
+from .dicom import UNCOMPRESSED_SYNTAXES, EXPLICIT_VR_BIG_ENDIAN, DicomError, read_header
+
+NPY_MAGIC = b'\x93NUMPY'
+
+
+class PixelSource:
+    """
+    Píxeles mapeados de un archivo: `array` tiene forma (cuadros, filas,
+    columnas) o (cuadros, filas, columnas, muestras) y no ocupa memoria
+    propia hasta que se leen sus páginas.
+    """
+
+    def __init__(self, array, invert=False):
+        self.array = array
+        # MONOCHROME1: valores altos se muestran oscuros
+        self.invert = invert
+
+    @property
+    def shape(self):
+        return self.array.shape[1:3]
+
+    def frame(self, index=0):
+        return self.array[index]
+
+
+def _pixel_dtype(bits_allocated, pixel_representation, big_endian):
+    kinds = {8: 'u1', 16: 'u2', 32: 'u4'}
+    if bits_allocated not in kinds:
+        return None
+    code = kinds[bits_allocated]
+    if pixel_representation == 1:
+        code = code.replace('u', 'i')
+    return np.dtype(('>' if big_endian else '<') + code)
+
+
+def _map_dicom(path, layout):
+    """Mapea Pixel Data según la geometría del encabezado, o None si no aplica"""
+    if layout['transfer_syntax_uid'] not in UNCOMPRESSED_SYNTAXES:
+        return None
+    if layout['pixel_data_offset'] is None or not layout['rows'] or not layout['columns']:
+        return None
+
+    dtype = _pixel_dtype(
+        layout['bits_allocated'],
+        layout['pixel_representation'] or 0,
+        layout['transfer_syntax_uid'] == EXPLICIT_VR_BIG_ENDIAN,
+    )
+    if dtype is None:
+        return None
+
+    frames = max(1, layout['number_of_frames'] or 1)
+    samples = max(1, layout['samples_per_pixel'] or 1)
+    shape = (frames, layout['rows'], layout['columns']) + ((samples,) if samples > 1 else ())
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    if layout['pixel_data_offset'] + nbytes > os.path.getsize(path):
+        return None
+
+    array = np.memmap(path, dtype=dtype, mode='r', offset=layout['pixel_data_offset'], shape=shape)
+    return PixelSource(array, invert=layout['photometric_interpretation'] == 'MONOCHROME1')
+
+
+def layout_from_metadata(metadata):
+    return {
+        'transfer_syntax_uid': metadata.transfer_syntax_uid,
+        'pixel_data_offset': metadata.pixel_data_offset,
+        'rows': metadata.rows,
+        'columns': metadata.columns,
+        'number_of_frames': metadata.number_of_frames,
+        'samples_per_pixel': metadata.samples_per_pixel,
+        'bits_allocated': metadata.bits_allocated,
+        'pixel_representation': metadata.pixel_representation,
+        'photometric_interpretation': metadata.photometric_interpretation,
+    }
+
+
+def layout_from_header(header):
+    def first(name, default=None):
+        value = header.first(name, default)
+        return default if value is None else value
+
+    return {
+        'transfer_syntax_uid': header.transfer_syntax_uid,
+        'pixel_data_offset': header.pixel_data_offset,
+        'rows': first('Rows'),
+        'columns': first('Columns'),
+        'number_of_frames': first('NumberOfFrames', 1),
+        'samples_per_pixel': first('SamplesPerPixel', 1),
+        'bits_allocated': first('BitsAllocated'),
+        'pixel_representation': first('PixelRepresentation', 0),
+        'photometric_interpretation': first('PhotometricInterpretation', ''),
+    }
+
+
+def open_path(path, metadata=None):
+    """
+    Mapea los píxeles del archivo en `path`. Usa `metadata` (DicomMetadata)
+    si se entrega; si no, lee el encabezado (unos pocos KB).
+    Retorna un PixelSource o None si el archivo no se puede mapear.
+    """
+    with open(path, 'rb') as f:
+        start = f.read(132)
+        if start.startswith(NPY_MAGIC):
+            array = np.load(path, mmap_mode='r', allow_pickle=False)
+            if array.ndim == 2:
+                array = array[None]
+            return PixelSource(array) if array.ndim in (3, 4) else None
+        if start[128:132] != b'DICM':
+            return None
+        if metadata is None or metadata.pixel_data_offset is None:
+            f.seek(0)
+            try:
+                layout = layout_from_header(read_header(f))
+            except DicomError:
+                return None
+        else:
+            layout = layout_from_metadata(metadata)
+    return _map_dicom(path, layout)
+
+
+def open_pixel_source(image):
+    """PixelSource de un MedicalImage, o None si debe decodificarse"""
+    try:
+        path = image.file_path.path
+    except (NotImplementedError, ValueError):
+        # Almacenamiento sin rutas locales (por ejemplo S3)
+        return None
+    # Solo se usa DicomMetadata si ya viene cargado (select_related): mapear
+    # no debe costar una consulta por imagen
+    metadata = image._state.fields_cache.get('dicom')
+    return open_path(path, metadata)
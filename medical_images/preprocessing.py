@@ -0,0 +1,217 @@
+# ================================
+# Preprocesamiento vectorizado de radiografías
+# ARCHIVO: medical_images/preprocessing.py
+# ================================
+# Decodifica el archivo de un MedicalImage y lo deja listo para el modelo:
+# escala de grises -> reducción -> redimensionado bilineal -> ventana de
+# intensidad según la modalidad -> normalización en [0, 1].
+# Todas las etapas operan sobre arreglos NumPy y escriben en buffers
+# reutilizables, sin bucles por píxel en Python. Los archivos sin comprimir
+# llegan como np.memmap (ver pixels.py) y solo se leen las filas necesarias.
+
+import hashlib
+import json
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from .pixels import open_pixel_source
+
+
+# Ventana de intensidad por modalidad como percentiles (bajo, alto).
+# Las radiografías usan casi todo el rango; ecografías y RM tienen más ruido
+# en los extremos.
+WINDOW_PERCENTILES = {
+    'CR': (0.5, 99.5),
+    'DR': (0.5, 99.5),
+    'XC': (0.5, 99.5),
+    'CT': (1.0, 99.0),
+    'MR': (1.0, 99.0),
+    'US': (2.0, 98.0),
+    'OTHER': (0.5, 99.5),
+}
+
+# Coeficientes de luminancia ITU-R BT.601
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Los percentiles se estiman sobre una submuestra de píxeles
+PERCENTILE_STRIDE = 4
+
+# Filas de salida por franja en block_reduce
+BLOCK_STRIP_ROWS = 64
+
+
+def decode(source, target_size=None):
+    """
+    Decodifica una imagen (ruta o archivo abierto) como arreglo 2D.
+    Para JPEG se pide al decodificador una versión reducida (draft), lo que
+    evita decodificar la resolución completa cuando no hace falta.
+    """
+    with Image.open(source) as img:
+        if target_size is not None and img.format == 'JPEG':
+            img.draft('L', (target_size[1], target_size[0]))
+        if img.mode in ('I;16', 'I;16B', 'I;16L'):
+            return np.asarray(img, dtype=np.uint16)
+        if img.mode in ('L', 'I', 'F'):
+            return np.asarray(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        return to_grayscale(np.asarray(img))
+
+
+def read_image_pixels(image, target_size=None):
+    """
+    Píxeles 2D de un MedicalImage y si deben invertirse (MONOCHROME1).
+    DICOM sin comprimir y .npy se mapean sin copia; el resto se decodifica.
+    """
+    source = open_pixel_source(image)
+    if source is not None:
+        return source.frame(0), source.invert
+    with image.file_path.open('rb') as f:
+        return decode(f, target_size=target_size), False
+
+
+def to_grayscale(pixels):
+    """Convierte (H, W, 3|4) a (H, W) float32 con un producto vectorial"""
+    if pixels.ndim == 2:
+        return pixels
+    return pixels[..., :3] @ LUMA_WEIGHTS
+
+
+def block_reduce(pixels, factor, strip_rows=BLOCK_STRIP_ROWS):
+    """
+    Promedia bloques factor x factor (reducción sin aliasing por enteros).
+    Se procesa por franjas de filas: con un arreglo mapeado (np.memmap) solo
+    una franja del original está en memoria a la vez. Con varias muestras por
+    píxel (H, W, 3|4) cada franja se pasa antes a escala de grises.
+    """
+    if factor <= 1:
+        return to_grayscale(pixels)
+    oh, ow = pixels.shape[0] // factor, pixels.shape[1] // factor
+    out = np.empty((oh, ow), dtype=np.float32)
+    for start in range(0, oh, strip_rows):
+        stop = min(oh, start + strip_rows)
+        strip = to_grayscale(pixels[start * factor:stop * factor, :ow * factor])
+        blocks = strip.reshape(stop - start, factor, ow, factor)
+        out[start:stop] = blocks.mean(axis=(1, 3), dtype=np.float32)
+    return out
+
+
+@lru_cache(maxsize=64)
+def _bilinear_plan(in_size, out_size):
+    """Índices y pesos de interpolación para un eje (se reutilizan por forma)"""
+    scale = in_size / out_size
+    coords = (np.arange(out_size, dtype=np.float32) + 0.5) * scale - 0.5
+    coords = np.clip(coords, 0, in_size - 1)
+    low = np.floor(coords).astype(np.intp)
+    high = np.minimum(low + 1, in_size - 1)
+    weight = (coords - low).astype(np.float32)
+    return low, high, weight
+
+
+def resize_bilinear(pixels, out_shape, out=None):
+    """
+    Redimensiona (..., H, W) a (..., oh, ow) con interpolación bilineal
+    separable. Acepta una pila de imágenes de la misma forma.
+    """
+    oh, ow = out_shape
+    y0, y1, wy = _bilinear_plan(pixels.shape[-2], oh)
+    x0, x1, wx = _bilinear_plan(pixels.shape[-1], ow)
+
+    top = pixels[..., y0, :].astype(np.float32, copy=False)
+    rows = top + (pixels[..., y1, :] - top) * wy[:, None]
+    left = rows[..., x0]
+    if out is None:
+        out = np.empty(pixels.shape[:-2] + (oh, ow), dtype=np.float32)
+    np.subtract(rows[..., x1], left, out=out)
+    out *= wx
+    out += left
+    return out
+
+
+def apply_window(pixels, low_pct, high_pct):
+    """Ventana de intensidad por percentiles, escalada a [0, 1] en el mismo buffer"""
+    sample = pixels[..., ::PERCENTILE_STRIDE, ::PERCENTILE_STRIDE]
+    low, high = np.percentile(sample, (low_pct, high_pct))
+    if high <= low:
+        pixels.fill(0.0)
+        return pixels
+    pixels -= low
+    pixels *= 1.0 / (high - low)
+    np.clip(pixels, 0.0, 1.0, out=pixels)
+    return pixels
+
+
+class Preprocessor:
+    """
+    Pipeline de preprocesamiento con buffer de salida reutilizable.
+
+    `process_into` escribe una imagen directamente en una fila de un tensor
+    existente (por ejemplo el lote del modelo); `process_batch` llena y
+    retorna una vista del buffer interno.
+    """
+
+    version = 1
+
+    def __init__(self, input_size=(224, 224), batch_size=8, window_percentiles=None):
+        self.input_size = tuple(input_size)
+        self.window_percentiles = dict(WINDOW_PERCENTILES, **(window_percentiles or {}))
+        self._buffer = np.zeros((batch_size,) + self.input_size, dtype=np.float32)
+
+    @property
+    def config(self):
+        return {
+            'version': self.version,
+            'input_size': list(self.input_size),
+            'window_percentiles': {k: list(v) for k, v in sorted(self.window_percentiles.items())},
+        }
+
+    def config_key(self):
+        """Huella corta de la configuración (para cachés de resultados)"""
+        payload = json.dumps(self.config, sort_keys=True).encode()
+        return hashlib.sha256(payload).hexdigest()[:16]
+
+    def process_array(self, pixels, modality=None, out=None):
+        """Preprocesa un arreglo 2D ya decodificado"""
+        pixels = to_grayscale(pixels)
+        oh, ow = self.input_size
+        factor = min(pixels.shape[0] // oh, pixels.shape[1] // ow)
+        reduced = block_reduce(pixels, factor)
+        out = resize_bilinear(reduced, self.input_size, out=out)
+        low_pct, high_pct = self.window_percentiles.get(modality or 'OTHER', WINDOW_PERCENTILES['OTHER'])
+        return apply_window(out, low_pct, high_pct)
+
+    def process_into(self, out, source, modality=None):
+        """Decodifica `source` y escribe el resultado en `out` (H, W)"""
+        pixels = decode(source, target_size=self.input_size)
+        return self.process_array(pixels, modality=modality, out=out)
+
+    def process_image(self, image, out=None):
+        """Preprocesa un MedicalImage (mapeado en memoria cuando se puede)"""
+        if out is None:
+            out = np.empty(self.input_size, dtype=np.float32)
+        pixels, invert = read_image_pixels(image, target_size=self.input_size)
+        result = self.process_array(pixels, modality=image.modality, out=out)
+        if invert:
+            np.subtract(1.0, result, out=result)
+        return result
+
+    def process_batch(self, images):
+        """Preprocesa varios MedicalImage en el buffer interno y retorna la vista"""
+        if len(images) > len(self._buffer):
+            self._buffer = np.zeros((len(images),) + self.input_size, dtype=np.float32)
+        for row, image in enumerate(images):
+            self.process_image(image, out=self._buffer[row])
+        return self._buffer[:len(images)]
+
+
+_preprocessors = {}
+
+
+def get_preprocessor(input_size):
+    """Preprocesador compartido por el proceso para un tamaño de entrada"""
+    input_size = tuple(input_size)
+    if input_size not in _preprocessors:
+        _preprocessors[input_size] = Preprocessor(input_size)
+    return _preprocessors[input_size]
@@ -0,0 +1,186 @@
+// ================================
+// Visor Deep Zoom (DZI) para radiografías grandes
+// ARCHIVO: medical_images/static/medical_images/js/dzi_viewer.js
+// ================================
+// Solo descarga las teselas visibles del nivel que corresponde al zoom
+// actual. Arrastrar para desplazar, rueda del mouse para acercar/alejar,
+// doble clic para volver a ajustar la imagen.
+
+(function () {
+    'use strict';
+
+    class DziViewer {
+        constructor(container, dziUrl) {
+            this.container = container;
+            this.dziUrl = dziUrl;
+            this.tilesUrl = dziUrl.replace(/\.dzi$/, '_files/');
+            this.tiles = new Map();
+            this.layer = document.createElement('div');
+            this.layer.style.cssText = 'position:absolute;inset:0;overflow:hidden;cursor:grab;background:#000;';
+            this.container.style.position = 'relative';
+            this.container.appendChild(this.layer);
+        }
+
+        async open() {
+            let response = await fetch(this.dziUrl, { credentials: 'same-origin' });
+            // 503: la pirámide se está generando en el servidor
+            for (let attempt = 0; response.status === 503 && attempt < 30; attempt++) {
+                const wait = parseInt(response.headers.get('Retry-After'), 10) || 2;
+                await new Promise((resolve) => setTimeout(resolve, wait * 1000));
+                response = await fetch(this.dziUrl, { credentials: 'same-origin' });
+            }
+            if (!response.ok) throw new Error('No se pudo cargar la imagen');
+            const xml = new DOMParser().parseFromString(await response.text(), 'application/xml');
+            const image = xml.documentElement;
+            const size = image.getElementsByTagName('Size')[0];
+            this.format = image.getAttribute('Format');
+            this.tileSize = parseInt(image.getAttribute('TileSize'), 10);
+            this.overlap = parseInt(image.getAttribute('Overlap'), 10);
+            this.width = parseInt(size.getAttribute('Width'), 10);
+            this.height = parseInt(size.getAttribute('Height'), 10);
+            this.maxLevel = Math.ceil(Math.log2(Math.max(this.width, this.height)));
+            this.bindEvents();
+            this.fit();
+        }
+
+        fit() {
+            const { clientWidth: w, clientHeight: h } = this.container;
+            // scale = píxeles de pantalla por píxel de la imagen original
+            this.scale = Math.min(w / this.width, h / this.height);
+            this.x = (this.width - w / this.scale) / 2;
+            this.y = (this.height - h / this.scale) / 2;
+            this.render();
+        }
+
+        zoomAt(factor, screenX, screenY) {
+            const minScale = Math.min(this.container.clientWidth / this.width, this.container.clientHeight / this.height) / 2;
+            const scale = Math.min(Math.max(this.scale * factor, minScale), 8);
+            // El punto bajo el cursor queda fijo
+            this.x += screenX / this.scale - screenX / scale;
+            this.y += screenY / this.scale - screenY / scale;
+            this.scale = scale;
+            this.render();
+        }
+
+        bindEvents() {
+            let drag = null;
+            this.layer.addEventListener('pointerdown', (e) => {
+                drag = { x: e.clientX, y: e.clientY };
+                this.layer.setPointerCapture(e.pointerId);
+                this.layer.style.cursor = 'grabbing';
+            });
+            this.layer.addEventListener('pointermove', (e) => {
+                if (!drag) return;
+                this.x -= (e.clientX - drag.x) / this.scale;
+                this.y -= (e.clientY - drag.y) / this.scale;
+                drag = { x: e.clientX, y: e.clientY };
+                this.render();
+            });
+            this.layer.addEventListener('pointerup', () => {
+                drag = null;
+                this.layer.style.cursor = 'grab';
+            });
+            this.layer.addEventListener('wheel', (e) => {
+                e.preventDefault();
+                const rect = this.layer.getBoundingClientRect();
+                this.zoomAt(e.deltaY < 0 ? 1.25 : 0.8, e.clientX - rect.left, e.clientY - rect.top);
+            }, { passive: false });
+            this.layer.addEventListener('dblclick', () => this.fit());
+            window.addEventListener('resize', () => this.render());
+        }
+
+        render() {
+            // Nivel cuya resolución alcanza para la escala actual (sin pasarse)
+            const level = Math.max(0, Math.min(this.maxLevel, this.maxLevel + Math.ceil(Math.log2(this.scale))));
+            const levelScale = Math.pow(2, level - this.maxLevel);
+            const levelWidth = Math.ceil(this.width * levelScale);
+            const levelHeight = Math.ceil(this.height * levelScale);
+            const ts = this.tileSize;
+            const viewW = this.container.clientWidth / this.scale;
+            const viewH = this.container.clientHeight / this.scale;
+
+            const col0 = Math.max(0, Math.floor(this.x * levelScale / ts));
+            const row0 = Math.max(0, Math.floor(this.y * levelScale / ts));
+            const col1 = Math.min(Math.ceil(levelWidth / ts) - 1, Math.floor((this.x + viewW) * levelScale / ts));
+            const row1 = Math.min(Math.ceil(levelHeight / ts) - 1, Math.floor((this.y + viewH) * levelScale / ts));
+
+            const visible = new Set();
+            for (let row = row0; row <= row1; row++) {
+                for (let col = col0; col <= col1; col++) {
+                    const key = `${level}/${col}_${row}`;
+                    visible.add(key);
+                    let img = this.tiles.get(key);
+                    if (!img) {
+                        img = document.createElement('img');
+                        img.draggable = false;
+                        img.style.cssText = 'position:absolute;max-width:none;user-select:none;pointer-events:none;';
+                        img.src = `${this.tilesUrl}${key}.${this.format}`;
+                        this.tiles.set(key, img);
+                        this.layer.appendChild(img);
+                    }
+                    // Posición de la tesela (sin solapamiento) en coordenadas de pantalla
+                    const ox = col > 0 ? this.overlap : 0;
+                    const oy = row > 0 ? this.overlap : 0;
+                    const factor = this.scale / levelScale;
+                    img.style.left = `${((col * ts - ox) / levelScale - this.x) * this.scale}px`;
+                    img.style.top = `${((row * ts - oy) / levelScale - this.y) * this.scale}px`;
+                    img.style.transformOrigin = '0 0';
+                    img.style.transform = `scale(${factor})`;
+                }
+            }
+
+            // Se descartan las teselas que ya no se ven (incluidas las de otros niveles)
+            for (const [key, img] of this.tiles) {
+                if (!visible.has(key)) {
+                    img.remove();
+                    this.tiles.delete(key);
+                }
+            }
+        }
+
+        destroy() {
+            this.layer.remove();
+            this.tiles.clear();
+        }
+    }
+
+    // Abre el visor en un modal a pantalla completa
+    function openDziViewer(dziUrl, title) {
+        const overlay = document.createElement('div');
+        overlay.style.cssText = 'position:fixed;inset:0;z-index:2000;background:rgba(15,23,42,0.95);display:flex;flex-direction:column;';
+        const header = document.createElement('div');
+        header.style.cssText = 'display:flex;justify-content:space-between;align-items:center;padding:0.75rem 1rem;color:#e2e8f0;';
+        header.innerHTML = '<span></span><button type="button" class="btn btn-secondary">Cerrar ✕</button>';
+        header.querySelector('span').textContent = title || '';
+        const stage = document.createElement('div');
+        stage.style.cssText = 'flex:1;';
+        overlay.append(header, stage);
+        document.body.appendChild(overlay);
+
+        const viewer = new DziViewer(stage, dziUrl);
+        const close = () => {
+            viewer.destroy();
+            overlay.remove();
+            document.removeEventListener('keydown', onKey);
+        };
+        const onKey = (e) => { if (e.key === 'Escape') close(); };
+        header.querySelector('button').addEventListener('click', close);
+        document.addEventListener('keydown', onKey);
+        viewer.open().catch((err) => {
+            stage.textContent = err.message;
+            stage.style.cssText += 'color:#e2e8f0;display:flex;align-items:center;justify-content:center;';
+        });
+        return viewer;
+    }
+
+    // Enlaces con data-dzi abren el visor en vez de la vista previa
+    document.addEventListener('click', (e) => {
+        const link = e.target.closest('[data-dzi]');
+        if (!link) return;
+        e.preventDefault();
+        openDziViewer(link.dataset.dzi, link.dataset.title);
+    });
+
+    window.DziViewer = DziViewer;
+    window.openDziViewer = openDziViewer;
+})();
@@ -16,7 +16,11 @@
     let successModal, duplicateModal;
     
     // API Endpoints
-    const API_UPLOAD_URL = '/api/images/upload/';
+    const API_UPLOAD_URL = '/medical-images/api/uploads/';
+    const MAX_CHUNK_RETRIES = 3;
+    // Solo se calcula el hash en el navegador para archivos hasta este tamaño
+    // (crypto.subtle necesita el archivo completo en memoria)
+    const HASH_PROBE_MAX_SIZE = 256 * 1024 * 1024;
     const API_PATIENTS_URL = '/diagnostico/api/autocomplete-patients/';
     
     // Variables de estado
@@ -555,9 +559,10 @@
             return;
         }
         
-        // Preparar FormData
+        // Datos del estudio (el archivo se envía por partes)
         const formData = new FormData();
-        formData.append('image_file', selectedFile);
+        formData.append('filename', selectedFile.name);
+        formData.append('file_size', selectedFile.size);
         formData.append('patient_id', patientIdInput.value);
         formData.append('study_type', document.getElementById('study_type').value);
         formData.append('study_date', document.getElementById('study_date').value);
@@ -570,19 +575,7 @@
             setLoadingState(true);
             showProgressBar();
             
-            // Simular progreso
-            simulateProgress();
-            
-            const response = await fetch(API_UPLOAD_URL, {
-                method: 'POST',
-                headers: {
-                    'Authorization': `Bearer ${getAuthToken()}`,
-                    'X-CSRFToken': getCSRFToken()
-                },
-                body: formData
-            });
-            
-            const data = await response.json();
+            const { response, data } = await uploadInChunks(selectedFile, formData);
             
             if (response.status === 409) {
                 // Imagen duplicada
@@ -604,6 +597,74 @@
         }
     }
 
+    // ========== Carga por partes (reanudable) ==========
+    async function computeSHA256(file) {
+        if (!window.crypto || !window.crypto.subtle || file.size > HASH_PROBE_MAX_SIZE) return null;
+        const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function uploadInChunks(file, formData) {
+        const headers = { 'X-CSRFToken': getCSRFToken() };
+
+        // 0. Consultar si el servidor ya tiene este contenido; si es así la
+        //    carga se completa sin enviar el archivo
+        const sha256 = await computeSHA256(file).catch(() => null);
+        if (sha256) {
+            const params = new URLSearchParams({ sha256, patient_id: formData.get('patient_id') || '' });
+            const probe = await fetch(`${API_UPLOAD_URL}probe/?${params}`, { headers });
+            if (probe.ok && (await probe.json()).exists) formData.append('sha256', sha256);
+        }
+
+        // 1. Iniciar la carga
+        let response = await fetch(API_UPLOAD_URL, { method: 'POST', headers, body: formData });
+        let data = await response.json();
+        if (!response.ok) return { response, data };
+
+        const uploadUrl = `${API_UPLOAD_URL}${data.upload_id}/`;
+        const chunkSize = data.chunk_size;
+        let offset = data.status === 'COMPLETED' ? file.size : data.offset;
+        let retries = 0;
+
+        // 2. Enviar las partes en orden; ante un error se consulta el offset y se reanuda
+        while (offset < file.size) {
+            const end = Math.min(offset + chunkSize, file.size);
+            try {
+                response = await fetch(uploadUrl, {
+                    method: 'PUT',
+                    headers: {
+                        ...headers,
+                        'Content-Type': 'application/octet-stream',
+                        'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`
+                    },
+                    body: file.slice(offset, end)
+                });
+                data = await response.json();
+            } catch (err) {
+                if (++retries > MAX_CHUNK_RETRIES) throw err;
+                response = await fetch(uploadUrl, { headers });
+                data = await response.json();
+                offset = data.offset;
+                continue;
+            }
+
+            if (response.ok) {
+                offset = data.offset;
+                retries = 0;
+                setProgress(offset / file.size);
+            } else if (response.status === 409 && typeof data.offset === 'number' && ++retries <= MAX_CHUNK_RETRIES) {
+                offset = data.offset;
+            } else {
+                return { response, data };
+            }
+        }
+
+        // 3. Finalizar: el servidor verifica el hash y crea la imagen
+        response = await fetch(`${uploadUrl}complete/`, { method: 'POST', headers });
+        data = await response.json();
+        return { response, data };
+    }
+
     // ========== Manejo de Respuestas ==========
     function handleUploadSuccess(data) {
         // Mostrar modal de éxito. Si no hay mensaje en la respuesta, usar uno por defecto.
@@ -712,18 +773,9 @@
         }, 500);
     }
 
-    function simulateProgress() {
-        let progress = 0;
+    function setProgress(fraction) {
         const progressBar = document.getElementById('progress-bar');
-        
-        const interval = setInterval(() => {
-            progress += Math.random() * 15;
-            if (progress > 95) {
-                progress = 95;
-                clearInterval(interval);
-            }
-            progressBar.style.width = `${progress}%`;
-        }, 200);
+        progressBar.style.width = `${Math.round(fraction * 100)}%`;
     }
 
     // ========== Loading State ==========
@@ -816,10 +868,6 @@
         updateCharCount();
     };
 
-    function getAuthToken() {
-        return localStorage.getItem('access_token') || sessionStorage.getItem('access_token') || '';
-    }
-
     function getCSRFToken() {
         return document.querySelector('[name=csrfmiddlewaretoken]')?.value || '';
     }
@@ -0,0 +1,64 @@
+# ================================
+# Almacenamiento direccionado por contenido
+# ARCHIVO: medical_images/storage.py
+# ================================
+# Los archivos se guardan bajo MEDIA_ROOT/cas/ab/cd/<sha256>, donde "ab" y
+# "cd" son los primeros caracteres del hash. Bytes idénticos se guardan una
+# sola vez aunque varios MedicalImage (incluso de distintos pacientes) los
+# referencien.
+
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+
+CAS_PREFIX = 'cas'
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_valid_hash(file_hash):
+    return bool(file_hash) and bool(SHA256_RE.match(file_hash))
+
+
+def blob_name(file_hash):
+    """Ruta relativa a MEDIA_ROOT del contenido con ese hash"""
+    if not is_valid_hash(file_hash):
+        raise ValueError(f'Hash SHA-256 inválido: {file_hash!r}')
+    return f'{CAS_PREFIX}/{file_hash[:2]}/{file_hash[2:4]}/{file_hash}'
+
+
+def blob_path(file_hash):
+    return Path(settings.MEDIA_ROOT) / blob_name(file_hash)
+
+
+def blob_exists(file_hash):
+    return is_valid_hash(file_hash) and blob_path(file_hash).is_file()
+
+
+def blob_size(file_hash):
+    return blob_path(file_hash).stat().st_size
+
+
+def store_blob(source, file_hash):
+    """
+    Mueve el archivo `source` (ya verificado con `file_hash`) a su ubicación
+    direccionada por contenido. Si el contenido ya existe, `source` se descarta.
+    Retorna la ruta relativa a MEDIA_ROOT para guardar en el FileField.
+    Si `source` ya no existe pero el contenido sí, otra finalización de la
+    misma carga lo movió antes: se considera ya almacenado.
+    """
+    destination = blob_path(file_hash)
+    if destination.exists():
+        Path(source).unlink(missing_ok=True)
+    else:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # os.replace es atómico: dos cargas simultáneas del mismo contenido
+        # dejan un único archivo completo
+        try:
+            os.replace(source, destination)
+        except FileNotFoundError:
+            if not destination.exists():
+                raise
+    return blob_name(file_hash)
@@ -1,3 +1,435 @@
-from django.test import TestCase
+import hashlib
+import io
+import shutil
+import struct
+import tempfile
+from datetime import date
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from authentication.models import User
+from users.models import Patient
+from .derivatives import get_extension, has_derivatives, render
+from .dicom import read_header
+from .models import DicomMetadata, ImageUpload, MedicalImage
+from .preprocessing import Preprocessor, block_reduce, resize_bilinear
+from .pixels import open_path, open_pixel_source
+from . import tiles
+from .tiles import descriptor_path, ensure_pyramid, level_size
+from .uploads import finalize_upload, hash_states, write_chunk
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_technician(**fields):
+    """Técnico de salud de prueba; `fields` reemplaza los datos por defecto"""
+    data = {
+        'email': 'tech@example.com',
+        'first_name': 'Tech',
+        'last_name': 'User',
+        'identificacion': 'TECH1',
+        'rol': 'TECNICO_SALUD',
+    }
+    data.update(fields)
+    return User.objects.create_user(password='testpassword', **data)
+
+
+def dicom_element(group, element, vr, value):
+    """Elemento Explicit VR Little Endian"""
+    if isinstance(value, str):
+        value = value.encode('ascii')
+        if len(value) % 2:
+            value += b'\x00' if vr == 'UI' else b' '
+    header = struct.pack('<HH', group, element) + vr.encode('ascii')
+    if vr in ('OB', 'OW', 'SQ', 'UN', 'UT'):
+        return header + b'\x00\x00' + struct.pack('<I', len(value)) + value
+    return header + struct.pack('<H', len(value)) + value
+
+
+def make_dicom(pixels, **tags):
+    """
+    Archivo DICOM Part 10 mínimo con píxeles de 16 bits sin comprimir;
+    `pixels` de forma (filas, columnas, 3) se guarda como RGB
+    """
+    meta = dicom_element(0x0002, 0x0010, 'UI', '1.2.840.10008.1.2.1')
+    # Una secuencia de longitud indefinida que el parser debe saltar
+    sequence = (
+        struct.pack('<HH', 0x0008, 0x1140) + b'SQ\x00\x00' + struct.pack('<I', 0xFFFFFFFF)
+        + struct.pack('<HHI', 0xFFFE, 0xE000, 0xFFFFFFFF)
+        + dicom_element(0x0008, 0x1150, 'UI', '1.2.3')
+        + struct.pack('<HHI', 0xFFFE, 0xE00D, 0)
+        + struct.pack('<HHI', 0xFFFE, 0xE0DD, 0)
+    )
+    rows, columns = pixels.shape[:2]
+    samples = pixels.shape[2] if pixels.ndim == 3 else 1
+    image_pixel = [
+        dicom_element(0x0028, 0x0002, 'US', struct.pack('<H', samples)),
+        dicom_element(0x0028, 0x0004, 'CS', 'RGB' if samples > 1 else 'MONOCHROME2'),
+    ]
+    dataset = b''.join([
+        dicom_element(0x0008, 0x0020, 'DA', tags.get('study_date', '20240315')),
+        dicom_element(0x0008, 0x0060, 'CS', tags.get('modality', 'CR')),
+        dicom_element(0x0008, 0x0080, 'LO', tags.get('institution', 'Hospital Central')),
+        sequence,
+        dicom_element(0x0018, 0x0015, 'CS', tags.get('body_part', 'CHEST')),
+        dicom_element(0x0020, 0x000D, 'UI', tags.get('study_uid', '1.2.826.0.1.1')),
+        dicom_element(0x0020, 0x000E, 'UI', tags.get('series_uid', '1.2.826.0.1.1.1')),
+        *image_pixel,
+        dicom_element(0x0028, 0x0010, 'US', struct.pack('<H', rows)),
+        dicom_element(0x0028, 0x0011, 'US', struct.pack('<H', columns)),
+        dicom_element(0x0028, 0x0030, 'DS', '0.14\\0.15'),
+        dicom_element(0x0028, 0x0100, 'US', struct.pack('<H', 16)),
+        dicom_element(0x0028, 0x0101, 'US', struct.pack('<H', 12)),
+        dicom_element(0x0028, 0x0103, 'US', struct.pack('<H', 0)),
+    ])
+    prefix = b'\x00' * 128 + b'DICM' + meta + dataset
+    pixel_data = dicom_element(0x7FE0, 0x0010, 'OW', pixels.astype('<u2').tobytes())
+    return prefix + pixel_data, len(prefix) + 12
+
+
+class PreprocessingTests(SimpleTestCase):
+    def encode(self, pixels, fmt='PNG'):
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format=fmt)
+        buffer.seek(0)
+        return buffer
+
+    def test_process_into_writes_normalized_values_into_given_buffer(self):
+        pixels = np.tile(np.arange(0, 256, 2, dtype=np.uint8), (300, 3))
+        batch = np.zeros((2, 64, 64), dtype=np.float32)
+        result = Preprocessor((64, 64)).process_into(batch[1], self.encode(pixels), modality='CR')
+
+        self.assertTrue(np.shares_memory(result, batch))
+        self.assertEqual(result.shape, (64, 64))
+        self.assertAlmostEqual(float(batch[1].min()), 0.0)
+        self.assertAlmostEqual(float(batch[1].max()), 1.0)
+        self.assertFalse(batch[0].any())
+
+    def test_rgb_is_converted_to_grayscale(self):
+        rgb = np.zeros((128, 128, 3), dtype=np.uint8)
+        rgb[:, 64:] = 200
+        result = Preprocessor((32, 32)).process_into(np.empty((32, 32), np.float32), self.encode(rgb))
+        self.assertLess(result[:, :8].mean(), 0.1)
+        self.assertGreater(result[:, -8:].mean(), 0.9)
+
+    def test_multi_sample_pixels_render_as_one_channel(self):
+        rgb = np.zeros((600, 400, 3), dtype=np.uint16)
+        rgb[:, 200:] = 3000
+
+        self.assertEqual(block_reduce(rgb, 4).shape, (150, 100))
+        thumb = render(rgb, (100, 100))
+        self.assertEqual((thumb.mode, thumb.size), ('L', (67, 100)))
+        pixels = np.asarray(thumb)
+        self.assertLess(pixels[:, :20].mean(), pixels[:, -20:].mean())
+
+    def test_resize_bilinear_handles_a_stack(self):
+        stack = np.random.default_rng(0).random((3, 40, 50), dtype=np.float32)
+        resized = resize_bilinear(stack, (20, 25))
+        self.assertEqual(resized.shape, (3, 20, 25))
+        np.testing.assert_allclose(resized[1], resize_bilinear(stack[1], (20, 25)), rtol=1e-6)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDICAL_IMAGE_UPLOAD_TEMP_DIR=Path(MEDIA_ROOT) / 'tmp')
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = create_technician()
+        self.patient = Patient.objects.create(
+            identification='P3001',
+            first_name='Paciente',
+            last_name='Carga',
+            date_of_birth=date(1990, 5, 5),
+            gender='M',
+            created_by=self.user,
+        )
+        self.client.force_login(self.user)
+        self.content = bytes(range(256)) * 40
+
+    def start(self, patient=None, **extra):
+        response = self.client.post(reverse('medical_images:upload_start'), {
+            'patient_id': (patient or self.patient).id,
+            'study_type': 'RX',
+            'study_date': '2025-01-10',
+            'filename': 'torax.dcm',
+            'file_size': len(self.content),
+            **extra,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put(self, upload_id, start, end):
+        return self.client.put(
+            reverse('medical_images:upload_chunk', args=[upload_id]),
+            data=self.content[start:end],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(self.content)}',
+        )
+
+    def test_chunks_are_hashed_while_streaming_and_image_created_on_complete(self):
+        upload_id = self.start()['upload_id']
+        self.assertEqual(self.put(upload_id, 0, 4000).json()['offset'], 4000)
+
+        # Una parte fuera de orden se rechaza indicando desde dónde reanudar
+        response = self.put(upload_id, 8000, len(self.content))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4000)
+
+        self.assertFalse(MedicalImage.objects.exists())
+        self.assertEqual(self.put(upload_id, 4000, len(self.content)).status_code, 200)
+
+        response = self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 201)
+        image = MedicalImage.objects.get()
+        self.assertEqual(image.file_hash, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(image.file_size, len(self.content))
+        with image.file_path.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(ImageUpload.objects.get().status, 'COMPLETED')
+
+    def test_duplicate_content_is_rejected_on_complete(self):
+        for expected in (201, 409):
+            upload_id = self.start()['upload_id']
+            self.put(upload_id, 0, len(self.content))
+            response = self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+            self.assertEqual(response.status_code, expected)
+        self.assertEqual(MedicalImage.objects.count(), 1)
+
+    def test_identical_content_is_stored_once_across_patients(self):
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, len(self.content))
+        self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+        sha256 = hashlib.sha256(self.content).hexdigest()
+
+        other = Patient.objects.create(
+            identification='P3002',
+            first_name='Otro',
+            last_name='Paciente',
+            date_of_birth=date(1985, 3, 3),
+            gender='F',
+            created_by=self.user,
+        )
+        probe = self.client.get(reverse('medical_images:upload_probe'),
+                                {'sha256': sha256, 'patient_id': other.id}).json()
+        self.assertTrue(probe['exists'])
+        self.assertFalse(probe['duplicate'])
+
+        # Con el hash conocido la carga se completa sin enviar bytes
+        data = self.start(patient=other, sha256=sha256)
+        self.assertEqual(data['status'], 'COMPLETED')
+
+        first, second = MedicalImage.objects.order_by('id')
+        self.assertEqual(second.patient, other)
+        self.assertEqual(first.file_path.name, second.file_path.name)
+        self.assertEqual(first.file_path.name, f'cas/{sha256[:2]}/{sha256[2:4]}/{sha256}')
+        blobs = [p for p in (Path(MEDIA_ROOT) / 'cas').rglob(f'{sha256}*') if p.is_file()]
+        self.assertEqual([p.name for p in blobs], [sha256])
+
+    def test_racing_copies_of_a_chunk_do_not_corrupt_the_hash(self):
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, 4000)
+        upload = ImageUpload.objects.get(pk=upload_id)
+
+        # Dos peticiones con la misma parte leen el estado antes de que
+        # cualquiera avance la carga; la segunda pierde el compare-and-swap
+        first = hash_states.get(upload)
+        second = hash_states.get(upload)
+        self.assertIsNot(first, second)
+        write_chunk(upload, 4000, io.BytesIO(self.content[4000:]), len(self.content) - 4000)
+        second.update(self.content[4000:])
+
+        response = self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(MedicalImage.objects.get().file_hash, hashlib.sha256(self.content).hexdigest())
+
+    def test_finalizing_twice_returns_the_same_image(self):
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, len(self.content))
+        stale = ImageUpload.objects.get(pk=upload_id)
+
+        image = finalize_upload(ImageUpload.objects.get(pk=upload_id))
+        # La segunda llamada llega con la fila leída antes de la primera
+        self.assertEqual(finalize_upload(stale), image)
+        self.assertEqual(MedicalImage.objects.count(), 1)
+
+    def test_known_hash_from_another_uploader_requires_the_bytes(self):
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, len(self.content))
+        self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+        sha256 = hashlib.sha256(self.content).hexdigest()
+
+        other_user = create_technician(
+            email='tech2@example.com', first_name='Otro', last_name='Tecnico', identificacion='TECH2',
+        )
+        other = Patient.objects.create(
+            identification='P3003',
+            first_name='Otro',
+            last_name='Paciente',
+            date_of_birth=date(1985, 3, 3),
+            gender='F',
+            created_by=other_user,
+        )
+        self.client.force_login(other_user)
+        probe = self.client.get(reverse('medical_images:upload_probe'),
+                                {'sha256': sha256, 'patient_id': other.id}).json()
+        self.assertFalse(probe['exists'])
+        self.assertIsNone(probe['size'])
+
+        # El hash no basta: la carga queda esperando los bytes
+        data = self.start(patient=other, sha256=sha256)
+        self.assertEqual(data['status'], 'UPLOADING')
+        self.assertEqual(MedicalImage.objects.count(), 1)
+
+        self.put(data['upload_id'], 0, len(self.content))
+        response = self.client.post(reverse('medical_images:upload_complete', args=[data['upload_id']]))
+        self.assertEqual(response.status_code, 201)
+        first, second = MedicalImage.objects.order_by('id')
+        self.assertEqual(first.file_path.name, second.file_path.name)
+
+    @override_settings(MEDICAL_IMAGE_DERIVATIVES_ASYNC=False, MEDICAL_IMAGE_TILES_ASYNC=False)
+    def test_thumbnail_is_generated_after_upload_and_cached_by_the_browser(self):
+        pixels = np.tile(np.linspace(0, 255, 600, dtype=np.uint8), (400, 1))
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='PNG')
+        self.content = buffer.getvalue()
+
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, len(self.content))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+        image = MedicalImage.objects.get()
+        self.assertTrue(has_derivatives(image))
+
+        url = reverse('medical_images:image_derivative', args=[image.id, 'thumb'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as thumb:
+            self.assertEqual(thumb.size, (256, 171))
+
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Otro técnico no ve la imagen, ni siquiera con el ETag; un radiólogo sí
+        self.client.force_login(create_technician(email='tech2@example.com', identificacion='TECH2'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 403)
+        self.client.force_login(create_technician(
+            email='doc@example.com', identificacion='DOC1', rol='MEDICO_RADIOLOGO',
+        ))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_tile_pyramid_is_generated_in_the_background_and_served_per_level(self):
+        pixels = np.random.default_rng(0).integers(0, 255, (400, 600), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='PNG')
+        self.content = buffer.getvalue()
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, len(self.content))
+        self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+        image = MedicalImage.objects.get()
+        self.assertFalse(descriptor_path(image).exists())
+
+        # La petición no genera la pirámide: la programa y responde 503
+        jobs = []
+        executor = mock.Mock(submit=lambda function, *args: jobs.append((function, args)))
+        dzi_url = reverse('medical_images:image_dzi', args=[image.id])
+        with mock.patch.object(tiles, '_get_executor', return_value=executor):
+            response = self.client.get(dzi_url)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '2')
+            self.assertEqual(self.client.get(dzi_url).status_code, 503)
+        self.assertEqual(len(jobs), 1)
+        function, args = jobs[0]
+        function(*args)
+        self.assertEqual(tiles._locks, {})
+
+        response = self.client.get(dzi_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Width="600" Height="400"', b''.join(response.streaming_content))
+        self.assertEqual(level_size(600, 400, 8), (150, 100))
+
+        # Nivel completo (10): 3x2 teselas; la última incluye 1px de solapamiento
+        ext = get_extension()
+        response = self.client.get(reverse('medical_images:image_tile', args=[image.id, 10, 2, 1, ext]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as tile:
+            self.assertEqual(tile.size, (600 - 511, 400 - 255))
+
+        response = self.client.get(reverse('medical_images:image_tile', args=[image.id, 0, 0, 0, ext]))
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as tile:
+            self.assertEqual(tile.size, (1, 1))
+        response = self.client.get(reverse('medical_images:image_tile', args=[image.id, 10, 3, 0, ext]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_dicom_header_is_indexed_without_reading_pixel_data(self):
+        pixels = np.arange(64 * 48, dtype=np.uint16).reshape(64, 48)
+        self.content, pixel_offset = make_dicom(pixels)
+
+        header = read_header(io.BytesIO(self.content))
+        self.assertEqual(header.pixel_data_offset, pixel_offset)
+        self.assertEqual(header.pixel_data_length, pixels.nbytes)
+
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, len(self.content))
+        self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+
+        image = MedicalImage.objects.get()
+        self.assertEqual(image.modality, 'CR')
+        self.assertEqual(image.institution, 'Hospital Central')
+        self.assertEqual(image.study_date, date(2024, 3, 15))
+
+        metadata = DicomMetadata.objects.get(body_part='CHEST', study_instance_uid='1.2.826.0.1.1')
+        self.assertEqual(metadata.image, image)
+        self.assertEqual((metadata.rows, metadata.columns), (64, 48))
+        self.assertEqual((metadata.pixel_spacing_row, metadata.pixel_spacing_column), (0.14, 0.15))
+        self.assertEqual(metadata.pixel_data_offset, pixel_offset)
+
+    def test_uncompressed_dicom_pixels_are_memory_mapped(self):
+        pixels = np.arange(64 * 48, dtype=np.uint16).reshape(64, 48)
+        self.content, _ = make_dicom(pixels)
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, len(self.content))
+        self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+
+        image = MedicalImage.objects.select_related('dicom').get()
+        source = open_pixel_source(image)
+        self.assertIsInstance(source.array, np.memmap)
+        np.testing.assert_array_equal(source.frame(0), pixels)
+
+        # El preprocesamiento y las teselas leen el DICOM sin pasar por Pillow
+        result = Preprocessor((16, 16)).process_image(image)
+        self.assertLess(result[0].mean(), result[-1].mean())
+        self.assertEqual(ensure_pyramid(image), (48, 64))
+
+        np.save(Path(MEDIA_ROOT) / 'pixels.npy', pixels)
+        source = open_path(Path(MEDIA_ROOT) / 'pixels.npy')
+        self.assertIsInstance(source.array, np.memmap)
+        self.assertEqual(source.shape, (64, 48))
+
+    def test_rgb_dicom_is_tiled_as_a_single_channel(self):
+        gray = np.arange(64 * 48, dtype=np.uint16).reshape(64, 48)
+        self.content, _ = make_dicom(np.stack([gray, gray, gray], axis=-1))
+        upload_id = self.start()['upload_id']
+        self.put(upload_id, 0, len(self.content))
+        self.client.post(reverse('medical_images:upload_complete', args=[upload_id]))
+
+        image = MedicalImage.objects.select_related('dicom').get()
+        self.assertEqual(open_pixel_source(image).frame(0).shape, (64, 48, 3))
+        self.assertEqual(ensure_pyramid(image), (48, 64))
+        with Image.open(tiles.tile_path(image, 6, 0, 0)) as tile:
+            self.assertEqual(tile.size, (48, 64))
+            rgb = np.asarray(tile.convert('RGB'), dtype=np.int16)
+        # Un solo canal de gris (WebP lo guarda como RGB con canales iguales)
+        self.assertLessEqual(np.abs(rgb[..., 0] - rgb[..., 1]).max(), 2)
+        self.assertLess(rgb[0, 0, 0], rgb[-1, -1, 0])
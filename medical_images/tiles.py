@@ -0,0 +1,339 @@
+# ================================
+# Pirámide de teselas Deep Zoom (DZI)
+# ARCHIVO: medical_images/tiles.py
+# ================================
+# Para navegar radiografías grandes (4k x 4k o más) el visor pide solo las
+# teselas visibles del nivel de zoom actual. La pirámide se genera en segundo
+# plano al cargar la imagen (schedule_pyramid) y queda en disco junto al
+# original; si falta cuando se consulta, la petición programa su generación y
+# responde 503 con Retry-After en vez de esperarla:
+#
+#   <archivo>.dzi                          descriptor XML
+#   <archivo>_files/<nivel>/<col>_<fila>.<ext>
+#
+# El nivel máximo es la resolución completa y cada nivel inferior mide la
+# mitad (redondeando hacia arriba), hasta el nivel 0 de 1x1 píxel. Las
+# imágenes con varias muestras por píxel (DICOM RGB) se pasan a escala de
+# grises franja por franja.
+
+import logging
+import math
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+from .derivatives import get_extension, get_format, save_options
+from .preprocessing import PERCENTILE_STRIDE, WINDOW_PERCENTILES, read_image_pixels, to_grayscale
+
+logger = logging.getLogger(__name__)
+
+DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+    'Format="{format}" Overlap="{overlap}" TileSize="{tile_size}">'
+    '<Size Width="{width}" Height="{height}"/></Image>\n'
+)
+
+# Un lock por imagen mientras alguien genera su pirámide: (lock, usuarios).
+# La entrada se quita cuando el último termina.
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def get_tile_size():
+    return getattr(settings, 'MEDICAL_IMAGE_TILE_SIZE', 256)
+
+
+def get_overlap():
+    return getattr(settings, 'MEDICAL_IMAGE_TILE_OVERLAP', 1)
+
+
+def descriptor_path(image):
+    return Path(default_storage.path(f'{image.file_path.name}.dzi'))
+
+
+def tiles_dir(image):
+    return Path(default_storage.path(f'{image.file_path.name}_files'))
+
+
+def tile_path(image, level, col, row):
+    return tiles_dir(image) / str(level) / f'{col}_{row}.{get_extension()}'
+
+
+def max_level(width, height):
+    return math.ceil(math.log2(max(width, height, 1)))
+
+
+def level_size(width, height, level):
+    scale = 2 ** (max_level(width, height) - level)
+    return math.ceil(width / scale), math.ceil(height / scale)
+
+
+def tile_bounds(level_width, level_height, col, row, tile_size, overlap):
+    """Región (x0, y0, x1, y1) de una tesela, incluyendo el solapamiento"""
+    x0 = col * tile_size - (overlap if col > 0 else 0)
+    y0 = row * tile_size - (overlap if row > 0 else 0)
+    x1 = min(level_width, (col + 1) * tile_size + overlap)
+    y1 = min(level_height, (row + 1) * tile_size + overlap)
+    return x0, y0, x1, y1
+
+
+def window_bounds(pixels, modality=None):
+    """
+    Límites (bajo, alto) de la ventana de intensidad, estimados sobre una
+    submuestra de a lo sumo ~512x512 píxeles (no se recorre todo el archivo).
+    """
+    low_pct, high_pct = WINDOW_PERCENTILES.get(modality or 'OTHER', WINDOW_PERCENTILES['OTHER'])
+    stride = max(PERCENTILE_STRIDE, math.ceil(max(pixels.shape[:2]) / 512))
+    sample = np.asarray(to_grayscale(pixels[::stride, ::stride]), dtype=np.float32)
+    low, high = np.percentile(sample, (low_pct, high_pct))
+    return float(low), float(high)
+
+
+def display_converter(pixels, modality=None, invert=False):
+    """
+    Función que lleva una franja de `pixels` a 8 bits y un solo canal, con la
+    ventana de la imagen completa
+    """
+    if pixels.dtype == np.uint8 and pixels.ndim == 2 and not invert:
+        return np.asarray
+    low, high = window_bounds(pixels, modality)
+    scale = 255.0 / (high - low) if high > low else 0.0
+
+    def convert(strip):
+        window = to_grayscale(strip).astype(np.float32)
+        window -= low
+        window *= scale
+        np.clip(window, 0.0, 255.0, out=window)
+        if invert:
+            np.subtract(255.0, window, out=window)
+        return window.astype(np.uint8)
+
+    return convert
+
+
+def halve(pixels):
+    """Reduce a la mitad promediando bloques 2x2 (los bordes impares se replican)"""
+    h, w = pixels.shape
+    if h == 1 and w == 1:
+        return pixels
+    if h % 2 or w % 2:
+        pixels = np.pad(pixels, ((0, h % 2), (0, w % 2)), mode='edge')
+    total = (
+        pixels[0::2, 0::2].astype(np.uint16) + pixels[1::2, 0::2]
+        + pixels[0::2, 1::2] + pixels[1::2, 1::2] + 2
+    )
+    return (total >> 2).astype(np.uint8)
+
+
+def write_row(strip, y0, row, level_dir, tile_size, overlap, fmt, ext, options):
+    """Escribe las teselas de una fila a partir de la franja que la contiene"""
+    lw = strip.shape[1]
+    lh = y0 + strip.shape[0]
+    for col in range(math.ceil(lw / tile_size)):
+        x0, ty0, x1, ty1 = tile_bounds(lw, lh, col, row, tile_size, overlap)
+        tile = np.ascontiguousarray(strip[ty0 - y0:ty1 - y0, x0:x1])
+        Image.fromarray(tile, mode='L').save(level_dir / f'{col}_{row}.{ext}', format=fmt, **options)
+
+
+def write_pyramid(pixels, directory, tile_size, overlap, fmt, ext, convert=np.asarray):
+    """
+    Escribe todas las teselas de todos los niveles en `directory`.
+
+    El nivel completo se recorre por franjas de una fila de teselas: cada
+    franja se convierte a 8 bits, se escribe y se reduce a la mitad para el
+    nivel siguiente. Así el original (posiblemente un np.memmap) nunca está
+    completo en memoria; desde el segundo nivel todo cabe en pocos MB.
+    `tile_size` debe ser par para que las franjas se reduzcan sin desfase.
+    """
+    height, width = pixels.shape[:2]
+    level = max_level(width, height)
+    options = save_options(fmt)
+
+    level_dir = directory / str(level)
+    level_dir.mkdir(parents=True)
+    halves = []
+    for row in range(math.ceil(height / tile_size)):
+        _, y0, _, y1 = tile_bounds(width, height, 0, row, tile_size, overlap)
+        strip = convert(pixels[y0:y1])
+        write_row(strip, y0, row, level_dir, tile_size, overlap, fmt, ext, options)
+        core_start = row * tile_size - y0
+        core_stop = min(height, (row + 1) * tile_size) - y0
+        halves.append(halve(strip[core_start:core_stop]))
+    if level == 0:
+        return
+
+    pixels = np.concatenate(halves)
+    level -= 1
+    while True:
+        level_dir = directory / str(level)
+        level_dir.mkdir(parents=True)
+        lh = pixels.shape[0]
+        for row in range(math.ceil(lh / tile_size)):
+            write_row(pixels, 0, row, level_dir, tile_size, overlap, fmt, ext, options)
+        if level == 0:
+            break
+        pixels = halve(pixels)
+        level -= 1
+
+
+def ensure_pyramid(image):
+    """
+    Genera la pirámide si no existe y retorna (ancho, alto) de la imagen.
+    Las teselas se escriben en un directorio temporal que se renombra al
+    terminar; el descriptor se escribe al final y marca la pirámide como lista.
+    Es lento para imágenes grandes: las vistas usan request_pyramid().
+    """
+    descriptor = descriptor_path(image)
+    if descriptor.exists():
+        return read_size(descriptor)
+
+    name = image.file_path.name
+    with _locks_guard:
+        lock, users = _locks.get(name, (None, 0))
+        lock = lock or threading.Lock()
+        _locks[name] = (lock, users + 1)
+    try:
+        with lock:
+            if descriptor.exists():
+                return read_size(descriptor)
+            return _build_pyramid(image, descriptor)
+    finally:
+        with _locks_guard:
+            lock, users = _locks[name]
+            if users == 1:
+                del _locks[name]
+            else:
+                _locks[name] = (lock, users - 1)
+
+
+def _build_pyramid(image, descriptor):
+    pixels, invert = read_image_pixels(image)
+    convert = display_converter(pixels, image.modality, invert)
+    height, width = pixels.shape[:2]
+    tile_size, overlap = get_tile_size(), get_overlap()
+    fmt, ext = get_format(), get_extension()
+
+    target = tiles_dir(image)
+    tmp = target.with_name(f'{target.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+    shutil.rmtree(tmp, ignore_errors=True)
+    write_pyramid(pixels, tmp, tile_size, overlap, fmt, ext, convert)
+    try:
+        # Solo se renombran directorios completos: si ya existe, es válido
+        os.rename(tmp, target)
+    except OSError:
+        # Otro proceso terminó la misma pirámide primero
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    descriptor_tmp = descriptor.with_name(f'{descriptor.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+    descriptor_tmp.write_text(DZI_TEMPLATE.format(
+        format=ext, overlap=overlap, tile_size=tile_size, width=width, height=height,
+    ))
+    os.replace(descriptor_tmp, descriptor)
+    return width, height
+
+
+def read_size(descriptor):
+    text = descriptor.read_text()
+    width = int(text.split('Width="', 1)[1].split('"', 1)[0])
+    height = int(text.split('Height="', 1)[1].split('"', 1)[0])
+    return width, height
+
+
+def delete_pyramid(image):
+    descriptor_path(image).unlink(missing_ok=True)
+    shutil.rmtree(tiles_dir(image), ignore_errors=True)
+
+
+# ================================
+# GENERACIÓN EN SEGUNDO PLANO
+# ================================
+
+class PyramidError(Exception):
+    """La pirámide de la imagen no se pudo generar"""
+
+
+_executor = None
+# Pirámides programadas o en curso en este proceso, y las que fallaron
+_scheduled = set()
+_failed = set()
+_scheduled_guard = threading.Lock()
+
+
+def is_async():
+    return getattr(settings, 'MEDICAL_IMAGE_TILES_ASYNC', True)
+
+
+def get_retry_after():
+    return getattr(settings, 'MEDICAL_IMAGE_TILES_RETRY_AFTER', 2)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'MEDICAL_IMAGE_TILE_WORKERS', 1),
+            thread_name_prefix='tiles',
+        )
+    return _executor
+
+
+def _build_by_id(image_id, name):
+    from .models import MedicalImage
+
+    close_old_connections()
+    try:
+        image = MedicalImage.objects.filter(pk=image_id).first()
+        if image is not None:
+            ensure_pyramid(image)
+    except Exception:
+        logger.exception('No se pudo generar la pirámide de la imagen %s', image_id)
+        with _scheduled_guard:
+            _failed.add(name)
+    finally:
+        with _scheduled_guard:
+            _scheduled.discard(name)
+        close_old_connections()
+
+
+def request_pyramid(image):
+    """
+    True si la pirámide está lista. Si no, programa su generación (una vez
+    por imagen y proceso) y retorna False; con MEDICAL_IMAGE_TILES_ASYNC =
+    False la genera en el mismo hilo. Lanza PyramidError si ya falló.
+    """
+    if descriptor_path(image).exists():
+        return True
+    name = image.file_path.name
+    if not is_async():
+        try:
+            ensure_pyramid(image)
+        except Exception as error:
+            raise PyramidError(str(error)) from error
+        return True
+    with _scheduled_guard:
+        if name in _failed:
+            raise PyramidError(name)
+        if name in _scheduled:
+            return False
+        _scheduled.add(name)
+    _get_executor().submit(_build_by_id, image.pk, name)
+    return False
+
+
+def schedule_pyramid(image):
+    """Programa la pirámide cuando la transacción actual confirme (tras la carga)"""
+    def schedule():
+        try:
+            request_pyramid(image)
+        except PyramidError:
+            logger.exception('No se pudo generar la pirámide de la imagen %s', image.pk)
+    transaction.on_commit(schedule)
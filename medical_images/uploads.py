@@ -0,0 +1,298 @@
+# ================================
+# Cargas por partes (chunked) de imágenes médicas
+# ARCHIVO: medical_images/uploads.py
+# ================================
+# Cada parte se escribe directo a un archivo temporal leyendo el cuerpo de la
+# petición en bloques fijos, y el SHA-256 se actualiza mientras se escribe.
+# La memoria usada por carga no depende del tamaño del archivo.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import storage
+from .derivatives import schedule_derivatives
+from .ingest import safe_ingest_dicom
+from .models import ImageUpload, MedicalImage
+from .tiles import schedule_pyramid
+
+# Tamaño de los bloques leídos del cuerpo de la petición
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Error de protocolo en una carga por partes"""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+class DuplicateImageError(UploadError):
+    """Ya existe una imagen con el mismo contenido"""
+
+    def __init__(self, existing):
+        super().__init__('Esta imagen ya existe en el sistema.', status=409)
+        self.existing = existing
+
+
+class _HashStates:
+    """
+    Estado SHA-256 de las cargas activas en este proceso.
+    Si una parte llega a otro proceso (o tras un reinicio) el hash se
+    reconstruye leyendo el archivo parcial una sola vez.
+
+    get() entrega una copia: dos peticiones con la misma parte (un reintento
+    que compite con la original) actualizan cada una su propio hash, y solo
+    la que gana el compare-and-swap de write_chunk() guarda el suyo con put().
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, upload):
+        with self._lock:
+            state = self._states.get(upload.pk)
+            if state is not None and state[1] == upload.received_bytes:
+                self._states.move_to_end(upload.pk)
+                return state[0].copy()
+
+        digest = hashlib.sha256()
+        remaining = upload.received_bytes
+        path = temp_path(upload)
+        if remaining:
+            with open(path, 'rb') as f:
+                while remaining:
+                    block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    digest.update(block)
+                    remaining -= len(block)
+        return digest
+
+    def put(self, upload, digest, offset):
+        with self._lock:
+            self._states[upload.pk] = (digest, offset)
+            self._states.move_to_end(upload.pk)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+
+    def discard(self, upload):
+        with self._lock:
+            self._states.pop(upload.pk, None)
+
+
+hash_states = _HashStates()
+
+
+def get_chunk_size():
+    return getattr(settings, 'MEDICAL_IMAGE_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+
+
+def get_max_size():
+    return getattr(settings, 'MEDICAL_IMAGE_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+
+
+def temp_dir():
+    path = Path(getattr(settings, 'MEDICAL_IMAGE_UPLOAD_TEMP_DIR', Path(settings.MEDIA_ROOT) / 'uploads_tmp'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def temp_path(upload):
+    return temp_dir() / f'{upload.pk}.part'
+
+
+def can_reuse_blob(user, patient, file_hash):
+    """
+    Indica si una carga puede completarse sin transferir bytes: el contenido
+    está almacenado y lo referencia una imagen subida por el mismo usuario o
+    del mismo paciente. Un hash por sí solo no prueba que el cliente tenga el
+    archivo; fuera de ese alcance se exigen los bytes y no se revela si el
+    contenido existe.
+    """
+    if not storage.blob_exists(file_hash):
+        return False
+    scope = Q(uploaded_by=user)
+    if patient is not None:
+        scope |= Q(patient=patient)
+    return MedicalImage.objects.filter(scope, file_hash=file_hash).exists()
+
+
+def start_upload(patient, user, filename, total_size, sha256=None, **study):
+    """
+    Registra una nueva carga y reserva su archivo temporal.
+    Si `sha256` corresponde a un contenido ya almacenado con el mismo tamaño
+    y dentro del alcance de can_reuse_blob(), la carga se completa de
+    inmediato sin transferir bytes.
+    """
+    if total_size <= 0:
+        raise UploadError('El tamaño del archivo debe ser mayor que cero.')
+    if total_size > get_max_size():
+        raise UploadError('El archivo supera el tamaño máximo permitido.', status=413)
+
+    upload = ImageUpload.objects.create(
+        patient=patient,
+        uploaded_by=user,
+        filename=os.path.basename(filename)[:255],
+        total_size=total_size,
+        **study,
+    )
+    temp_path(upload).touch()
+
+    if sha256 and can_reuse_blob(user, patient, sha256) and storage.blob_size(sha256) == total_size:
+        finalize_from_blob(upload, sha256)
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Escribe `length` bytes de `stream` en la posición `offset`.
+    Solo se aceptan partes contiguas: el offset debe coincidir con los bytes
+    ya recibidos (el cliente reanuda consultando el estado de la carga).
+    """
+    if upload.status != 'UPLOADING':
+        raise UploadError('La carga ya fue finalizada.', status=409)
+    if offset != upload.received_bytes:
+        raise UploadError('El offset no coincide con los bytes recibidos.', status=409,
+                          offset=upload.received_bytes)
+    if length <= 0 or offset + length > upload.total_size:
+        raise UploadError('La parte excede el tamaño declarado del archivo.', status=416)
+
+    digest = hash_states.get(upload)
+    written = 0
+    with open(temp_path(upload), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            digest.update(block)
+            written += len(block)
+
+    if written != length:
+        # Parte incompleta: se descarta y el cliente reintenta desde `offset`.
+        # El estado guardado no cambió: `digest` era una copia.
+        raise UploadError('La parte llegó incompleta.', status=400, offset=offset)
+
+    # Compare-and-swap: solo avanza si nadie más escribió esta misma parte
+    updated = ImageUpload.objects.filter(
+        pk=upload.pk, status='UPLOADING', received_bytes=offset
+    ).update(received_bytes=offset + written, updated_at=timezone.now())
+    if not updated:
+        hash_states.discard(upload)
+        upload.refresh_from_db()
+        raise UploadError('La carga fue modificada por otra petición.', status=409,
+                          offset=upload.received_bytes)
+
+    upload.received_bytes = offset + written
+    hash_states.put(upload, digest, upload.received_bytes)
+    return upload.received_bytes
+
+
+def find_duplicate(patient, file_hash):
+    """Imagen del mismo paciente con el mismo contenido, si existe"""
+    return MedicalImage.objects.filter(patient=patient, file_hash=file_hash).select_related('patient').first()
+
+
+def finalize_upload(upload):
+    """
+    Completa la carga: verifica el tamaño, calcula el hash final, guarda el
+    contenido en el almacenamiento direccionado por contenido y crea el
+    MedicalImage.
+
+    La fila de la carga se bloquea con select_for_update(): dos llamadas
+    simultáneas (un reintento del cliente) se ejecutan en serie y la segunda
+    retorna la imagen que creó la primera.
+    """
+    try:
+        with transaction.atomic():
+            upload = ImageUpload.objects.select_for_update().select_related('patient').get(pk=upload.pk)
+            if upload.status == 'COMPLETED' and upload.medical_image_id:
+                return upload.medical_image
+            if upload.status != 'UPLOADING':
+                raise UploadError('La carga ya fue finalizada.', status=409)
+            if not upload.is_complete:
+                raise UploadError('Faltan partes por cargar.', status=409, offset=upload.received_bytes)
+
+            file_hash = hash_states.get(upload).hexdigest()
+            existing = find_duplicate(upload.patient, file_hash)
+            if existing is not None:
+                raise DuplicateImageError(existing)
+
+            # Si los mismos bytes ya existen (otro paciente u otra carga) el temporal
+            # se descarta y el nuevo MedicalImage apunta al mismo archivo
+            name = storage.store_blob(temp_path(upload), file_hash)
+            hash_states.discard(upload)
+            return _create_image(upload, name, file_hash)
+    except DuplicateImageError:
+        # Fuera de la transacción: el rollback no debe deshacer el estado FAILED
+        discard_upload(upload, status='FAILED')
+        raise
+
+
+def finalize_from_blob(upload, file_hash):
+    """
+    Completa una carga sin recibir bytes: el cliente declaró un SHA-256 cuyo
+    contenido ya está almacenado con el mismo tamaño (ver can_reuse_blob).
+    """
+    existing = find_duplicate(upload.patient, file_hash)
+    if existing is not None:
+        discard_upload(upload, status='FAILED')
+        raise DuplicateImageError(existing)
+
+    hash_states.discard(upload)
+    temp_path(upload).unlink(missing_ok=True)
+    upload.received_bytes = upload.total_size
+    upload.save(update_fields=['received_bytes', 'updated_at'])
+    return _create_image(upload, storage.blob_name(file_hash), file_hash)
+
+
+def _create_image(upload, name, file_hash):
+    try:
+        with transaction.atomic():
+            image = MedicalImage.objects.create(
+                patient=upload.patient,
+                uploaded_by=upload.uploaded_by,
+                study_type=upload.study_type,
+                study_date=upload.study_date,
+                study_description=upload.study_description,
+                modality=upload.modality,
+                institution=upload.institution,
+                file_path=name,
+                file_hash=file_hash,
+                file_size=upload.received_bytes,
+            )
+            upload.status = 'COMPLETED'
+            upload.medical_image = image
+            upload.save(update_fields=['status', 'medical_image', 'updated_at'])
+            # Solo se lee el encabezado: unos pocos KB aunque el archivo pese cientos de MB
+            safe_ingest_dicom(image)
+            schedule_derivatives(image)
+            schedule_pyramid(image)
+    except IntegrityError:
+        # Otra carga del mismo contenido para este paciente terminó primero.
+        # El blob se conserva: lo referencia la imagen que ganó.
+        upload.status = 'FAILED'
+        upload.save(update_fields=['status', 'updated_at'])
+        raise DuplicateImageError(find_duplicate(upload.patient, file_hash))
+    return image
+
+
+def discard_upload(upload, status='FAILED'):
+    """Elimina el archivo temporal de una carga"""
+    hash_states.discard(upload)
+    temp_path(upload).unlink(missing_ok=True)
+    upload.status = status
+    upload.save(update_fields=['status', 'updated_at'])
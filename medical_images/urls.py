@@ -6,4 +6,18 @@ app_name = 'medical_images'
 urlpatterns = [
     path('upload/', views.UploadImageView.as_view(), name='upload-image'),
     path('images/', views.ListImagesView.as_view(), name='list-images'),
+
+    # API de carga por partes (chunked y reanudable)
+    path('api/uploads/', views.upload_start, name='upload_start'),
+    path('api/uploads/probe/', views.upload_probe, name='upload_probe'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/complete/', views.upload_complete, name='upload_complete'),
+
+    # Miniaturas y vistas previas
+    path('images/<int:image_id>/<str:kind>/', views.image_derivative, name='image_derivative'),
+
+    # Visor Deep Zoom: el visor deriva la URL de las teselas del descriptor
+    path('images/<int:image_id>/tiles.dzi', views.image_dzi, name='image_dzi'),
+    path('images/<int:image_id>/tiles_files/<int:level>/<int:col>_<int:row>.<str:ext>',
+         views.image_tile, name='image_tile'),
 ]
@@ -1,10 +1,41 @@
-from django.shortcuts import render
+import re
+from functools import wraps
+
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.shortcuts import render, get_object_or_404
 from django.views.generic import TemplateView, ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_http_methods
+from django.utils.dateparse import parse_date
 from django.utils.decorators import method_decorator
 
+from users.models import Patient
+from . import storage
+from .derivatives import (
+    CONTENT_TYPES,
+    derivative_path,
+    generate_derivatives,
+    get_extension,
+    get_format,
+    get_sizes,
+)
+from .models import ImageUpload, MedicalImage
+from .tiles import PyramidError, descriptor_path, get_retry_after, request_pyramid, tile_path
+from .uploads import (
+    DuplicateImageError,
+    UploadError,
+    can_reuse_blob,
+    finalize_upload,
+    find_duplicate,
+    get_chunk_size,
+    start_upload,
+    write_chunk,
+)
+
 
 class UploadImageView(LoginRequiredMixin, TemplateView):
     """
@@ -26,3 +57,301 @@ class ListImagesView(LoginRequiredMixin, TemplateView):
     """
     template_name = 'medical_images/list.html'
     login_url = 'login'
+
+
+# ================================
+# API DE CARGA POR PARTES (CHUNKED)
+# ================================
+
+UPLOAD_ROLES = ['MEDICO_RADIOLOGO', 'TECNICO_SALUD']
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+def upload_status(upload):
+    """Estado de una carga en formato JSON"""
+    return {
+        'upload_id': str(upload.pk),
+        'offset': upload.received_bytes,
+        'total_size': upload.total_size,
+        'chunk_size': get_chunk_size(),
+        'status': upload.status,
+        'image_id': upload.medical_image_id,
+    }
+
+
+def duplicate_response(error):
+    existing = error.existing
+    data = {'status': 'duplicate', 'message': str(error)}
+    if existing is not None:
+        data['existing_image'] = {
+            'id': existing.id,
+            'patient': {'nombre_completo': existing.patient.get_full_name()},
+            'study_type': existing.study_type,
+            'study_type_display': existing.get_study_type_display(),
+            'study_date': existing.study_date.isoformat(),
+        }
+    return JsonResponse(data, status=409)
+
+
+def error_response(error):
+    return JsonResponse({'status': 'error', 'message': str(error), **error.extra}, status=error.status)
+
+
+@login_required
+@require_http_methods(["POST"])
+def upload_start(request):
+    """
+    Inicia una carga por partes.
+    Recibe los datos del estudio y el tamaño total; retorna el upload_id.
+    """
+    if request.user.rol not in UPLOAD_ROLES:
+        return JsonResponse({'status': 'error', 'message': 'No autorizado'}, status=403)
+
+    errors = {}
+    patient = Patient.objects.filter(id=request.POST.get('patient_id') or None, is_active=True).first()
+    if patient is None:
+        errors['patient_id'] = 'Paciente no encontrado'
+    study_date = parse_date(request.POST.get('study_date', ''))
+    if study_date is None:
+        errors['study_date'] = 'Fecha inválida'
+    study_type = request.POST.get('study_type', 'OTHER')
+    if study_type not in dict(MedicalImage.STUDY_TYPES):
+        errors['study_type'] = 'Tipo de estudio inválido'
+    filename = request.POST.get('filename', '').strip()
+    if not filename:
+        errors['image_file'] = 'Falta el nombre del archivo'
+    try:
+        total_size = int(request.POST.get('file_size', ''))
+    except ValueError:
+        total_size = 0
+        errors['image_file'] = 'Tamaño de archivo inválido'
+    modality = request.POST.get('modality') or None
+    if modality and modality not in dict(MedicalImage.MODALITY_CHOICES):
+        errors['modality'] = 'Modalidad inválida'
+    sha256 = request.POST.get('sha256', '').strip().lower() or None
+    if sha256 and not storage.is_valid_hash(sha256):
+        errors['sha256'] = 'Hash SHA-256 inválido'
+
+    if errors:
+        return JsonResponse({'status': 'error', 'message': 'Datos inválidos', 'errors': errors}, status=400)
+
+    try:
+        upload = start_upload(
+            patient,
+            request.user,
+            filename,
+            total_size,
+            sha256=sha256,
+            study_type=study_type,
+            study_date=study_date,
+            study_description=request.POST.get('description') or None,
+            institution=request.POST.get('institution') or None,
+            modality=modality,
+        )
+    except DuplicateImageError as e:
+        return duplicate_response(e)
+    except UploadError as e:
+        return error_response(e)
+
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@login_required
+@require_http_methods(["GET"])
+def upload_probe(request):
+    """
+    Consulta previa a la carga: indica si el contenido con ese SHA-256 puede
+    reutilizarse. Solo se informa del contenido ya subido por el mismo usuario
+    o asociado al paciente indicado; si `exists` es verdadero, el cliente puede
+    iniciar la carga enviando `sha256` y se completa sin transferir el archivo.
+    """
+    if request.user.rol not in UPLOAD_ROLES:
+        return JsonResponse({'status': 'error', 'message': 'No autorizado'}, status=403)
+
+    sha256 = request.GET.get('sha256', '').strip().lower()
+    if not storage.is_valid_hash(sha256):
+        return JsonResponse({'status': 'error', 'message': 'Hash SHA-256 inválido'}, status=400)
+
+    patient = None
+    patient_id = request.GET.get('patient_id')
+    if patient_id:
+        patient = Patient.objects.filter(id=patient_id, is_active=True).first()
+
+    exists = can_reuse_blob(request.user, patient, sha256)
+    data = {
+        'sha256': sha256,
+        'exists': exists,
+        'size': storage.blob_size(sha256) if exists else None,
+        'duplicate': exists and patient is not None and find_duplicate(patient, sha256) is not None,
+    }
+    return JsonResponse(data)
+
+
+@login_required
+@require_http_methods(["GET", "PUT"])
+def upload_chunk(request, upload_id):
+    """
+    GET: estado de la carga (para reanudar desde `offset`).
+    PUT: recibe una parte. El cuerpo son los bytes crudos y el encabezado
+    Content-Range (bytes inicio-fin/total) indica su posición.
+    """
+    upload = get_object_or_404(ImageUpload, pk=upload_id, uploaded_by=request.user)
+
+    if request.method == 'GET':
+        return JsonResponse(upload_status(upload))
+
+    match = CONTENT_RANGE_RE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+    if not match:
+        return JsonResponse({'status': 'error', 'message': 'Falta el encabezado Content-Range'}, status=400)
+    start, end, total = (int(value) for value in match.groups())
+    if total != upload.total_size or end < start:
+        return JsonResponse({'status': 'error', 'message': 'Content-Range inválido'}, status=416)
+
+    try:
+        # Se lee `request` como flujo: el cuerpo nunca se carga completo en memoria
+        offset = write_chunk(upload, start, request, end - start + 1)
+    except UploadError as e:
+        return error_response(e)
+
+    return JsonResponse({**upload_status(upload), 'offset': offset})
+
+
+@login_required
+@require_http_methods(["POST"])
+def upload_complete(request, upload_id):
+    """Finaliza la carga y crea el MedicalImage"""
+    upload = get_object_or_404(ImageUpload, pk=upload_id, uploaded_by=request.user)
+    try:
+        image = finalize_upload(upload)
+    except DuplicateImageError as e:
+        return duplicate_response(e)
+    except UploadError as e:
+        return error_response(e)
+
+    return JsonResponse({
+        'status': 'success',
+        'message': 'La imagen se cargó correctamente.',
+        'image': {
+            'id': image.id,
+            'file_hash': image.file_hash,
+            'file_size': image.file_size,
+        },
+    }, status=201)
+
+
+# ================================
+# MINIATURAS Y VISTAS PREVIAS
+# ================================
+
+# Un derivado nunca cambia (el original está direccionado por contenido)
+DERIVATIVE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def content_etag(request, image_id, **kwargs):
+    """ETag de un recurso derivado: hash del original + parámetros de la URL"""
+    file_hash = MedicalImage.objects.filter(pk=image_id).values_list('file_hash', flat=True).first()
+    if file_hash is None:
+        return None
+    return '-'.join([file_hash[:32], *(str(value) for value in kwargs.values()), get_format().lower()])
+
+
+def can_view_image(user, image_id):
+    """
+    Acceso a los bytes de una imagen (derivados y teselas). Administradores y
+    médicos radiólogos revisan cualquier estudio; un técnico solo las imágenes
+    que cargó o las de diagnósticos que solicitó.
+    """
+    if user.is_superuser or user.rol in ('ADMINISTRADOR', 'MEDICO_RADIOLOGO'):
+        return True
+    if user.rol not in UPLOAD_ROLES:
+        return False
+    return MedicalImage.objects.filter(
+        Q(uploaded_by=user) | Q(diagnoses__requested_by=user), pk=image_id,
+    ).exists()
+
+
+def image_access_required(view):
+    """Verifica can_view_image antes del ETag: un 304 tampoco se entrega sin acceso"""
+    @wraps(view)
+    def wrapper(request, image_id, *args, **kwargs):
+        if not can_view_image(request.user, image_id):
+            raise PermissionDenied('No tienes acceso a esta imagen.')
+        return view(request, image_id, *args, **kwargs)
+    return wrapper
+
+
+def immutable_file_response(path, content_type):
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    # private: son datos clínicos, solo el navegador del usuario puede cachearlos
+    patch_cache_control(response, private=True, max_age=DERIVATIVE_MAX_AGE, immutable=True)
+    return response
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+@image_access_required
+@condition(etag_func=content_etag)
+def image_derivative(request, image_id, kind):
+    """
+    Sirve la miniatura (`thumb`) o vista previa (`preview`) de una imagen.
+    Si aún no se generó (carga reciente o fila antigua) se genera en el momento.
+    """
+    if kind not in get_sizes():
+        raise Http404('Tipo de derivado desconocido')
+    image = get_object_or_404(MedicalImage, pk=image_id, is_active=True)
+
+    path = derivative_path(image, kind)
+    if not path.exists():
+        try:
+            generate_derivatives(image)
+        except Exception:
+            raise Http404('No se pudo generar la vista previa de la imagen')
+
+    return immutable_file_response(path, CONTENT_TYPES[get_format()])
+
+
+def pyramid_pending_response():
+    """503 mientras la pirámide se genera en segundo plano: el visor reintenta"""
+    response = HttpResponse('La imagen se está preparando.', status=503, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = get_retry_after()
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+def pyramid_ready(image):
+    """request_pyramid() para una vista: 404 si la generación falló"""
+    try:
+        return request_pyramid(image)
+    except PyramidError:
+        raise Http404('No se pudo generar la pirámide de la imagen')
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+@image_access_required
+@condition(etag_func=content_etag)
+def image_dzi(request, image_id):
+    """Descriptor Deep Zoom de una imagen; si la pirámide falta, la programa"""
+    image = get_object_or_404(MedicalImage, pk=image_id, is_active=True)
+    if not pyramid_ready(image):
+        return pyramid_pending_response()
+    return immutable_file_response(descriptor_path(image), 'application/xml')
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+@image_access_required
+@condition(etag_func=content_etag)
+def image_tile(request, image_id, level, col, row, ext):
+    """Una tesela de la pirámide Deep Zoom"""
+    if ext != get_extension():
+        raise Http404('Formato de tesela no disponible')
+    image = get_object_or_404(MedicalImage, pk=image_id, is_active=True)
+    if not pyramid_ready(image):
+        return pyramid_pending_response()
+
+    path = tile_path(image, level, col, row)
+    if not path.exists():
+        raise Http404('Tesela fuera de rango')
+    return immutable_file_response(path, CONTENT_TYPES[get_format()])
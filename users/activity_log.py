@@ -0,0 +1,286 @@
+# ================================
+# Explorador de actividad: Log + DiagnosisLog con paginación por cursor
+# ARCHIVO: users/activity_log.py
+# ================================
+# Los eventos del sistema (authentication.Log) y de diagnósticos
+# (diagnostico.DiagnosisLog) se muestran como una sola lista, del más reciente
+# al más antiguo, ordenada por (timestamp, fuente, id).
+#
+# En vez de OFFSET, cada página lleva un cursor con la clave de su última
+# fila y la siguiente se pide con "clave < cursor": cada fuente resuelve la
+# consulta recorriendo su índice (…, timestamp, id) desde ese punto, así que
+# la página 10.000 cuesta lo mismo que la primera. De cada consulta se leen a lo
+# sumo page_size + 1 filas y se mezclan en memoria.
+
+import heapq
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from authentication.models import Log, User
+from diagnostico.models import DiagnosisLog
+
+# Acciones de Log que el monitoreo agrupa como "Acceso"
+LOGIN_ACTIONS = ('LOGIN_SUCCESS', 'LOGIN_FAILED', 'LOGIN_THROTTLED', 'LOGOUT')
+
+TIPOS = (
+    ('login', 'Acceso'),
+    ('operacion', 'Operación'),
+    ('diagnostico', 'Diagnóstico'),
+)
+
+PAGE_SIZE = 50
+
+# Hasta cuántos valores de un filtro IN se consultan por separado. Con
+# "campo IN (...)" el índice (campo, timestamp, id) ya no entrega las filas en
+# orden y la base ordena todo lo que coincide; con una consulta por valor cada
+# una sigue siendo un recorrido ordenado que se detiene en el LIMIT.
+MAX_SPLIT_VALUES = 10
+
+
+class Source:
+    """Una tabla de eventos y cómo leerla como filas del monitoreo"""
+
+    def __init__(self, rank, model, user_field, action_field, fields):
+        self.rank = rank
+        self.model = model
+        self.user_field = user_field
+        self.action_field = action_field
+        self.fields = fields
+        self.actions = dict(model._meta.get_field(action_field).choices)
+
+    def querysets(self, filters):
+        """
+        Consultas cuyos resultados, mezclados, son los eventos que cumplen los
+        filtros. Lista vacía si la fuente no aplica.
+        """
+        queryset = self.model.objects.all()
+        if filters.start:
+            queryset = queryset.filter(timestamp__gte=filters.start)
+        if filters.end:
+            queryset = queryset.filter(timestamp__lt=filters.end)
+        actions = self.filter_actions(filters.tipo)
+        if filters.accion:
+            if filters.accion not in self.actions or (actions is not None and filters.accion not in actions):
+                return []
+            actions = [filters.accion]
+        elif actions is not None and not actions:
+            return []
+
+        querysets = _split(queryset, self.action_field, actions)
+        if filters.user_ids is not None:
+            querysets = [
+                split
+                for queryset in querysets
+                for split in _split(queryset, self.user_field, filters.user_ids)
+            ]
+        return querysets
+
+    def filter_actions(self, tipo):
+        """Acciones permitidas por el tipo de evento (None = todas)"""
+        return None
+
+    def after(self, queryset, cursor):
+        """Filas posteriores al cursor en el orden descendente de la lista"""
+        if cursor is None:
+            return queryset
+        timestamp, rank, last_id = cursor
+        if self.rank < rank:
+            # En el mismo instante, esta fuente va después de la del cursor
+            return queryset.filter(timestamp__lte=timestamp)
+        if self.rank > rank:
+            return queryset.filter(timestamp__lt=timestamp)
+        # Un solo rango sobre timestamp (y no un OR) para que el índice entregue
+        # las filas ya ordenadas y la consulta se detenga en el LIMIT
+        return queryset.filter(timestamp__lte=timestamp).exclude(timestamp=timestamp, id__gte=last_id)
+
+    def rows(self, queryset):
+        return queryset.order_by('-timestamp', '-id').values('id', 'timestamp', *self.fields)
+
+
+class LogSource(Source):
+    def __init__(self):
+        super().__init__(
+            1, Log, 'user', 'accion',
+            ('accion', 'descripcion', 'nivel', 'ip_address',
+             'user__email', 'user__first_name', 'user__last_name'),
+        )
+
+    def filter_actions(self, tipo):
+        if tipo == 'login':
+            return list(LOGIN_ACTIONS)
+        if tipo == 'operacion':
+            return [action for action in self.actions if action not in LOGIN_ACTIONS]
+        if tipo == 'diagnostico':
+            return []
+        return None
+
+    def entry(self, row):
+        return {
+            'fuente': 'Sistema',
+            'tipo': 'login' if row['accion'] in LOGIN_ACTIONS else 'operacion',
+            'accion': self.actions.get(row['accion'], row['accion']),
+            'descripcion': row['descripcion'],
+            'nivel': row['nivel'],
+            'ip_address': row['ip_address'],
+            'usuario': _user_name(row['user__first_name'], row['user__last_name'], row['user__email']),
+            'email': row['user__email'] or '',
+        }
+
+
+class DiagnosisLogSource(Source):
+    def __init__(self):
+        super().__init__(
+            0, DiagnosisLog, 'performed_by', 'action',
+            ('action', 'diagnosis_id', 'ip_address',
+             'performed_by__email', 'performed_by__first_name', 'performed_by__last_name'),
+        )
+
+    def filter_actions(self, tipo):
+        if tipo == 'login':
+            return []
+        return None
+
+    def entry(self, row):
+        action = self.actions.get(row['action'], row['action'])
+        return {
+            'fuente': 'Diagnósticos',
+            'tipo': 'diagnostico',
+            'accion': action,
+            'descripcion': f"Diagnóstico #{row['diagnosis_id']}: {action}",
+            'nivel': 'INFO',
+            'ip_address': row['ip_address'],
+            'usuario': _user_name(
+                row['performed_by__first_name'], row['performed_by__last_name'], row['performed_by__email'],
+            ),
+            'email': row['performed_by__email'] or '',
+        }
+
+
+SOURCES = (LogSource(), DiagnosisLogSource())
+
+
+def _split(queryset, field, values):
+    """Una consulta por valor si son pocos; si no, un solo filtro IN"""
+    if values is None:
+        return [queryset]
+    if not values:
+        return []
+    if len(values) > MAX_SPLIT_VALUES:
+        return [queryset.filter(**{f'{field}__in': values})]
+    return [queryset.filter(**{field: value}) for value in values]
+
+
+def _user_name(first_name, last_name, email):
+    name = f'{first_name or ""} {last_name or ""}'.strip()
+    return name or email or 'Sistema'
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+
+class ActivityFilters:
+    """Filtros del monitoreo tomados de request.GET"""
+
+    def __init__(self, usuario='', desde='', hasta='', tipo='', accion=''):
+        self.usuario = usuario.strip()
+        self.desde = _parse_date(desde)
+        self.hasta = _parse_date(hasta)
+        self.tipo = tipo if tipo in dict(TIPOS) else ''
+        self.accion = accion.strip()
+
+        # Rango semiabierto [inicio del día desde, inicio del día siguiente a hasta)
+        self.start = timezone.make_aware(datetime.combine(self.desde, time.min)) if self.desde else None
+        self.end = (
+            timezone.make_aware(datetime.combine(self.hasta + timedelta(days=1), time.min))
+            if self.hasta else None
+        )
+
+        # El texto de usuario se resuelve primero a ids para filtrar por el
+        # índice (usuario, timestamp, id) en vez de unir con la tabla de usuarios
+        self.user_ids = None
+        if self.usuario:
+            self.user_ids = list(
+                User.objects.filter(
+                    Q(email__icontains=self.usuario)
+                    | Q(first_name__icontains=self.usuario)
+                    | Q(last_name__icontains=self.usuario)
+                ).values_list('id', flat=True)
+            )
+
+    @classmethod
+    def from_request(cls, params):
+        desde = params.get('desde', '')
+        hasta = params.get('hasta', '')
+        # Compatibilidad con el filtro anterior de un solo día
+        if params.get('fecha') and not (desde or hasta):
+            desde = hasta = params['fecha']
+        return cls(params.get('usuario', ''), desde, hasta, params.get('tipo', ''), params.get('accion', ''))
+
+    def querysets(self):
+        """(fuente, queryset) de las fuentes que aplican"""
+        for source in SOURCES:
+            for queryset in source.querysets(self):
+                yield source, queryset
+
+
+def encode_cursor(entry):
+    return f"{entry['timestamp'].isoformat()}~{entry['rank']}~{entry['id']}"
+
+
+def decode_cursor(value):
+    """Cursor de la URL; None si falta o no es válido (primera página)"""
+    try:
+        timestamp, rank, last_id = value.split('~')
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None:
+            return None
+        return timestamp, int(rank), int(last_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _sort_key(entry):
+    return (entry['timestamp'], entry['rank'], entry['id'])
+
+
+def _entries(source, rows):
+    for row in rows:
+        entry = source.entry(row)
+        entry.update(id=row['id'], timestamp=row['timestamp'], rank=source.rank)
+        yield entry
+
+
+def page(filters, cursor=None, page_size=PAGE_SIZE):
+    """
+    Una página de eventos posteriores a `cursor`.
+    Retorna (filas, cursor de la página siguiente o None).
+    """
+    streams = [
+        list(_entries(source, source.rows(source.after(queryset, cursor))[:page_size + 1]))
+        for source, queryset in filters.querysets()
+    ]
+    merged = list(heapq.merge(*streams, key=_sort_key, reverse=True))
+    entries = merged[:page_size]
+    next_cursor = encode_cursor(entries[-1]) if len(merged) > page_size else None
+    return entries, next_cursor
+
+
+def iter_entries(filters, chunk_size):
+    """Todos los eventos filtrados, leídos por bloques del cursor de cada fuente"""
+    streams = [
+        _entries(source, source.rows(queryset).iterator(chunk_size=chunk_size))
+        for source, queryset in filters.querysets()
+    ]
+    return heapq.merge(*streams, key=_sort_key, reverse=True)
+
+
+def action_choices():
+    """Acciones de ambas fuentes para el selector del monitoreo"""
+    return [(code, label) for source in SOURCES for code, label in source.actions.items()]
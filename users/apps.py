@@ -1,6 +1,36 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def ensure_patient_search_index(sender, using, **kwargs):
+    """Recrea el índice de búsqueda si una migración posterior lo eliminó"""
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+
+    from .search import ensure_search_index
+
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if ('users', '0004_patient_search') in applied:
+        ensure_search_index(connection)
+
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
-    verbose_name = 'Gestión de Usuarios'
\ No newline at end of file
+    verbose_name = 'Gestión de Usuarios'
+
+    def ready(self):
+        from authentication.models import User
+        from diagnostico.models import AIDiagnosis
+        from medical_images.models import MedicalImage
+        from . import dashboard_stats, prefix_index
+        from .models import Patient
+
+        post_migrate.connect(ensure_patient_search_index, sender=self)
+        post_save.connect(prefix_index.patient_saved, sender=Patient)
+        post_delete.connect(prefix_index.patient_deleted, sender=Patient)
+
+        for model in (User, AIDiagnosis, MedicalImage):
+            post_save.connect(dashboard_stats.invalidate, sender=model)
+            post_delete.connect(dashboard_stats.invalidate, sender=model)
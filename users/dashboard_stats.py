@@ -0,0 +1,141 @@
+# ================================
+# Estadísticas del dashboard de administrador
+# ARCHIVO: users/dashboard_stats.py
+# ================================
+# Cada tabla se cuenta con una sola consulta de agregados condicionales
+# (COUNT(...) FILTER (WHERE ...)): usuarios, diagnósticos e imágenes son tres
+# consultas en total. El resultado se guarda en el caché compartido
+# DASHBOARD_STATS_CACHE durante DASHBOARD_STATS_TTL segundos y se invalida,
+# al confirmarse la transacción, cuando se guarda o elimina un usuario, un
+# diagnóstico o una imagen. Los cambios de la cola de diagnósticos no pasan
+# por save(): diagnostico/tasks.py llama a invalidate() en cada transición.
+# Con un caché local a cada proceso, la invalidación no llegaría a los demás.
+#
+# La actividad reciente sale de Log y DiagnosisLog (users/activity_log.py):
+# una consulta acotada por tabla.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.timesince import timesince
+
+from authentication.models import User
+from diagnostico.models import AIDiagnosis
+from medical_images.models import MedicalImage
+from . import activity_log
+
+CACHE_KEY = 'dashboard_stats:admin'
+
+
+def get_cache():
+    return caches[getattr(settings, 'DASHBOARD_STATS_CACHE', 'shared')]
+
+
+def get_ttl():
+    return getattr(settings, 'DASHBOARD_STATS_TTL', 60)
+
+
+def compute_stats():
+    """Contadores del dashboard, una consulta por tabla"""
+    now = timezone.now()
+    week_ago = now - timedelta(days=7)
+    month_ago = now - timedelta(days=30)
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    users = User.objects.aggregate(
+        total_usuarios=Count('id', filter=Q(is_active=True)),
+        nuevos_usuarios=Count('id', filter=Q(is_active=True, fecha_registro__gte=month_ago)),
+        total_medicos=Count('id', filter=Q(is_active=True, rol='MEDICO_RADIOLOGO')),
+        nuevos_medicos=Count('id', filter=Q(is_active=True, rol='MEDICO_RADIOLOGO', fecha_registro__gte=week_ago)),
+        total_tecnicos=Count('id', filter=Q(is_active=True, rol='TECNICO_SALUD')),
+        nuevos_tecnicos=Count('id', filter=Q(is_active=True, rol='TECNICO_SALUD', fecha_registro__gte=week_ago)),
+    )
+    diagnoses = AIDiagnosis.objects.aggregate(
+        total_diagnosticos=Count('id'),
+        diagnosticos_semana=Count('id', filter=Q(created_at__gte=week_ago)),
+        validados=Count('id', filter=Q(status='VALIDATED')),
+        descartados=Count('id', filter=Q(status='DISCARDED')),
+    )
+    images = MedicalImage.objects.aggregate(
+        total_imagenes=Count('id', filter=Q(is_active=True)),
+        imagenes_hoy=Count('id', filter=Q(is_active=True, uploaded_at__gte=today)),
+    )
+
+    # Precisión: proporción de diagnósticos revisados que el médico validó
+    validados = diagnoses.pop('validados')
+    revisados = validados + diagnoses.pop('descartados')
+    return {
+        **users,
+        **diagnoses,
+        **images,
+        'diagnosticos_revisados': revisados,
+        'precision_sistema': f'{validados * 100 / revisados:.1f}' if revisados else None,
+    }
+
+
+def get_stats():
+    """Contadores desde el caché; se recalculan si vencieron o se invalidaron"""
+    cache = get_cache()
+    stats = cache.get(CACHE_KEY)
+    if stats is None:
+        stats = compute_stats()
+        cache.set(CACHE_KEY, stats, get_ttl())
+    return stats
+
+
+# Campos que cuentan en las estadísticas; guardar otros (p. ej. ultimo_acceso
+# en cada login) no invalida el caché
+COUNTED_FIELDS = {'is_active', 'rol', 'status', 'created_at', 'fecha_registro', 'uploaded_at'}
+
+
+def invalidate(sender=None, update_fields=None, **kwargs):
+    """Receptor de señales: descarta los contadores cuando cambian los datos"""
+    if update_fields and not COUNTED_FIELDS.intersection(update_fields):
+        return
+    transaction.on_commit(lambda: get_cache().delete(CACHE_KEY))
+
+
+# ================================
+# ACTIVIDAD RECIENTE
+# ================================
+
+LEVELS = {
+    'INFO': ('info', 'Info'),
+    'WARNING': ('warning', 'Advertencia'),
+    'ERROR': ('danger', 'Error'),
+    'CRITICAL': ('danger', 'Crítico'),
+}
+
+ICONS = {
+    'login': ('🔑', 'primary'),
+    'operacion': ('👤', 'info'),
+    'diagnostico': ('🩺', 'success'),
+}
+
+
+def recent_activities(limit=5):
+    """Últimos eventos de Log y DiagnosisLog con el formato del dashboard"""
+    entries, _ = activity_log.page(activity_log.ActivityFilters(), page_size=limit)
+    now = timezone.now()
+    activities = []
+    for entry in entries:
+        icon, kind = ICONS[entry['tipo']]
+        level, level_text = LEVELS.get(entry['nivel'], LEVELS['INFO'])
+        if level == 'warning':
+            icon, kind = '⚠️', 'warning'
+        elif level == 'danger':
+            icon, kind = '⛔', 'danger'
+        activities.append({
+            'icon': icon,
+            'type': kind,
+            'title': entry['accion'],
+            'description': f"{entry['usuario']} - {entry['descripcion']}",
+            'time': f"Hace {timesince(entry['timestamp'], now).split(',')[0]}",
+            'level': level,
+            'level_text': level_text,
+        })
+    return activities
@@ -0,0 +1,58 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.prefix_index import PatientPrefixIndex
+from users.search import normalize
+
+FIRST_NAMES = ['José', 'María', 'Juan', 'Ana', 'Luis', 'Carmen', 'Carlos', 'Lucía', 'Andrés', 'Sofía']
+LAST_NAMES = ['Sánchez', 'Gómez', 'Pérez', 'Rodríguez', 'Martínez', 'López', 'Díaz', 'Muñoz', 'Rojas', 'Castro']
+
+
+def synthetic_rows(count, seed=0):
+    """Pacientes ficticios (id, search_text, nombre, apellido) para medir memoria"""
+    rng = random.Random(seed)
+    for patient_id in range(1, count + 1):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = f'{rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+        identification = str(rng.randrange(10**7, 10**10))
+        email = f'{normalize(first_name)}.{patient_id}@correo.com'
+        search_text = normalize(f'{first_name} {last_name} {identification} {email}')
+        yield patient_id, search_text, first_name, last_name
+
+
+class Command(BaseCommand):
+    help = 'Construye el índice de prefijos de pacientes y muestra su tamaño en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help='Usa N pacientes ficticios en vez de la base de datos',
+        )
+        parser.add_argument('--query', default='', help='Consulta de prueba para medir la latencia')
+
+    def handle(self, *args, **options):
+        index = PatientPrefixIndex()
+        started = time.perf_counter()
+        if options['synthetic']:
+            index.load(synthetic_rows(options['synthetic']))
+        else:
+            index.build()
+        elapsed = time.perf_counter() - started
+
+        stats = index.stats()
+        self.stdout.write(f'Pacientes: {stats["patients"]}')
+        self.stdout.write(f'Entradas (término, paciente): {stats["entries"]}')
+        self.stdout.write(f'Términos distintos: {stats["distinct_tokens"]}')
+        self.stdout.write(f'Construcción: {elapsed:.2f} s')
+        self.stdout.write(f'Memoria: {stats["bytes"] / 1024 / 1024:.1f} MB')
+        self.stdout.write(self.style.SUCCESS(
+            f'Memoria por 100.000 pacientes: {stats["bytes_per_100k"] / 1024 / 1024:.1f} MB'
+        ))
+
+        if options['query']:
+            started = time.perf_counter()
+            ids = index.search(options['query'])
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(f'Consulta "{options["query"]}": {len(ids)} resultados en {elapsed:.2f} ms')
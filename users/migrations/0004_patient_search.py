@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+from users.search import build_search_text, drop_search_index, ensure_search_index
+
+
+def fill_search_text(apps, schema_editor):
+    Patient = apps.get_model('users', 'Patient')
+    batch = []
+    for patient in Patient.objects.only('id', 'first_name', 'last_name', 'identification', 'email').iterator(chunk_size=2000):
+        patient.search_text = build_search_text(patient)
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ['search_text'])
+
+
+def create_search_index(apps, schema_editor):
+    ensure_search_index(schema_editor.connection)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_rolepermission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='search_text',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500, verbose_name='Texto de Búsqueda'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import users.search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_patient_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchIndex',
+            fields=[
+                ('patient', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='users.patient')),
+                ('search_text', users.search.FtsTextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'users_patient_fts',
+                'managed': False,
+            },
+        ),
+    ]
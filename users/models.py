@@ -1,4 +1,8 @@
 from django.db import models
+
+from .search import FtsTextField, build_search_text
+
+
 class Notification(models.Model):
     STATUS_CHOICES = [
         ('analisis', 'En análisis'),
@@ -95,6 +99,15 @@ class Patient(models.Model):
         verbose_name='Activo'
     )
     
+    # Nombres, identificación y correo normalizados (ver users/search.py)
+    search_text = models.CharField(
+        max_length=500,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Texto de Búsqueda'
+    )
+    
     class Meta:
         verbose_name = 'Paciente'
         verbose_name_plural = 'Pacientes'
@@ -108,6 +121,14 @@ class Patient(models.Model):
     def __str__(self):
         return f"{self.get_full_name()} ({self.identification})"
     
+    def save(self, *args, **kwargs):
+        """Mantiene search_text sincronizado con los campos buscables"""
+        self.search_text = build_search_text(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'search_text'}
+        super().save(*args, **kwargs)
+    
     def get_full_name(self):
         """Obtener nombre completo del paciente"""
         return f"{self.first_name} {self.last_name}".strip()
@@ -124,3 +145,25 @@ class Patient(models.Model):
     def get_gender_display_spanish(self):
         """Obtener género en español"""
         return dict(self.GENDER_CHOICES).get(self.gender, 'Otro')
+
+
+class PatientSearchIndex(models.Model):
+    """
+    Tabla FTS5 users_patient_fts (solo SQLite), creada en la migración 0004.
+    No la administra Django: se declara para unirla a Patient en las
+    búsquedas y ordenar por su columna rank (bm25).
+    """
+    patient = models.OneToOneField(
+        Patient,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='search_index'
+    )
+    search_text = FtsTextField()
+    rank = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'users_patient_fts'
@@ -0,0 +1,465 @@
+# ================================
+# Índice de prefijos en memoria para el autocompletado de pacientes
+# ARCHIVO: users/prefix_index.py
+# ================================
+# Cada proceso puede mantener una lista ordenada de (término, id de paciente)
+# con los términos de Patient.search_text de los pacientes activos. Buscar un
+# prefijo es una búsqueda binaria (bisect) sobre esa lista, sin ir a la base
+# de datos; la BD solo se consulta después para traer las pocas filas a
+# mostrar.
+#
+# Mantenimiento:
+#   - Se construye en segundo plano al iniciar el proceso (warm_up, llamado
+#     desde wsgi.py/asgi.py) o en el primer uso.
+#   - post_save/post_delete de Patient lo actualizan en el proceso que hizo
+#     el cambio (al confirmar la transacción) e incrementan una versión en el
+#     caché compartido PATIENT_PREFIX_INDEX_CACHE.
+#   - Cada PATIENT_PREFIX_INDEX_CHECK_INTERVAL segundos se compara esa versión
+#     con la del índice; si otro proceso hizo cambios, un hilo aplica las
+#     filas con updated_at reciente, y si el número de pacientes no cuadra
+#     (borrados masivos, update() sin señales) reconstruye el índice. Mientras
+#     tanto las consultas usan el índice anterior: la petición nunca espera
+#     una sincronización.
+#   - Los términos nuevos van a una lista ordenada pequeña (delta) y los
+#     pacientes cambiados o borrados se marcan como obsoletos en la lista
+#     principal; ambas se fusionan en una sola pasada cuando el delta crece.
+#     Insertar no desplaza la lista principal.
+#
+# Desactivado por defecto: PATIENT_PREFIX_INDEX_ENABLED = True para usarlo.
+
+import heapq
+import logging
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .search import TOKEN_RE, normalize, tokenize
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'users:patient_prefix_index:version'
+
+# Holgura al buscar filas modificadas desde la última sincronización
+SYNC_MARGIN = timedelta(seconds=2)
+
+# Mayor que cualquier carácter: prefix + PREFIX_END acota el rango del prefijo
+PREFIX_END = '\U0010ffff'
+
+
+def is_enabled():
+    return getattr(settings, 'PATIENT_PREFIX_INDEX_ENABLED', False)
+
+
+def get_check_interval():
+    return getattr(settings, 'PATIENT_PREFIX_INDEX_CHECK_INTERVAL', 5.0)
+
+
+def get_cache():
+    return caches[getattr(settings, 'PATIENT_PREFIX_INDEX_CACHE', 'shared')]
+
+
+def current_version():
+    return get_cache().get(VERSION_KEY, 0)
+
+
+def bump_version():
+    """Incrementa la versión compartida y retorna el nuevo valor"""
+    cache = get_cache()
+    cache.add(VERSION_KEY, 0, timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # La clave expiró o fue expulsada entre add e incr
+        cache.set(VERSION_KEY, 1, timeout=None)
+        return 1
+
+
+def document(search_text, first_name, last_name):
+    """(términos, clave de orden) de un paciente"""
+    tokens = tuple(sorted({sys.intern(token) for token in TOKEN_RE.findall(search_text or '')}))
+    return tokens, normalize(f'{last_name} {first_name}')
+
+
+class PatientPrefixIndex:
+    """
+    Términos ordenados en `_tokens` con el id del paciente en la misma
+    posición de `_ids`; los agregados después de construir van en
+    `_delta_tokens`/`_delta_ids`. Las entradas principales de los pacientes
+    en `_stale` ya no valen. `_docs` guarda los términos y la clave de orden
+    de cada paciente para poder quitarlo o verificar los demás términos.
+    """
+
+    FIELDS = ('id', 'search_text', 'first_name', 'last_name', 'is_active')
+
+    # El delta se fusiona al superar este tamaño o 1/16 de la lista principal
+    COMPACT_MIN_ENTRIES = 4096
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tokens = []
+        self._ids = array('q')
+        self._delta_tokens = []
+        self._delta_ids = array('q')
+        self._in_delta = set()
+        self._stale = set()
+        self._docs = {}
+        self._syncing = False
+        self.version = None
+        self.synced_at = None
+        self.checked_at = 0.0
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ---- Construcción ----
+
+    def load(self, rows):
+        """Reemplaza el contenido con filas (id, search_text, first_name, last_name)"""
+        docs = {}
+        pairs = []
+        for patient_id, search_text, first_name, last_name in rows:
+            tokens, sort_key = document(search_text, first_name, last_name)
+            docs[patient_id] = (tokens, sort_key)
+            pairs.extend((token, patient_id) for token in tokens)
+        pairs.sort()
+
+        tokens = [token for token, _ in pairs]
+        ids = array('q', (patient_id for _, patient_id in pairs))
+        with self._lock:
+            self._tokens, self._ids, self._docs = tokens, ids, docs
+            self._delta_tokens, self._delta_ids = [], array('q')
+            self._in_delta, self._stale = set(), set()
+
+    def build(self):
+        """Construye el índice desde la base de datos (pacientes activos)"""
+        from .models import Patient
+
+        # La versión se lee antes: cambios durante la carga provocan una
+        # sincronización en la siguiente verificación
+        version = current_version()
+        started = time.monotonic()
+        synced_at = timezone.now()
+        self.load(
+            Patient.objects.filter(is_active=True)
+            .values_list('id', 'search_text', 'first_name', 'last_name')
+            .iterator(chunk_size=5000)
+        )
+        with self._lock:
+            self.version = version
+            self.synced_at = synced_at
+            self.checked_at = time.monotonic()
+        logger.info(
+            'Índice de prefijos de pacientes: %s pacientes en %.2f s',
+            len(self), time.monotonic() - started,
+        )
+
+    # ---- Actualización incremental ----
+
+    def _insert(self, patient_id, tokens, sort_key):
+        # Solo se desplaza el delta, no la lista principal
+        for token in tokens:
+            position = bisect_right(self._delta_tokens, token)
+            self._delta_tokens.insert(position, token)
+            self._delta_ids.insert(position, patient_id)
+        self._in_delta.add(patient_id)
+        self._docs[patient_id] = (tokens, sort_key)
+
+    def _remove(self, patient_id):
+        doc = self._docs.pop(patient_id, None)
+        if doc is None:
+            return
+        # Sus entradas principales, si las tiene, se descartan al fusionar
+        self._stale.add(patient_id)
+        if patient_id not in self._in_delta:
+            return
+        self._in_delta.discard(patient_id)
+        for token in doc[0]:
+            lo = bisect_left(self._delta_tokens, token)
+            hi = bisect_right(self._delta_tokens, token, lo)
+            for position in range(lo, hi):
+                if self._delta_ids[position] == patient_id:
+                    del self._delta_tokens[position]
+                    del self._delta_ids[position]
+                    break
+
+    def _apply(self, patient_id, search_text, first_name, last_name, is_active):
+        if is_active:
+            tokens, sort_key = document(search_text, first_name, last_name)
+            if self._docs.get(patient_id) == (tokens, sort_key):
+                return
+            self._remove(patient_id)
+            self._insert(patient_id, tokens, sort_key)
+        else:
+            self._remove(patient_id)
+
+    def _compact_threshold(self):
+        return max(self.COMPACT_MIN_ENTRIES, len(self._tokens) // 16)
+
+    def _maybe_compact(self):
+        threshold = self._compact_threshold()
+        if len(self._delta_tokens) > threshold or len(self._stale) > threshold:
+            self.compact()
+
+    def compact(self):
+        """Fusiona el delta con la lista principal y quita las entradas obsoletas"""
+        with self._lock:
+            stale = self._stale
+            base = (
+                (token, patient_id) for token, patient_id in zip(self._tokens, self._ids)
+                if patient_id not in stale
+            )
+            pairs = list(heapq.merge(base, zip(self._delta_tokens, self._delta_ids)))
+            self._tokens = [token for token, _ in pairs]
+            self._ids = array('q', (patient_id for _, patient_id in pairs))
+            self._delta_tokens, self._delta_ids = [], array('q')
+            self._in_delta, self._stale = set(), set()
+
+    def apply(self, patient_id, search_text, first_name, last_name, is_active):
+        """Agrega, actualiza o quita (si está inactivo) un paciente"""
+        self.apply_many([(patient_id, search_text, first_name, last_name, is_active)])
+
+    def apply_many(self, rows):
+        """apply() para varias filas (FIELDS), con una sola fusión al final"""
+        with self._lock:
+            for row in rows:
+                self._apply(*row)
+            self._maybe_compact()
+
+    def discard(self, patient_id):
+        with self._lock:
+            self._remove(patient_id)
+            self._maybe_compact()
+
+    def sync(self):
+        """Aplica los cambios hechos por otros procesos desde la última sincronización"""
+        from .models import Patient
+
+        version = current_version()
+        synced_at = timezone.now()
+        # Se leen antes de tomar el bloqueo: las consultas no esperan a la BD
+        changed = list(
+            Patient.objects.filter(updated_at__gte=self.synced_at - SYNC_MARGIN).values_list(*self.FIELDS)
+        )
+        self.apply_many(changed)
+
+        # Los borrados no dejan fila: si el total no cuadra se reconstruye
+        if Patient.objects.filter(is_active=True).count() != len(self):
+            self.build()
+            return
+        with self._lock:
+            self.version = version
+            self.synced_at = synced_at
+
+    def check_version(self, background=True):
+        """
+        Sincroniza si la versión compartida cambió (como máximo una vez por
+        intervalo). Con `background` la sincronización corre en un hilo y la
+        petición sigue con el índice actual.
+        """
+        now = time.monotonic()
+        if now - self.checked_at < get_check_interval():
+            return
+        self.checked_at = now
+        if current_version() == self.version:
+            return
+        if not background:
+            self.sync()
+            return
+        with self._lock:
+            if self._syncing:
+                return
+            self._syncing = True
+        threading.Thread(target=self._sync_in_background, name='patient-prefix-index-sync', daemon=True).start()
+
+    def _sync_in_background(self):
+        try:
+            self.sync()
+        except Exception:
+            logger.exception('No se pudo sincronizar el índice de prefijos de pacientes')
+        finally:
+            self._syncing = False
+            connection.close()
+
+    # ---- Consulta ----
+
+    def _span(self, prefix):
+        """Rangos del prefijo en la lista principal y en el delta"""
+        end = prefix + PREFIX_END
+        lo = bisect_left(self._tokens, prefix)
+        delta_lo = bisect_left(self._delta_tokens, prefix)
+        return (
+            lo, bisect_left(self._tokens, end, lo),
+            delta_lo, bisect_left(self._delta_tokens, end, delta_lo),
+        )
+
+    def _span_ids(self, span):
+        lo, hi, delta_lo, delta_hi = span
+        ids = set(self._ids[lo:hi])
+        if self._stale:
+            ids -= self._stale
+        ids.update(self._delta_ids[delta_lo:delta_hi])
+        return ids
+
+    def search(self, query, limit=10):
+        """
+        Ids de los pacientes cuyos términos empiezan por cada término de
+        `query`, ordenados por apellido y nombre.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            # Del término más selectivo al menos selectivo
+            ranges = sorted(
+                {term: self._span(term) for term in terms}.items(),
+                key=lambda item: item[1][1] - item[1][0] + item[1][3] - item[1][2],
+            )
+            candidates = self._span_ids(ranges[0][1])
+            for term, span in ranges[1:]:
+                if not candidates:
+                    break
+                if span[1] - span[0] + span[3] - span[2] <= 8 * len(candidates):
+                    candidates &= self._span_ids(span)
+                else:
+                    # Rango muy amplio (prefijo corto): se revisan los candidatos
+                    candidates = {
+                        patient_id for patient_id in candidates
+                        if any(token.startswith(term) for token in self._docs[patient_id][0])
+                    }
+            return heapq.nsmallest(
+                limit, candidates, key=lambda patient_id: (self._docs[patient_id][1], patient_id)
+            )
+
+    # ---- Estadísticas ----
+
+    def memory_usage(self):
+        """Bytes aproximados que ocupa el índice (sys.getsizeof de sus estructuras)"""
+        with self._lock:
+            size = sum(sys.getsizeof(part) for part in (
+                self._tokens, self._ids, self._delta_tokens, self._delta_ids, self._docs,
+            ))
+            seen = set()
+            for token in self._tokens + self._delta_tokens:
+                # Los términos están internados: cada texto se cuenta una vez
+                if id(token) not in seen:
+                    seen.add(id(token))
+                    size += sys.getsizeof(token)
+            for patient_id, (tokens, sort_key) in self._docs.items():
+                size += sys.getsizeof(patient_id) + sys.getsizeof(tokens) + sys.getsizeof(sort_key)
+            return size
+
+    def stats(self):
+        size = self.memory_usage()
+        patients = len(self)
+        return {
+            'patients': patients,
+            'entries': len(self._tokens) + len(self._delta_tokens),
+            'distinct_tokens': len(set(self._tokens).union(self._delta_tokens)),
+            'bytes': size,
+            'bytes_per_100k': size * 100000 // patients if patients else 0,
+            'version': self.version,
+        }
+
+
+# ================================
+# Índice del proceso
+# ================================
+
+_index = None
+_building = False
+_state_lock = threading.Lock()
+
+
+def build_index():
+    """Construye el índice del proceso de forma síncrona y lo retorna"""
+    global _index
+    index = PatientPrefixIndex()
+    index.build()
+    _index = index
+    return index
+
+
+def warm_up(background=True):
+    """Construye el índice al iniciar el proceso, si está activado"""
+    global _building
+    if not is_enabled():
+        return
+    with _state_lock:
+        if _index is not None or _building:
+            return
+        _building = True
+
+    def run():
+        global _building
+        try:
+            build_index()
+        except Exception:
+            logger.exception('No se pudo construir el índice de prefijos de pacientes')
+        finally:
+            _building = False
+            if background:
+                connection.close()
+
+    if background:
+        threading.Thread(target=run, name='patient-prefix-index', daemon=True).start()
+    else:
+        run()
+
+
+def get_index():
+    """
+    Índice listo para consultar, o None si está desactivado o aún se está
+    construyendo (en ese caso se usa la búsqueda en base de datos).
+    """
+    if not is_enabled():
+        return None
+    index = _index
+    if index is None:
+        warm_up()
+        return None
+    index.check_version()
+    return index
+
+
+def reset_index():
+    """Descarta el índice del proceso (pruebas)"""
+    global _index
+    _index = None
+
+
+# ================================
+# Señales de Patient
+# ================================
+
+def _after_change(update):
+    def on_commit():
+        index = _index
+        if index is not None:
+            update(index)
+        version = bump_version()
+        # Si nadie más cambió la versión, el índice local ya está al día
+        if index is not None and index.version is not None and version == index.version + 1:
+            index.version = version
+    transaction.on_commit(on_commit)
+
+
+def patient_saved(sender, instance, **kwargs):
+    if not is_enabled():
+        return
+    row = (instance.pk, instance.search_text, instance.first_name, instance.last_name, instance.is_active)
+    _after_change(lambda index: index.apply(*row))
+
+
+def patient_deleted(sender, instance, **kwargs):
+    if not is_enabled():
+        return
+    patient_id = instance.pk
+    _after_change(lambda index: index.discard(patient_id))
@@ -0,0 +1,204 @@
+# ================================
+# Búsqueda indexada de pacientes
+# ARCHIVO: users/search.py
+# ================================
+# Patient.search_text guarda nombres, identificación y correo normalizados
+# (sin tildes, en minúsculas). Sobre esa columna:
+#   - SQLite: tabla FTS5 users_patient_fts mantenida con triggers, unida a
+#     Patient como el modelo no administrado PatientSearchIndex
+#   - PostgreSQL: índice GIN de trigramas (pg_trgm)
+#   - Otros motores: LIKE sobre la columna normalizada
+# "Sanchez" encuentra "Sánchez" en todos los casos.
+
+import re
+import unicodedata
+
+from django.db import connection, models
+
+FTS_TABLE = 'users_patient_fts'
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Índice de texto completo con contenido externo: no duplica search_text.
+# Los triggers lo mantienen al día con cada INSERT/UPDATE/DELETE.
+SQLITE_FTS_TABLE = f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    search_text, content='users_patient', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+)"""
+
+SQLITE_FTS_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON users_patient BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    f'{FTS_TABLE}_ad': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON users_patient BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    END""",
+    f'{FTS_TABLE}_au': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON users_patient BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+}
+
+POSTGRES_TRIGRAM = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS users_patient_search_trgm ON users_patient USING gin (search_text gin_trgm_ops)',
+]
+
+
+class FtsTextField(models.TextField):
+    """Columna de una tabla FTS5; admite el lookup __match"""
+
+
+@FtsTextField.register_lookup
+class FtsMatch(models.Lookup):
+    """columna MATCH consulta (sintaxis de consultas de FTS5)"""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+def normalize(text):
+    """Minúsculas, sin tildes ni diacríticos y con espacios simples"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.lower().split())
+
+
+def build_search_text(patient):
+    """Valor de Patient.search_text"""
+    return normalize(' '.join(filter(None, [
+        patient.first_name,
+        patient.last_name,
+        patient.identification,
+        patient.email,
+    ])))
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(normalize(query))
+
+
+def fts_available():
+    """
+    La tabla FTS5 existe (se crea en la migración si SQLite trae FTS5).
+    Se consulta una vez por conexión y base de datos.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    key = connection.settings_dict['NAME']
+    cached = getattr(connection, '_patient_fts', None)
+    if cached is None or cached[0] != key:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            cached = (key, cursor.fetchone() is not None)
+        connection._patient_fts = cached
+    return cached[1]
+
+
+def sqlite_has_fts5(conn):
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)')
+            cursor.execute('DROP TABLE temp._fts5_probe')
+            return True
+        except Exception:
+            return False
+
+
+def ensure_search_index(conn):
+    """
+    Crea (si faltan) el índice de búsqueda del motor de `conn`.
+    En SQLite, cuando Django reconstruye users_patient en una migración los
+    triggers se pierden: se recrean aquí y el índice FTS se reconstruye.
+    """
+    if conn.vendor == 'postgresql':
+        with conn.cursor() as cursor:
+            for statement in POSTGRES_TRIGRAM:
+                cursor.execute(statement)
+        return
+    if conn.vendor != 'sqlite' or not sqlite_has_fts5(conn):
+        # Sin índice especial: se usa LIKE sobre search_text
+        return
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+            [f'{FTS_TABLE}%'],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in SQLITE_FTS_TRIGGERS if name not in existing]
+        if FTS_TABLE in existing and not missing:
+            return
+        cursor.execute(SQLITE_FTS_TABLE)
+        for name in missing:
+            cursor.execute(SQLITE_FTS_TRIGGERS[name])
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    if hasattr(conn, '_patient_fts'):
+        del conn._patient_fts
+
+
+def drop_search_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS users_patient_search_trgm')
+        elif conn.vendor == 'sqlite':
+            for name in SQLITE_FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def _fts_search(queryset, tokens):
+    # Cada término como prefijo: "sanc" encuentra "sanchez". La tabla FTS se
+    # une una sola vez (PatientSearchIndex) y se ordena por su rank (bm25,
+    # menor es mejor); la condición MATCH va en el ON de la unión.
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    queryset = queryset.annotate(
+        fts=models.FilteredRelation('search_index', condition=models.Q(search_index__search_text__match=match)),
+    )
+    # Los números también son prefijos: "1122" encuentra la identificación
+    # "CC-112233" por su término 112233. Sin LIKE '%n%' la consulta sigue
+    # siendo una sola búsqueda en el índice FTS.
+    return queryset.filter(fts__isnull=False).annotate(
+        search_rank=models.F('fts__rank'),
+    ).order_by(models.F('search_rank').asc(nulls_last=True), 'last_name', 'first_name')
+
+
+def _trigram_search(queryset, tokens):
+    condition = models.Q()
+    for token in tokens:
+        condition &= models.Q(search_text__contains=token)
+    similarity = models.Func(
+        models.F('search_text'), models.Value(' '.join(tokens)),
+        function='similarity', output_field=models.FloatField(),
+    )
+    return queryset.filter(condition).annotate(
+        search_rank=-similarity
+    ).order_by('search_rank', 'last_name', 'first_name')
+
+
+def _like_search(queryset, tokens):
+    condition = models.Q()
+    for token in tokens:
+        condition &= models.Q(search_text__contains=token)
+    return queryset.filter(condition).order_by('last_name', 'first_name')
+
+
+def search_patients(queryset, query):
+    """
+    Filtra `queryset` (de Patient) por `query` y ordena por relevancia.
+    Todos los términos deben aparecer (como prefijo de palabra en FTS5,
+    también los números de la identificación).
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        return _trigram_search(queryset, tokens)
+    if fts_available():
+        return _fts_search(queryset, tokens)
+    return _like_search(queryset, tokens)
@@ -1,21 +1,62 @@
-from django.test import TestCase
+import io
+import zipfile
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
-from authentication.models import User
+from authentication.models import Log, User
 from .models import Patient
-from diagnostico.models import AIDiagnosis
+from .search import search_patients
+from . import activity_log, dashboard_stats, prefix_index
+from diagnostico.models import AIDiagnosis, DiagnosisLog
+from diagnostico.tasks import DiagnosisQueue
 from datetime import date
 
+
+def create_doctor():
+	"""Médico radiólogo de prueba"""
+	return User.objects.create_user(
+		email='doc@example.com',
+		password='testpassword',
+		first_name='Doctor',
+		last_name='Tester',
+		identificacion='DOC123',
+		rol='MEDICO_RADIOLOGO'
+	)
+
+
+def create_admin():
+	"""Administrador de prueba"""
+	return User.objects.create_user(
+		email='admin@example.com',
+		password='testpassword',
+		first_name='Admin',
+		last_name='Tester',
+		identificacion='ADM1',
+		rol='ADMINISTRADOR'
+	)
+
+
+def create_patient(user):
+	"""Paciente con tildes en el apellido, para las búsquedas"""
+	return Patient.objects.create(
+		identification='CC-778899',
+		first_name='José',
+		last_name='Sánchez',
+		date_of_birth=date(1975, 5, 5),
+		gender='M',
+		created_by=user,
+	)
+
+
 class DiagnosisHistoryTests(TestCase):
 	def setUp(self):
 		# Crear usuario médico radiólogo
-		self.user = User.objects.create_user(
-			email='doc@example.com',
-			password='testpassword',
-			first_name='Doctor',
-			last_name='Tester',
-			identificacion='DOC123',
-			rol='MEDICO_RADIOLOGO'
-		)
+		self.user = create_doctor()
 
 		# Crear paciente
 		self.patient = Patient.objects.create(
@@ -64,3 +105,294 @@ class DiagnosisHistoryTests(TestCase):
 		# Should redirect to dashboard since permission denied
 		self.assertEqual(response.status_code, 302)
 # Create your tests here.
+
+
+class PatientSearchTests(TestCase):
+	def setUp(self):
+		self.user = create_doctor()
+		self.patient = create_patient(self.user)
+		self.other = Patient.objects.create(
+			identification='CC-112233',
+			first_name='Ana',
+			last_name='Pérez',
+			date_of_birth=date(1990, 2, 2),
+			gender='F',
+			created_by=self.user,
+		)
+
+	def test_search_ignores_accents_and_case(self):
+		results = list(search_patients(Patient.objects.all(), 'jose SANCHEZ'))
+		self.assertEqual(results, [self.patient])
+
+	def test_search_matches_prefixes_and_identification(self):
+		self.assertEqual(list(search_patients(Patient.objects.all(), 'sanc')), [self.patient])
+		self.assertEqual(list(search_patients(Patient.objects.all(), '778899')), [self.patient])
+
+	def test_search_matches_identification_digits_as_a_prefix(self):
+		self.assertEqual(list(search_patients(Patient.objects.all(), '1122')), [self.other])
+		self.assertEqual(list(search_patients(Patient.objects.all(), 'ana 1122')), [self.other])
+		self.assertFalse(search_patients(Patient.objects.all(), 'jose 1122').exists())
+		with CaptureQueriesContext(connection) as context:
+			self.assertFalse(search_patients(Patient.objects.all(), '2233').exists())
+		[query] = context.captured_queries
+		self.assertNotIn('LIKE', query['sql'])
+
+	def test_search_joins_the_index_once(self):
+		with CaptureQueriesContext(connection) as context:
+			list(search_patients(Patient.objects.all(), 'sanchez'))
+		[query] = context.captured_queries
+		self.assertEqual(query['sql'].count('MATCH'), 1)
+
+	def test_search_text_follows_updates(self):
+		self.patient.last_name = 'Gómez'
+		self.patient.save(update_fields=['last_name'])
+		self.assertFalse(search_patients(Patient.objects.all(), 'sanchez').exists())
+		self.assertEqual(list(search_patients(Patient.objects.all(), 'gomez')), [self.patient])
+
+
+@override_settings(PATIENT_PREFIX_INDEX_ENABLED=True)
+class PatientPrefixIndexTests(TestCase):
+	def setUp(self):
+		self.user = create_doctor()
+		self.patient = create_patient(self.user)
+		self.index = prefix_index.build_index()
+		self.addCleanup(prefix_index.reset_index)
+
+	def test_search_by_prefixes(self):
+		self.assertEqual(self.index.search('sanc jo'), [self.patient.id])
+		self.assertEqual(self.index.search('7788'), [self.patient.id])
+		self.assertEqual(self.index.search('gomez'), [])
+
+	def test_signals_keep_index_current(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			other = Patient.objects.create(
+				identification='CC-112233',
+				first_name='Ana',
+				last_name='Sánchez',
+				date_of_birth=date(1990, 2, 2),
+				gender='F',
+				created_by=self.user,
+			)
+		self.assertEqual(self.index.search('sanchez'), [other.id, self.patient.id])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.patient.is_active = False
+			self.patient.save()
+		self.assertEqual(self.index.search('sanchez'), [other.id])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			other.delete()
+		self.assertEqual(self.index.search('sanchez'), [])
+		self.assertEqual(self.index.version, prefix_index.current_version())
+
+	def test_changes_from_another_process_are_synced_in_the_background(self):
+		# Otro proceso: crea el paciente sin actualizar este índice y sube la versión
+		with self.settings(PATIENT_PREFIX_INDEX_ENABLED=False):
+			other = Patient.objects.create(
+				identification='CC-445566',
+				first_name='Luis',
+				last_name='Sanabria',
+				date_of_birth=date(1980, 4, 4),
+				gender='M',
+				created_by=self.user,
+			)
+		prefix_index.bump_version()
+		self.index.checked_at = 0.0
+
+		with mock.patch.object(prefix_index.threading, 'Thread') as thread:
+			self.assertIs(prefix_index.get_index(), self.index)
+		# La petición sigue con el índice anterior y la sincronización va a un hilo
+		thread.return_value.start.assert_called_once_with()
+		self.assertEqual(self.index.search('sana'), [])
+
+		self.index._sync_in_background()
+		self.assertEqual(self.index.search('sana'), [other.id])
+		self.assertEqual(self.index.version, prefix_index.current_version())
+
+	def test_delta_is_merged_into_the_main_list(self):
+		rows = [
+			(1000 + i, f'paciente{i} sanchez cc-{i}', f'Paciente{i}', 'Sánchez', True)
+			for i in range(5)
+		]
+		with mock.patch.object(prefix_index.PatientPrefixIndex, 'COMPACT_MIN_ENTRIES', 8):
+			self.index.apply_many(rows[:2])
+			self.assertEqual(len(self.index._delta_tokens), 8)
+			self.index.discard(self.patient.id)
+			self.index.apply_many(rows[2:])
+		self.assertEqual(self.index._delta_tokens, [])
+		self.assertEqual(self.index._stale, set())
+		self.assertEqual(self.index.search('sanchez', limit=20), [row[0] for row in rows])
+		self.assertEqual(self.index.search('paciente3'), [1003])
+
+
+class ExportTests(TestCase):
+	def setUp(self):
+		self.admin = create_admin()
+		Log.objects.bulk_create([
+			Log(user=self.admin, accion='LOGIN_SUCCESS' if i % 2 else 'USER_CREATED', descripcion=f'Evento <{i}> & más')
+			for i in range(1201)
+		])
+		self.client.force_login(self.admin)
+
+	@override_settings(EXPORT_CHUNK_SIZE=100)
+	def test_monitoring_csv_export_streams_filtered_logs(self):
+		response = self.client.get(reverse('users:monitoring'), {'export': 'csv', 'tipo': 'login'})
+
+		self.assertTrue(response.streaming)
+		content = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+		self.assertEqual(content[0], 'Fecha,Fuente,Usuario,Email,Acción,Nivel,Descripción,IP')
+		self.assertEqual(len(content), 1 + 600)
+		self.assertIn('Login exitoso', content[1])
+
+	def test_monitoring_xlsx_export_is_a_valid_workbook(self):
+		response = self.client.get(reverse('users:monitoring'), {'export': 'xlsx'})
+
+		chunks = list(response.streaming_content)
+		self.assertGreater(len(chunks), 1)
+		with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+			self.assertIsNone(archive.testzip())
+			sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+		self.assertEqual(sheet.count('<row>'), 1 + 1201)
+		self.assertIn('Evento &lt;0&gt; &amp; más', sheet)
+
+	def test_export_requires_administrator(self):
+		tecnico = User.objects.create_user(
+			email='tec@example.com', password='testpassword', first_name='Tec', last_name='Nico',
+			identificacion='TEC1', rol='TECNICO_SALUD'
+		)
+		self.client.force_login(tecnico)
+		response = self.client.get(reverse('users:monitoring'), {'export': 'csv'})
+		self.assertRedirects(response, reverse('users:user_dashboard'), fetch_redirect_response=False)
+
+
+class ActivityMonitorTests(TestCase):
+	def setUp(self):
+		self.admin = create_admin()
+		patient = Patient.objects.create(
+			identification='P3001',
+			first_name='Paciente',
+			last_name='Monitor',
+			date_of_birth=date(1980, 1, 1),
+			gender='F',
+			created_by=self.admin,
+		)
+		diagnosis = AIDiagnosis.objects.create(patient=patient, requested_by=self.admin)
+		# Varios eventos de ambas tablas comparten el mismo instante
+		moment = timezone.now()
+		Log.objects.bulk_create([
+			Log(user=self.admin, accion='LOGIN_SUCCESS', descripcion=f'Log {i}', timestamp=moment)
+			for i in range(7)
+		])
+		DiagnosisLog.objects.bulk_create([
+			DiagnosisLog(diagnosis=diagnosis, action='CREATED', performed_by=self.admin, timestamp=moment)
+			for _ in range(6)
+		])
+		self.client.force_login(self.admin)
+
+	def walk(self, filters, page_size):
+		seen, cursor, queries = [], None, []
+		while True:
+			with CaptureQueriesContext(connection) as context:
+				entries, cursor = activity_log.page(filters, activity_log.decode_cursor(cursor), page_size)
+			queries.append(len(context.captured_queries))
+			seen.extend((entry['rank'], entry['id']) for entry in entries)
+			if not cursor:
+				return seen, queries
+
+	def test_keyset_pages_cover_both_sources_without_gaps(self):
+		seen, queries = self.walk(activity_log.ActivityFilters(), page_size=4)
+
+		self.assertEqual(len(seen), 13)
+		self.assertEqual(len(set(seen)), 13)
+		self.assertEqual(len(set(queries)), 1)
+
+	def test_filters_select_sources(self):
+		logins, _ = self.walk(activity_log.ActivityFilters(tipo='login'), page_size=5)
+		diagnosticos, _ = self.walk(activity_log.ActivityFilters(tipo='diagnostico'), page_size=5)
+		nadie, _ = self.walk(activity_log.ActivityFilters(usuario='nadie'), page_size=5)
+
+		self.assertEqual({rank for rank, _ in logins}, {1})
+		self.assertEqual(len(diagnosticos), 6)
+		self.assertEqual(nadie, [])
+
+	def test_view_links_to_next_page(self):
+		response = self.client.get(reverse('users:monitoring'), {'usuario': 'admin'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.context['logs']), 13)
+		self.assertIsNone(response.context['next_url'])
+
+
+class AdminDashboardStatsTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		dashboard_stats.get_cache().clear()
+		self.admin = create_admin()
+		self.client.force_login(self.admin)
+		# La primera petición registra la actividad de la sesión
+		self.client.get(reverse('users:admin_dashboard'))
+
+	def add_data(self, count):
+		start = User.objects.count()
+		User.objects.bulk_create([
+			User(
+				email=f'medico{i}@example.com', password='!',
+				first_name='Med', last_name=str(i), identificacion=f'MED{i}', rol='MEDICO_RADIOLOGO'
+			)
+			for i in range(start, start + count)
+		])
+		Log.objects.bulk_create([
+			Log(user=self.admin, accion='USER_CREATED', descripcion=f'Usuario {i}') for i in range(count)
+		])
+
+	def dashboard_queries(self):
+		dashboard_stats.get_cache().delete(dashboard_stats.CACHE_KEY)
+		with CaptureQueriesContext(connection) as context:
+			response = self.client.get(reverse('users:admin_dashboard'))
+		self.assertEqual(response.status_code, 200)
+		return len(context.captured_queries), response
+
+	def test_query_count_does_not_depend_on_data_size(self):
+		self.add_data(2)
+		few, _ = self.dashboard_queries()
+		self.add_data(20)
+		many, response = self.dashboard_queries()
+
+		self.assertEqual(few, many)
+		self.assertEqual(response.context['total_medicos'], 22)
+		self.assertEqual(len(response.context['system_activities']), 5)
+		self.assertEqual(response.context['system_activities'][0]['title'], 'Usuario creado')
+
+	def test_stats_are_cached_until_data_changes(self):
+		self.dashboard_queries()
+		with CaptureQueriesContext(connection) as context:
+			self.client.get(reverse('users:admin_dashboard'))
+		# Los contadores salen del caché: ninguna consulta a diagnósticos ni imágenes
+		self.assertFalse(any(
+			'diagnostico_aidiagnosis' in q['sql'] or 'medical_images_medicalimage' in q['sql']
+			for q in context.captured_queries
+		))
+
+		with self.captureOnCommitCallbacks(execute=True):
+			User.objects.create_user(
+				email='medico@example.com', password='x', first_name='Med', last_name='Nuevo',
+				identificacion='MED1', rol='MEDICO_RADIOLOGO'
+			)
+		response = self.client.get(reverse('users:admin_dashboard'))
+		self.assertEqual(response.context['total_medicos'], 1)
+
+	@override_settings(AUDIT_LOG_ASYNC=False)
+	def test_queue_transitions_invalidate_the_shared_stats(self):
+		patient = create_patient(self.admin)
+		diagnosis = DiagnosisQueue.enqueue(patient, self.admin, [])
+		self.client.get(reverse('users:admin_dashboard'))
+		self.assertIsNotNone(dashboard_stats.get_cache().get(dashboard_stats.CACHE_KEY))
+
+		with self.captureOnCommitCallbacks(execute=True):
+			DiagnosisQueue.claim('worker-1')
+		self.assertIsNone(dashboard_stats.get_cache().get(dashboard_stats.CACHE_KEY))
+
+		self.client.get(reverse('users:admin_dashboard'))
+		with self.captureOnCommitCallbacks(execute=True):
+			DiagnosisQueue.complete(diagnosis, 'worker-1', {'diagnosis_result': 'Sin hallazgos'})
+		self.assertIsNone(dashboard_stats.get_cache().get(dashboard_stats.CACHE_KEY))
@@ -62,58 +62,100 @@ def manage_permissions_view(request):
 from django.views.decorators.http import require_http_methods
 
 # CU-020: Reportes Estadísticos
+from datetime import date, timedelta
 from django.contrib import messages
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from django.utils import timezone
+from diagnostico import rollups
+from diagnostico.models import AIDiagnosis
+from . import exports
+
+# Rango por defecto de los reportes
+REPORT_DEFAULT_DAYS = 30
+
+
+def _report_date(value, default):
+    try:
+        return date.fromisoformat(value) if value else default
+    except ValueError:
+        return default
+
+
+def _report_table(report_type, report_data, statuses):
+    """Encabezado y filas de un reporte, en el orden de la tabla en pantalla"""
+    if report_type == "precision":
+        header = ["Fecha", "Precisión (%)", "Confianza media (%)", "Revisados"]
+        rows = ([r["fecha"], r["precision"], r["confianza"], r["revisados"]] for r in report_data)
+    elif report_type == "diagnosticos":
+        header = ["Fecha", "Cantidad"] + [label for _, label in statuses]
+        rows = ([r["fecha"], r["cantidad"], *r["por_estado"]] for r in report_data)
+    else:
+        header = ["Modelo", "Diagnósticos", "Confianza media (%)", "Tiempo medio (s)",
+                  "p50 (s)", "p95 (s)", "Validados (%)", "Descartados (%)"]
+        rows = (
+            [r["modelo"], r["cantidad"], r["confianza"], r["tiempo_medio"], r["tiempo_p50"],
+             r["tiempo_p95"], r["validados"], r["descartados"]]
+            for r in report_data
+        )
+    return header, rows
+
 
 @login_required
 @require_http_methods(["GET", "POST"])
 def reports_view(request):
     """
     Vista para CU-020: Generar Reportes Estadísticos
-    Permite seleccionar tipo de reporte, muestra datos en tabla y exporta a PDF/Excel.
+    Permite seleccionar tipo de reporte y rango de fechas, muestra datos en
+    tabla y exporta a CSV/Excel. Los datos salen de los resúmenes diarios
+    (diagnostico/rollups.py), no de la tabla de diagnósticos.
     """
     if not request.user.is_superuser:
         messages.error(request, "No tienes permisos para acceder a los reportes.")
         return redirect("users:admin_dashboard")
 
     report_type = request.GET.get("report_type", "precision")
-    no_data = False
-    report_data = []
+    end = _report_date(request.GET.get("hasta"), timezone.localdate())
+    start = _report_date(request.GET.get("desde"), end - timedelta(days=REPORT_DEFAULT_DAYS - 1))
+    if start > end:
+        start, end = end, start
 
-    # Simulación de datos históricos
+    report_data = []
+    statuses = []
     if report_type == "precision":
-        report_data = [
-            {"fecha": "2025-12-09", "precision": 96.8},
-            {"fecha": "2025-12-10", "precision": 97.1},
-        ]
+        report_data = rollups.daily_precision(start, end)
     elif report_type == "diagnosticos":
-        report_data = [
-            {"fecha": "2025-12-09", "cantidad": 87},
-            {"fecha": "2025-12-10", "cantidad": 92},
-        ]
+        statuses = AIDiagnosis.STATUS_CHOICES
+        report_data = rollups.daily_status(start, end)
+        for row in report_data:
+            row["por_estado"] = [row["estados"].get(code, 0) for code, _ in statuses]
     elif report_type == "uso":
-        report_data = [
-            {"modulo": "Diagnóstico", "uso": 120},
-            {"modulo": "Imágenes", "uso": 98},
-            {"modulo": "Usuarios", "uso": 45},
-        ]
+        report_data = rollups.model_summary(start, end)
 
     # Alternativa: no hay datos
-    if not report_data:
-        no_data = True
+    no_data = not report_data
 
-    # Exportar a PDF/Excel (simulado)
+    # Exportar a CSV/Excel (PDF simulado)
     if request.method == "POST":
         export_type = request.POST.get("export")
         if export_type == "pdf":
             messages.success(request, "Reporte exportado a PDF (simulado).")
-        elif export_type == "excel":
-            messages.success(request, "Reporte exportado a Excel (simulado).")
+        elif export_type in ("csv", "excel") and not no_data:
+            header, rows = _report_table(report_type, report_data, statuses)
+            return exports.streaming_export(
+                "xlsx" if export_type == "excel" else "csv",
+                f"reporte_{report_type}_{start}_{end}",
+                header,
+                rows,
+                sheet_name="Reporte",
+            )
 
     context = {
         "report_type": report_type,
         "report_data": report_data,
+        "statuses": statuses,
+        "desde": start,
+        "hasta": end,
         "no_data": no_data,
     }
     return render(request, "users/reports.html", context)
@@ -121,41 +163,61 @@ def reports_view(request):
 # CU-023: MONITOREO DE ACTIVIDAD DEL SISTEMA
 # ================================
 from django.contrib.auth.decorators import login_required
+from . import activity_log
+
+
+def _export_activity(filters, export_format):
+    """Descarga los eventos filtrados leyéndolos por bloques del cursor"""
+    rows = (
+        (entry['timestamp'], entry['fuente'], entry['usuario'], entry['email'], entry['accion'],
+         entry['nivel'], entry['descripcion'], entry['ip_address'])
+        for entry in activity_log.iter_entries(filters, exports.get_chunk_size())
+    )
+    return exports.streaming_export(
+        export_format,
+        f'actividad_{timezone.localdate()}',
+        ['Fecha', 'Fuente', 'Usuario', 'Email', 'Acción', 'Nivel', 'Descripción', 'IP'],
+        rows,
+        sheet_name='Actividad',
+    )
+
 
 @login_required
 def monitoring_view(request):
     """
     Vista para mostrar logs de actividad y uso del sistema al administrador.
-    Permite filtrar por usuario, fecha y tipo de evento. Simula exportación.
+    Une los eventos de Log y DiagnosisLog; permite filtrar por usuario, rango
+    de fechas, tipo y acción, paginar por cursor y exportar a CSV o Excel.
     """
-    usuario = request.GET.get('usuario', '').strip()
-    fecha = request.GET.get('fecha', '').strip()
-    tipo = request.GET.get('tipo', '').strip()
-    export = request.GET.get('export', '')
-
-    # Simulación de logs
-    logs = [
-        {'usuario': 'admin', 'fecha': '10/12/2025 18:00', 'tipo': 'login', 'descripcion': 'Acceso al sistema'},
-        {'usuario': 'tecnico1', 'fecha': '10/12/2025 18:05', 'tipo': 'operacion', 'descripcion': 'Carga de imagen RX'},
-        {'usuario': 'admin', 'fecha': '10/12/2025 18:10', 'tipo': 'operacion', 'descripcion': 'Exportación de registros'},
-    ]
+    if request.user.rol != 'ADMINISTRADOR' and not request.user.is_superuser:
+        messages.error(request, 'No tienes permisos para consultar los registros de actividad.')
+        return redirect('users:user_dashboard')
 
+    filters = activity_log.ActivityFilters.from_request(request.GET)
+    export = request.GET.get('export', '')
+    if export:
+        return _export_activity(filters, 'xlsx' if export == 'xlsx' else 'csv')
 
-    # Filtrado básico
-    if usuario:
-        logs = [log for log in logs if usuario.lower() in log['usuario'].lower()]
-    if fecha:
-        logs = [log for log in logs if fecha in log['fecha']]
-    if tipo:
-        logs = [log for log in logs if tipo == log['tipo']]
+    cursor = activity_log.decode_cursor(request.GET.get('cursor'))
+    logs, next_cursor = activity_log.page(filters, cursor)
 
-    # Simulación de exportación
-    if export:
-        # Aquí se podría generar un archivo CSV real
-        messages.success(request, 'Registros exportados correctamente (simulado).')
+    # Los enlaces de página conservan los filtros
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+    next_url = None
+    if next_cursor:
+        params['cursor'] = next_cursor
+        next_url = f'?{params.urlencode()}'
+        params.pop('cursor')
 
     context = {
         'logs': logs,
+        'filters': filters,
+        'tipos': activity_log.TIPOS,
+        'acciones': activity_log.action_choices(),
+        'next_url': next_url,
+        'first_url': f'?{params.urlencode()}' if cursor else None,
     }
     return render(request, 'users/monitoring.html', context)
 from django.contrib.auth.decorators import login_required
@@ -192,18 +254,20 @@ from django.contrib import messages
 from django.db.models import Count, Q
 from django.http import JsonResponse
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.core.paginator import Paginator
 from datetime import timedelta, date
 from authentication.models import User, Session, Log
+from authentication import audit, hashing, network, outbox
 from django.utils.crypto import get_random_string
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
 from django.middleware.csrf import get_token
 from .models import Patient, Notification
+from .search import search_patients
+from . import dashboard_stats
 # ================================
 # CU-024: NOTIFICACIONES DE ESTADO DE IMÁGENES
 # ================================
@@ -264,13 +328,9 @@ def search_patient_view(request):
     search_query = request.GET.get('q', '').strip()
 
     if search_query:
-        # Búsqueda por nombre completo o por identificación (cédula)
-        results = Patient.objects.filter(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(identification__icontains=search_query),
-            is_active=True
-        ).order_by('last_name', 'first_name')
+        # Búsqueda por nombre completo o por identificación (cédula),
+        # sin distinguir tildes y ordenada por relevancia
+        results = search_patients(Patient.objects.filter(is_active=True), search_query)
 
         if not results.exists():
             messages.info(request, f'No se encontraron coincidencias para "{search_query}"')
@@ -340,12 +400,7 @@ def diagnosis_history_view(request):
 
     # Si no se obtuvo el paciente por id, ejecutar búsqueda por q
     if not patient and query:
-        patients = Patient.objects.filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(identification__icontains=query),
-            is_active=True
-        ).order_by('last_name', 'first_name')
+        patients = search_patients(Patient.objects.filter(is_active=True), query)
 
         if patients.count() == 1:
             patient = patients.first()
@@ -435,6 +490,8 @@ def request_diagnosis_ia_view(request):
             try:
                 diag_marker = f"[DIAG_SIM:patient_{selected_patient.id}]"
                 descripcion = f"{diag_marker} Comentario agregado por {request.user.get_full_name()}: {comment_text}"
+                # Los comentarios clínicos se escriben de inmediato (no por el
+                # escritor de auditoría): se muestran en esta misma respuesta
                 log = Log.objects.create(
                     user=request.user,
                     accion='USER_UPDATED',
@@ -467,7 +524,8 @@ def request_diagnosis_ia_view(request):
                 ],
                 model_version='SIMULADO',
             )
-            DiagnosisLog.objects.create(
+            audit.record(
+                DiagnosisLog,
                 diagnosis=diag,
                 action='COMPLETED',
                 performed_by=request.user,
@@ -538,7 +596,8 @@ def request_diagnosis_ia_view(request):
             finalized = True
             # Registrar log
             from diagnostico.models import DiagnosisLog
-            DiagnosisLog.objects.create(
+            audit.record(
+                DiagnosisLog,
                 diagnosis=diag,
                 action='COMPLETED',
                 performed_by=request.user,
@@ -662,7 +721,8 @@ def profile_edit_view(request):
             user.save()
             
             # Registrar cambios
-            Log.objects.create(
+            audit.record(
+                Log,
                 user=user,
                 accion='PROFILE_UPDATE',
                 descripcion=f'Usuario actualizó su perfil',
@@ -678,12 +738,7 @@ def profile_edit_view(request):
 
 def get_client_ip(request):
     """Obtiene la IP del cliente desde la solicitud"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    return network.get_client_ip(request)
 
 # ================================
 # DASHBOARD GENERAL
@@ -913,12 +968,7 @@ def admin_dashboard_view(request):
     
     context = {
         'user': user,
-        'total_usuarios': stats['total_usuarios'],
-        'total_medicos': stats['total_medicos'],
-        'total_tecnicos': stats['total_tecnicos'],
-        'total_diagnosticos': stats['total_diagnosticos'],
-        'total_imagenes': stats['total_imagenes'],
-        'precision_sistema': stats['precision_sistema'],
+        **stats,
         'recent_users': recent_users,
         'system_activities': system_activities,
     }
@@ -970,7 +1020,8 @@ def patient_create_view(request):
                 patient.save()
                 
                 # Registrar log
-                Log.objects.create(
+                audit.record(
+                    Log,
                     user=request.user,
                     accion='USER_CREATED',
                     nivel='INFO',
@@ -1057,7 +1108,7 @@ def user_create_view(request):
                 must_change_password=must_change,
             )
 
-            # Enviar email con contraseña temporal
+            # Encolar email con contraseña temporal
             try:
                 subject = 'Bienvenido al Sistema de Diagnóstico IA'
                 context = {
@@ -1069,13 +1120,12 @@ def user_create_view(request):
                 html_message = render_to_string('emails/welcome_email.html', context)
                 plain_message = strip_tags(html_message)
                 
-                send_mail(
+                outbox.queue_email(
                     subject=subject,
-                    message=plain_message,
+                    body=plain_message,
+                    to=[user.email],
+                    html_body=html_message,
                     from_email='noreply@diagnostico-ia.com',
-                    recipient_list=[user.email],
-                    html_message=html_message,
-                    fail_silently=False,
                 )
                 email_enviado = True
             except Exception as email_error:
@@ -1083,7 +1133,8 @@ def user_create_view(request):
                 print(f"Error al enviar email: {email_error}")
 
             # Registrar log
-            Log.objects.create(
+            audit.record(
+                Log,
                 user=request.user,
                 accion='USER_CREATED',
                 nivel='INFO',
@@ -1091,7 +1142,7 @@ def user_create_view(request):
             )
 
             if email_enviado:
-                messages.success(request, f'Usuario creado correctamente. Se envió un email con las credenciales a {user.email}')
+                messages.success(request, f'Usuario creado correctamente. Se enviará un email con las credenciales a {user.email}')
             else:
                 messages.warning(request, f'Usuario creado pero no se pudo enviar el email. Contraseña temporal: {temp_password}')
             
@@ -1136,12 +1187,13 @@ def change_password_view(request):
                 return render(request, 'users/change_password.html')
 
             try:
-                request.user.set_password(new_password)
+                hashing.set_password(request.user, new_password)
                 # Desactivar la bandera de cambio obligatorio
                 request.user.must_change_password = False
                 request.user.save()
 
-                Log.objects.create(
+                audit.record(
+                    Log,
                     user=request.user,
                     accion='PASSWORD_CHANGE',
                     nivel='INFO',
@@ -1174,12 +1226,12 @@ def change_password_view(request):
             return render(request, 'users/change_password.html')
 
         # Verificar contraseña actual
-        if not request.user.check_password(current_password):
+        if not hashing.check_password(request.user, current_password):
             messages.error(request, 'La contraseña actual es incorrecta.')
             return render(request, 'users/change_password.html')
 
         # Validar que la nueva contraseña sea diferente
-        if request.user.check_password(new_password):
+        if hashing.check_password(request.user, new_password):
             messages.error(request, 'La nueva contraseña debe ser diferente a la actual.')
             return render(request, 'users/change_password.html')
 
@@ -1190,11 +1242,12 @@ def change_password_view(request):
 
         try:
             # Cambiar contraseña
-            request.user.set_password(new_password)
+            hashing.set_password(request.user, new_password)
             request.user.save()
 
             # Registrar cambio en logs
-            Log.objects.create(
+            audit.record(
+                Log,
                 user=request.user,
                 accion='PASSWORD_CHANGE',
                 nivel='INFO',
@@ -1214,17 +1267,9 @@ def change_password_view(request):
 def get_admin_stats():
     """
     Obtiene estadísticas generales del sistema para el admin
+    (users/dashboard_stats.py: agregados condicionales con caché)
     """
-    stats = {
-        'total_usuarios': User.objects.filter(is_active=True).count(),
-        'total_medicos': User.objects.filter(rol='MEDICO_RADIOLOGO', is_active=True).count(),
-        'total_tecnicos': User.objects.filter(rol='TECNICO_SALUD', is_active=True).count(),
-        'total_diagnosticos': 0,  # TODO: Implementar cuando exista el modelo
-        'total_imagenes': 0,  # TODO: Implementar cuando exista el modelo
-        'precision_sistema': '96.8',  # Puede venir de un modelo de configuración
-    }
-    
-    return stats
+    return dashboard_stats.get_stats()
 
 def get_recent_users(limit=5):
     """
@@ -1236,49 +1281,9 @@ def get_recent_users(limit=5):
 
 def get_system_activities():
     """
-    Obtiene las actividades recientes del sistema
+    Obtiene las actividades recientes del sistema (Log y DiagnosisLog)
     """
-    # Datos de ejemplo - implementar con un modelo de logs real
-    activities = [
-        {
-            'icon': '👤',
-            'type': 'primary',
-            'title': 'Nuevo usuario registrado',
-            'description': 'Dr. María González - Médico Radiólogo',
-            'time': 'Hace 30 minutos',
-            'level': 'info',
-            'level_text': 'Info'
-        },
-        {
-            'icon': '📊',
-            'type': 'success',
-            'title': 'Sistema actualizado',
-            'description': 'Modelo de IA actualizado a versión 2.1',
-            'time': 'Hace 2 horas',
-            'level': 'success',
-            'level_text': 'Éxito'
-        },
-        {
-            'icon': '⚠️',
-            'type': 'warning',
-            'title': 'Mantenimiento programado',
-            'description': 'El sistema se actualizará el 25 de noviembre',
-            'time': 'Hace 1 día',
-            'level': 'warning',
-            'level_text': 'Advertencia'
-        },
-        {
-            'icon': '✅',
-            'type': 'info',
-            'title': 'Backup completado',
-            'description': 'Backup diario realizado exitosamente',
-            'time': 'Hace 1 día',
-            'level': 'success',
-            'level_text': 'Éxito'
-        }
-    ]
-    
-    return activities
+    return dashboard_stats.recent_activities()
 
 # ================================
 # CU-018: BÚSQUEDA DE PACIENTES
@@ -1308,12 +1313,7 @@ def search_patient_view(request):
         else:
             try:
                 # Buscar pacientes por nombre o documento
-                results = Patient.objects.filter(
-                    Q(first_name__icontains=search_query) |
-                    Q(last_name__icontains=search_query) |
-                    Q(identification__icontains=search_query),
-                    is_active=True
-                ).order_by('last_name', 'first_name')
+                results = search_patients(Patient.objects.filter(is_active=True), search_query)
                 
                 if not results.exists():
                     error_message = 'No se encontraron coincidencias'